@@ -1,21 +1,52 @@
-from flask import Flask, render_template, request, redirect, send_file, url_for, flash, abort
+from flask import Flask, Response, make_response, render_template, request, redirect, send_file, url_for, flash, abort, g, session, has_app_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as SesionBase
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from sqlalchemy import bindparam, case, event, inspect, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, declared_attr, joinedload, with_loader_criteria
 from sqlalchemy.exc import IntegrityError, OperationalError
-from datetime import datetime
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO, TextIOWrapper
+from itertools import groupby
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.utils import secure_filename
+from contextlib import contextmanager
 from functools import wraps
 from flask_migrate import Migrate
+import click
+import csv
+import hashlib
+import json
 import requests
+import threading
 import uuid
+from types import SimpleNamespace
 import os
+import time
+
+from archivo import archivar
+from cache import CacheVersionada
+from conciliacion import IndiceDeudas, leer_extracto, ErrorExtracto, REVISION_EXCEDE
+from cuotas import aplicar_recargos, plan_de_cuotas, repartir
+from facturas import PlantillaFactura
+from kpis import CAMPOS as CAMPOS_KPI, Difusor, evento_sse, sumar as sumar_kpis
+from outbox import ErrorDestino, crear_destino
+from pasarela import ClientePasarela, ErrorPasarela, FirmaInvalida, ESTADO_APROBADO, datos_transaccion
+from limitador import Limite, Limitador
+from migraciones_datos import ESTADO_COMPLETA, cargar as cargar_migraciones_datos, ejecutar as ejecutar_migracion_datos, leer_checkpoint
+from perfilador import Perfilador
+from replicas import EstadoReplica
+from respaldo import ErrorRespaldo, respaldar, restaurar, rotar
 
 # --- Configuración básica ---
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'devsecretkey')
+# detrás de N proxies (Render, nginx) la IP real del cliente viene en X-Forwarded-For
+if os.environ.get('PROXY_COUNT'):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ['PROXY_COUNT']))
 
 # Base de datos: Postgres en Render o SQLite en local
 db_url = os.environ.get('DATABASE_URL') or 'sqlite:///educativo.db'
@@ -23,9 +54,119 @@ db_url = db_url.replace("postgres://", "postgresql://")  # Fix heroku-like URLs
 app.config['SQLALCHEMY_DATABASE_URI'] = db_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
+# Réplica de lectura opcional (otro Postgres o, en local, otro archivo SQLite)
+replica_url = os.environ.get('REPLICA_DATABASE_URL')
+if replica_url:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': replica_url.replace("postgres://", "postgresql://")}
+# Sedes en bases separadas (opcional): SEDE_DATABASE_URLS="1=sqlite:///sede1.db 2=postgresql://..."
+# Las tablas por sede (PorSede) de cada sede van a su base; el resto queda en la principal.
+SEDES_SEPARADAS = {}
+for _par in os.environ.get('SEDE_DATABASE_URLS', '').split():
+    _sede, _url = _par.split('=', 1)
+    SEDES_SEPARADAS[int(_sede)] = f"sede_{int(_sede)}"
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[f"sede_{int(_sede)}"] = _url.replace("postgres://", "postgresql://")
+SEDE_POR_DEFECTO = int(os.environ.get('SEDE_POR_DEFECTO', 1))
+estado_replica = EstadoReplica(
+    retraso_maximo=float(os.environ.get('REPLICA_MAX_LAG', 5)),
+    intervalo=float(os.environ.get('REPLICA_CHECK_INTERVAL', 2)),
+)
+# tras escribir, el mismo usuario lee de la primaria durante este tiempo
+REPLICA_PEGAJOSO = float(os.environ.get('REPLICA_STICKY_SECONDS', estado_replica.retraso_maximo))
+
+
+def _usar_replica(sesion):
+    if not replica_url or not has_request_context() or not g.get('solo_lectura'):
+        return False
+    if sesion._flushing or g.get('escribio'):
+        return False
+    if time.time() - session.get('_escritura', 0) < REPLICA_PEGAJOSO:
+        return False
+    return estado_replica.disponible(db.engines['replica'])
+
+
+def _sede_actual():
+    """Sede del usuario del request (o la fijada con en_sede); None = todas."""
+    return g.get('sede_id') if has_app_context() else None
+
+
+def _motor_sede(mapper):
+    """Base propia de la sede actual, si las tablas por sede están separadas."""
+    if not SEDES_SEPARADAS or mapper is None:
+        return None
+    bind = SEDES_SEPARADAS.get(_sede_actual())
+    if bind is None or not issubclass(mapper.class_, PorSede):
+        return None
+    return db.engines[bind]
+
+
+class SesionEnrutada(SesionBase):
+    """Envía las tablas por sede a la base de su sede y las lecturas de vistas
+    marcadas con @solo_lectura a la réplica."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if kwargs.get('bind') is None:
+            motor = _motor_sede(mapper)
+            if motor is not None:
+                return motor
+            if _usar_replica(self):
+                return db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+db = SQLAlchemy(app, session_options={'class_': SesionEnrutada})
 migrate = Migrate(app, db)
 
+
+@event.listens_for(SesionEnrutada, 'after_flush')
+def _marcar_escritura(sesion, contexto):
+    if has_request_context():
+        g.escribio = True
+
+
+@app.after_request
+def _recordar_escritura(response):
+    if replica_url and g.get('escribio'):
+        session['_escritura'] = time.time()
+    return response
+
+
+def solo_lectura(f):
+    """Marca una vista como de solo lectura: sus consultas pueden ir a la réplica."""
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        g.solo_lectura = True
+        return f(*args, **kwargs)
+    return wrapped
+
+# --- Límite de solicitudes (ver limitador.py) ---
+RATELIMIT_ACTIVO = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+limitador = Limitador(os.environ.get('RATELIMIT_DB') or os.path.join(app.instance_path, 'limites.db'))
+
+def limitar(capacidad, por_minuto):
+    """Token bucket por IP para esta ruta; al agotarse responde 429 con Retry-After.
+
+    ``capacidad`` y ``por_minuto`` son los valores por defecto; RATELIMIT_<VISTA>="capacidad,por_minuto"
+    (p. ej. RATELIMIT_LOGIN="20,10") los cambia sin tocar el código.
+    """
+    def decorador(f):
+        variable = f"RATELIMIT_{f.__name__.upper()}"
+        try:
+            limite = Limite(*(float(v) for v in os.environ.get(variable, f"{capacidad},{por_minuto}").split(',')))
+        except (TypeError, ValueError):
+            raise RuntimeError(f'{variable} debe ser "capacidad,por_minuto"') from None
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            # el personal administrativo atiende desde una misma IP: no se limita
+            if RATELIMIT_ACTIVO and getattr(current_user, 'role', None) != 'admin':
+                permitido, espera = limitador.consumir(f"{request.endpoint}:{request.remote_addr}", limite)
+                if not permitido:
+                    respuesta = make_response(render_template('429.html', espera=espera), 429)
+                    respuesta.headers['Retry-After'] = str(espera)
+                    return respuesta
+            return f(*args, **kwargs)
+        return wrapped
+    return decorador
+
 # --- Login Manager ---#
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -35,12 +176,25 @@ login_manager.login_message_category = "warning"
 
 
 # --- Modelos ---
+class Sede(db.Model):
+    __tablename__ = 'sede'
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), unique=True, nullable=False)
+
+class PorSede:
+    """Tablas particionadas por sede: las consultas ORM se filtran por la sede del
+    usuario (ver _filtrar_por_sede) y las filas nuevas la heredan (ver _asignar_sede)."""
+    @declared_attr
+    def sede_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('sede.id'), nullable=False)
+
 class Usuario(UserMixin, db.Model):
     __tablename__ = 'usuario'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='estudiante')  # admin, docente, estudiante
+    sede_id = db.Column(db.Integer, db.ForeignKey('sede.id'))  # None = administrador de todas las sedes
 
     estudiante = db.relationship('Estudiante', uselist=False, backref='usuario')
     docente = db.relationship('Docente', uselist=False, backref='usuario')
@@ -62,8 +216,9 @@ def admin_required(f):
         return f(*args, **kwargs)
     return wrapped
 
-class Estudiante(db.Model):
+class Estudiante(PorSede, db.Model):
     __tablename__ = 'estudiante'
+    __table_args__ = (db.Index('ix_estudiante_sede_nombre', 'sede_id', 'nombre'),)
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     documento = db.Column(db.String(50), unique=True, nullable=False)
@@ -85,33 +240,80 @@ class Docente(db.Model):
     cursos = db.relationship('Curso', backref='docente', lazy=True)
 
 
-class Matricula(db.Model):
+class Matricula(PorSede, db.Model):
+    __table_args__ = (db.Index('ix_matricula_sede_fecha', 'sede_id', 'fecha'),)
     id = db.Column(db.Integer, primary_key=True)
-    estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id', name="fk_matricula_estudiante"), nullable=False)
-    curso_id = db.Column(db.Integer, db.ForeignKey('curso.id', name="fk_matricula_curso"), nullable=False)
+    estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id', name="fk_matricula_estudiante"), nullable=False, index=True)
+    curso_id = db.Column(db.Integer, db.ForeignKey('curso.id', name="fk_matricula_curso"), nullable=False, index=True)
     fecha = db.Column(db.DateTime, default=datetime.utcnow)
 
     estudiante = db.relationship('Estudiante', backref=db.backref('matriculas', lazy=True))
     
-class Pago(db.Model):
+class Pago(PorSede, db.Model):
+    # "último pago" de un estudiante = un solo salto en este índice
+    __table_args__ = (db.Index('ix_pago_estudiante_fecha', 'estudiante_id', 'fecha'),
+                      db.Index('ix_pago_sede_fecha', 'sede_id', 'fecha'))
     id = db.Column(db.Integer, primary_key=True)
     estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id'), nullable=True)
     deuda_id = db.Column(db.Integer, db.ForeignKey('deuda.id'), nullable=True)
     valor = db.Column(db.Float, nullable=False)
     metodo = db.Column(db.String(50), nullable=False)
     fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    referencia = db.Column(db.String(100), unique=True, index=True)  # id externo (banco, pasarela) para no duplicar
     estudiante = db.relationship('Estudiante', backref=db.backref('pagos', lazy=True))
     deuda = db.relationship('Deuda', backref=db.backref('pagos', lazy=True))
 
-class Deuda(db.Model):
+class Deuda(PorSede, db.Model):
     __tablename__ = 'deuda'
+    __table_args__ = (db.Index('ix_deuda_sede_id', 'sede_id', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
-    estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id'), nullable=False)
+    estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id'), nullable=False, index=True)
     concepto = db.Column(db.String(100), nullable=False)
     monto_total = db.Column(db.Float, nullable=False)
     saldo_pendiente = db.Column(db.Float, nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)  # NULL en deudas anteriores a la columna (ver migrations/datos)
     estudiante = db.relationship('Estudiante', backref=db.backref('deudas', lazy=True))
 
+# --- Cuotas y recargos por mora (ver cuotas.py) ---
+class Cuota(PorSede, db.Model):
+    """Cuota de una deuda; ``saldo`` incluye los recargos por mora aplicados."""
+    __tablename__ = 'cuota'
+    __table_args__ = (
+        db.UniqueConstraint('deuda_id', 'numero', name='uq_cuota_deuda_numero'),
+        # solo cuotas abiertas: el proceso de mora recorre las vencidas sin tocar las pagadas
+        db.Index('ix_cuota_vencimiento_abierta', 'vencimiento', 'id',
+                 sqlite_where=db.text('saldo > 0'), postgresql_where=db.text('saldo > 0')),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    deuda_id = db.Column(db.Integer, db.ForeignKey('deuda.id'), nullable=False)
+    numero = db.Column(db.Integer, nullable=False)
+    vencimiento = db.Column(db.Date, nullable=False)
+    monto = db.Column(db.Float, nullable=False)
+    saldo = db.Column(db.Float, nullable=False)
+    recargo = db.Column(db.Float, nullable=False, default=0.0)
+    ultimo_recargo = db.Column(db.Date)
+    deuda = db.relationship('Deuda', backref=db.backref('cuotas', lazy=True, order_by='Cuota.numero'))
+
+def crear_cuotas(deuda, numero, primer_vencimiento):
+    """Divide el saldo pendiente de la deuda en ``numero`` cuotas mensuales. No hace commit."""
+    for n, vencimiento, valor in plan_de_cuotas(deuda.saldo_pendiente, numero, primer_vencimiento):
+        db.session.add(Cuota(deuda=deuda, numero=n, vencimiento=vencimiento, monto=valor, saldo=valor,
+                             sede_id=deuda.sede_id))
+
+def cuotas_abiertas(deuda_ids):
+    """Cuotas con saldo de esas deudas, por deuda y de la más antigua a la más nueva."""
+    return (Cuota.query.filter(Cuota.deuda_id.in_(deuda_ids), Cuota.saldo > 0)
+            .order_by(Cuota.deuda_id, Cuota.vencimiento, Cuota.numero).all())
+
+def descontar_de_cuotas(cuotas, valor):
+    for cuota, aplicado in zip(cuotas, repartir([c.saldo for c in cuotas], valor)):
+        cuota.saldo = round(cuota.saldo - aplicado, 2)
+
+def descontar_pago(deuda, valor):
+    """Descuenta ``valor`` del saldo de la deuda y de sus cuotas, de la más antigua a la más nueva."""
+    deuda.saldo_pendiente = round(max(0.0, deuda.saldo_pendiente - valor), 2)
+    descontar_de_cuotas(cuotas_abiertas([deuda.id]), valor)
+
 class Configuracion(db.Model):
     __tablename__ = 'configuracion'
     id = db.Column(db.Integer, primary_key=True)
@@ -145,8 +347,9 @@ class Configuracion(db.Model):
             db.session.rollback()
             raise
 
-class Curso(db.Model):
+class Curso(PorSede, db.Model):
     __tablename__ = 'curso'
+    __table_args__ = (db.Index('ix_curso_sede_nombre', 'sede_id', 'nombre'),)
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     descripcion = db.Column(db.Text)
@@ -155,14 +358,527 @@ class Curso(db.Model):
     # Relación con Docente
     docente_id = db.Column(db.Integer, db.ForeignKey('docente.id'))
 
+    # Cupo: None = sin límite. ``ocupados`` solo se modifica con UPDATE condicional (ver ocupar_cupo)
+    cupo = db.Column(db.Integer)
+    ocupados = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # Relación con matrícula
     matriculas = db.relationship('Matricula', backref='curso', lazy=True)
 
+class ListaEspera(PorSede, db.Model):
+    """Estudiantes esperando cupo; el orden de llegada es el orden del id."""
+    __tablename__ = 'lista_espera'
+    __table_args__ = (db.UniqueConstraint('curso_id', 'estudiante_id', name='uq_lista_espera_curso_estudiante'),)
+    id = db.Column(db.Integer, primary_key=True)
+    curso_id = db.Column(db.Integer, db.ForeignKey('curso.id'), nullable=False, index=True)
+    estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id'), nullable=False)
+    con_deuda = db.Column(db.Boolean, nullable=False, default=False)  # al promover, crear la deuda del curso
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    estudiante = db.relationship('Estudiante')
+    curso = db.relationship('Curso')
+
+# --- Migraciones de datos por lotes (ver migraciones_datos.py) ---
+class CheckpointMigracion(db.Model):
+    """Avance de cada migración de datos; se actualiza en la misma transacción que cada lote."""
+    __tablename__ = 'migracion_datos'
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), unique=True, nullable=False)
+    ultimo_id = db.Column(db.Integer, nullable=False, default=0)
+    filas = db.Column(db.Integer, nullable=False, default=0)
+    estado = db.Column(db.String(20), nullable=False)
+    iniciada = db.Column(db.DateTime, nullable=False)
+    actualizada = db.Column(db.DateTime, nullable=False)
+    terminada = db.Column(db.DateTime)
+
+# --- Archivo histórico (deudas saldadas y pagos antiguos, ver archivo.py) ---
+class DeudaArchivo(PorSede, db.Model):
+    __tablename__ = 'deuda_archivo'
+    __table_args__ = (db.Index('ix_deuda_archivo_sede_id', 'sede_id', 'id'),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id'), nullable=False, index=True)
+    concepto = db.Column(db.String(100), nullable=False)
+    monto_total = db.Column(db.Float, nullable=False)
+    saldo_pendiente = db.Column(db.Float, nullable=False)
+    fecha = db.Column(db.DateTime)
+    archivado_en = db.Column(db.DateTime, nullable=False)
+    estudiante = db.relationship('Estudiante')
+
+class PagoArchivo(PorSede, db.Model):
+    __tablename__ = 'pago_archivo'
+    __table_args__ = (db.Index('ix_pago_archivo_sede_fecha', 'sede_id', 'fecha'),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    estudiante_id = db.Column(db.Integer, db.ForeignKey('estudiante.id'), nullable=True, index=True)
+    deuda_id = db.Column(db.Integer, index=True)  # sin FK: la deuda puede estar en deuda o en deuda_archivo
+    valor = db.Column(db.Float, nullable=False)
+    metodo = db.Column(db.String(50), nullable=False)
+    fecha = db.Column(db.DateTime, index=True)
+    referencia = db.Column(db.String(100), index=True)
+    archivado_en = db.Column(db.DateTime, nullable=False)
+    estudiante = db.relationship('Estudiante')
+
+class CuotaArchivo(PorSede, db.Model):
+    __tablename__ = 'cuota_archivo'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    deuda_id = db.Column(db.Integer, nullable=False, index=True)  # en deuda_archivo
+    numero = db.Column(db.Integer, nullable=False)
+    vencimiento = db.Column(db.Date, nullable=False)
+    monto = db.Column(db.Float, nullable=False)
+    saldo = db.Column(db.Float, nullable=False)
+    recargo = db.Column(db.Float, nullable=False)
+    ultimo_recargo = db.Column(db.Date)
+    archivado_en = db.Column(db.DateTime, nullable=False)
+
+# --- Sedes: filtro automático y sede por defecto ---
+@event.listens_for(SesionEnrutada, 'do_orm_execute')
+def _filtrar_por_sede(estado):
+    """Agrega ``sede_id = <sede del usuario>`` a toda consulta, UPDATE o DELETE ORM sobre tablas PorSede.
+
+    Sin usuario con sede (procesos CLI fuera de en_sede, páginas públicas,
+    administrador general) no se filtra. ``execution_options(todas_las_sedes=True)`` lo desactiva.
+    """
+    if not (estado.is_select or estado.is_update or estado.is_delete):
+        return
+    if estado.is_column_load or estado.is_relationship_load or estado.execution_options.get('todas_las_sedes'):
+        return
+    sede_id = _sede_actual()
+    if sede_id is None:
+        return
+    estado.statement = estado.statement.options(
+        with_loader_criteria(PorSede, lambda cls: cls.sede_id == sede_id, include_aliases=True))
+
+# de dónde hereda la sede una fila nueva, en orden de preferencia
+_ORIGEN_SEDE = (('curso_id', Curso), ('deuda_id', Deuda), ('estudiante_id', Estudiante))
+
+@event.listens_for(SesionEnrutada, 'before_flush')
+def _asignar_sede(sesion, contexto, instancias):
+    for obj in sesion.new:
+        if not isinstance(obj, PorSede) or obj.sede_id is not None:
+            continue
+        for atributo, modelo in _ORIGEN_SEDE:
+            padre_id = getattr(obj, atributo, None)
+            if padre_id is not None:
+                padre = sesion.get(modelo, padre_id, execution_options={'todas_las_sedes': True})
+                if padre is not None:
+                    obj.sede_id = padre.sede_id
+                    break
+        if obj.sede_id is None:
+            obj.sede_id = _sede_actual() or SEDE_POR_DEFECTO
+
+@app.before_request
+def _fijar_sede():
+    if current_user.is_authenticated:
+        # el administrador general (sin sede) puede elegir una desde el panel
+        g.sede_id = current_user.sede_id or session.get('sede_activa')
+        if g.sede_id is None and SEDES_SEPARADAS and current_user.role == 'estudiante':
+            # un estudiante sin sede asignada va a la base donde está su ficha
+            if 'sede_estudiante' not in session:
+                session['sede_estudiante'] = _sede_de_estudiante(current_user.id)
+            g.sede_id = session['sede_estudiante']
+
+def _sede_de_estudiante(usuario_id):
+    """Sede de la ficha del estudiante de un usuario, buscándola en cada base."""
+    for sede_id in sedes_por_base():
+        with en_sede(sede_id):
+            estudiante = Estudiante.query.filter_by(usuario_id=usuario_id).first()
+            encontrada = estudiante.sede_id if estudiante is not None else None
+            soltar_filas_por_sede(db.session)
+        if encontrada is not None:
+            return encontrada
+    return None
+
+def motores_por_sede():
+    """``[(nombre, motor)]``: la base principal y las bases separadas por sede, si las hay."""
+    return [('principal', db.engine)] + [(f"sede {sede_id}", db.engines[bind])
+                                         for sede_id, bind in sorted(SEDES_SEPARADAS.items())]
+
+def sedes_por_base():
+    """Una sede por base para usar con en_sede: None (la principal) y cada sede con base propia."""
+    return [None] + sorted(SEDES_SEPARADAS)
+
+@contextmanager
+def en_sede(sede_id):
+    """Fuera de un request (workers, comandos), filtra y enruta como un usuario de esa sede."""
+    anterior = g.get('sede_id')
+    g.sede_id = sede_id
+    try:
+        yield
+    finally:
+        g.sede_id = anterior
+
+def soltar_filas_por_sede(sesion):
+    """Guarda y saca de la sesión las filas por sede antes de pasar a otra base.
+
+    El mapa de identidad usa solo la llave primaria: el id 1 de la principal y
+    el id 1 de una base separada serían el mismo objeto.
+    """
+    sesion.flush()
+    for obj in [o for o in sesion.identity_map.values() if isinstance(o, PorSede)]:
+        sesion.expunge(obj)
+
+# --- Indicadores en vivo del panel de administración (ver kpis.py) ---
+class KpiDiario(PorSede, db.Model):
+    """Contadores por sede y día; se actualizan en el mismo commit que cada pago, matrícula o deuda."""
+    __tablename__ = 'kpi_diario'
+    __table_args__ = (db.UniqueConstraint('sede_id', 'dia', name='uq_kpi_diario_sede_dia'),)
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False)
+    pagos = db.Column(db.Integer, nullable=False, default=0)
+    recaudado = db.Column(db.Float, nullable=False, default=0.0)
+    matriculas = db.Column(db.Integer, nullable=False, default=0)
+    saldo = db.Column(db.Float, nullable=False, default=0.0)  # variación del saldo abierto en el día
+
+def contar_kpis(sesion, sede_id, **deltas):
+    """Acumula cambios de los contadores de hoy; se escriben al hacer commit.
+
+    Los cambios hechos con el ORM se cuentan solos; solo hay que llamarla
+    al insertar o actualizar pagos, matrículas o deudas con SQL directo.
+    """
+    fila = sesion.info.setdefault('kpis', {}).setdefault((sede_id, datetime.utcnow().date()), {})
+    for campo, valor in deltas.items():
+        fila[campo] = fila.get(campo, 0) + valor
+
+@event.listens_for(SesionEnrutada, 'before_flush')
+def _acumular_kpis(sesion, contexto, instancias):
+    # registrado después de _asignar_sede: las filas nuevas ya tienen sede
+    for obj in sesion.new:
+        if isinstance(obj, Pago):
+            contar_kpis(sesion, obj.sede_id, pagos=1, recaudado=obj.valor)
+        elif isinstance(obj, Matricula):
+            contar_kpis(sesion, obj.sede_id, matriculas=1)
+        elif isinstance(obj, Deuda):
+            contar_kpis(sesion, obj.sede_id, saldo=obj.saldo_pendiente)
+    for obj in sesion.dirty:
+        if isinstance(obj, Deuda):
+            historia = inspect(obj).attrs.saldo_pendiente.history
+            if historia.deleted and historia.added:
+                contar_kpis(sesion, obj.sede_id, saldo=historia.added[0] - historia.deleted[0])
+    for obj in sesion.deleted:
+        if isinstance(obj, Deuda):
+            historia = inspect(obj).attrs.saldo_pendiente.history
+            contar_kpis(sesion, obj.sede_id, saldo=-(historia.deleted or historia.unchanged or [0])[0])
+
+@event.listens_for(SesionEnrutada, 'before_commit')
+def _guardar_kpis(sesion):
+    sesion.flush()
+    pendientes = sesion.info.pop('kpis', None)
+    if not pendientes:
+        return
+    # cada sede a su base: un worker puede aplicar cambios de varias sedes en un mismo commit
+    por_base = {}
+    for (sede_id, dia), deltas in pendientes.items():
+        por_base.setdefault(SEDES_SEPARADAS.get(sede_id), {})[(sede_id, dia)] = deltas
+    for bind, filas in sorted(por_base.items(), key=lambda b: b[0] or ''):
+        motor = db.engines[bind] if bind else db.engine
+        sumar_kpis_en(sesion.connection(bind_arguments={'bind': motor}), filas)
+
+def sumar_kpis_en(conexion, pendientes):
+    """Suma ``{(sede_id, dia): {campo: delta}}`` a los contadores, en la transacción de ``conexion``."""
+    tabla = KpiDiario.__table__
+    insertar = (postgresql.insert if conexion.dialect.name == 'postgresql' else sqlite.insert)(tabla)
+    # un solo UPSERT atómico por fila; en orden fijo para que dos commits no se bloqueen en cruz
+    conexion.execute(
+        insertar.on_conflict_do_update(
+            index_elements=['sede_id', 'dia'],
+            set_={campo: tabla.c[campo] + insertar.excluded[campo] for campo in CAMPOS_KPI}),
+        [{'sede_id': sede_id, 'dia': dia, **sumar_kpis(deltas, {})}
+         for (sede_id, dia), deltas in sorted(pendientes.items())])
+
+@event.listens_for(SesionEnrutada, 'after_rollback')
+def _descartar_kpis(sesion):
+    sesion.info.pop('kpis', None)
+
+def leer_kpis():
+    """Indicadores de hoy y saldo abierto por sede; la clave None es el total de todas."""
+    tabla = KpiDiario.__table__
+    hoy = datetime.utcnow().date()
+    de_hoy = lambda columna: db.func.coalesce(db.func.sum(case((tabla.c.dia == hoy, columna), else_=0)), 0)
+    consulta = (db.select(tabla.c.sede_id, de_hoy(tabla.c.pagos).label('pagos'),
+                          de_hoy(tabla.c.recaudado).label('recaudado'),
+                          de_hoy(tabla.c.matriculas).label('matriculas'),
+                          db.func.sum(tabla.c.saldo).label('saldo'))
+                .group_by(tabla.c.sede_id))
+    por_sede = {}
+    with app.app_context():
+        for _, motor in motores_por_sede():
+            with motor.connect() as conexion:
+                for fila in conexion.execute(consulta).mappings():
+                    por_sede[fila['sede_id']] = sumar_kpis(por_sede.get(fila['sede_id'], {}), fila)
+    total = {}
+    for valores in por_sede.values():
+        total = sumar_kpis(total, valores)
+    por_sede[None] = sumar_kpis(total, {})
+    # redondeados: el difusor solo avisa cuando algo cambia de verdad
+    return {sede: {campo: round(valor, 2) for campo, valor in valores.items()} for sede, valores in por_sede.items()}
+
+difusor_kpis = Difusor(leer_kpis, intervalo=float(os.environ.get('KPI_INTERVAL', 2)))
+KPI_SSE_SEGUNDOS = int(os.environ.get('KPI_SSE_SECONDS', 300))
+KPI_CONSULTA_SEGUNDOS = float(os.environ.get('KPI_POLL_SECONDS', 5))
+
+def servidor_con_greenlets():
+    """True si gevent parchó los sockets (gunicorn -k gevent): una conexión abierta no ocupa un hilo."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+def ultimo_pago(estudiante_id, incluir_archivo=False):
+    """Último pago del estudiante (ORDER BY ... LIMIT 1, sin cargar la colección)."""
+    pago = Pago.query.filter_by(estudiante_id=estudiante_id).order_by(Pago.fecha.desc(), Pago.id.desc()).first()
+    if pago is None and incluir_archivo:
+        pago = (PagoArchivo.query.filter_by(estudiante_id=estudiante_id)
+                .order_by(PagoArchivo.fecha.desc(), PagoArchivo.id.desc()).first())
+    return pago
+
+class ConciliacionPendiente(PorSede, db.Model):
+    """Movimiento de extracto bancario que no se pudo asociar a una deuda."""
+    __tablename__ = 'conciliacion_pendiente'
+    id = db.Column(db.Integer, primary_key=True)
+    huella = db.Column(db.String(100), unique=True, nullable=False)
+    fecha_carga = db.Column(db.DateTime, default=datetime.utcnow)
+    fecha_movimiento = db.Column(db.String(30))
+    referencia = db.Column(db.String(100))
+    documento = db.Column(db.String(50), index=True)
+    valor = db.Column(db.Float)
+    descripcion = db.Column(db.String(255))
+    motivo = db.Column(db.String(100), nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente', index=True)  # pendiente, aplicado, descartado
+
+# --- Pagos en línea (ver pasarela.py) ---
+class IntencionPago(PorSede, db.Model):
+    __tablename__ = 'intencion_pago'
+    id = db.Column(db.Integer, primary_key=True)
+    referencia = db.Column(db.String(64), unique=True, nullable=False)
+    enlace_id = db.Column(db.String(64), index=True)
+    deuda_id = db.Column(db.Integer, db.ForeignKey('deuda.id'), nullable=False)
+    valor = db.Column(db.Float, nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='creada')  # creada, aprobada, rechazada
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+    deuda = db.relationship('Deuda')
+
+class IntencionPagoArchivo(PorSede, db.Model):
+    """Intenciones de pago de deudas archivadas (ver archivo.py)."""
+    __tablename__ = 'intencion_pago_archivo'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    referencia = db.Column(db.String(64), unique=True, nullable=False)
+    enlace_id = db.Column(db.String(64))
+    deuda_id = db.Column(db.Integer, nullable=False, index=True)  # en deuda_archivo
+    valor = db.Column(db.Float, nullable=False)
+    estado = db.Column(db.String(20), nullable=False)
+    fecha = db.Column(db.DateTime)
+    archivado_en = db.Column(db.DateTime, nullable=False)
+
+class EventoPasarela(db.Model):
+    """Webhook recibido: se guarda al llegar y un worker lo aplica después."""
+    __tablename__ = 'evento_pasarela'
+    id = db.Column(db.Integer, primary_key=True)
+    clave = db.Column(db.String(100), unique=True, nullable=False)  # transacción + estado, para ignorar reenvíos
+    payload = db.Column(db.Text, nullable=False)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente', index=True)  # pendiente, aplicado, ignorado, revision, error
+    error = db.Column(db.String(255))
+    recibido = db.Column(db.DateTime, default=datetime.utcnow)
+    procesado = db.Column(db.DateTime)
+
+# --- Outbox transaccional (ver outbox.py) ---
+class EventoSalida(PorSede, db.Model):
+    __tablename__ = 'evento_salida'
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    despachado = db.Column(db.DateTime, index=True)
+    posicion = db.Column(db.BigInteger, unique=True)  # orden de confirmación, ver numerar_eventos
+
+    def como_dict(self):
+        return {'id': self.id, 'position': self.posicion, 'type': self.tipo, 'created_at': self.fecha.isoformat(),
+                'data': json.loads(self.payload)}
+
+def _iso(fecha):
+    return fecha.isoformat() if fecha else None
+
+def datos_pago(pago):
+    return {'id': pago.id, 'sede_id': pago.sede_id, 'estudiante_id': pago.estudiante_id, 'deuda_id': pago.deuda_id,
+            'valor': pago.valor, 'metodo': pago.metodo, 'fecha': _iso(pago.fecha), 'referencia': pago.referencia}
+
+def datos_deuda(deuda):
+    return {'id': deuda.id, 'sede_id': deuda.sede_id, 'estudiante_id': deuda.estudiante_id, 'concepto': deuda.concepto,
+            'monto_total': deuda.monto_total, 'saldo_pendiente': deuda.saldo_pendiente}
+
+def datos_matricula(matricula):
+    return {'id': matricula.id, 'sede_id': matricula.sede_id, 'estudiante_id': matricula.estudiante_id,
+            'curso_id': matricula.curso_id,
+            'fecha': _iso(matricula.fecha)}
+
+def registrar_evento(tipo, datos):
+    """Agrega el evento a la sesión actual: se guarda en el mismo commit (y la misma base) que el cambio."""
+    db.session.add(EventoSalida(tipo=tipo, payload=json.dumps(datos, default=str), sede_id=datos.get('sede_id')))
+
+def registrar_eventos(tipo, lista):
+    """Como registrar_evento, para muchos cambios en un solo INSERT."""
+    if lista:
+        db.session.execute(db.insert(EventoSalida),
+                           [{'tipo': tipo, 'payload': json.dumps(datos, default=str),
+                             'sede_id': datos.get('sede_id') or _sede_actual() or SEDE_POR_DEFECTO}
+                            for datos in lista])
+
+# --- Cupos y lista de espera ---
+def ocupar_cupo(curso_id):
+    """Toma un cupo con un solo UPDATE condicional; False si el curso está lleno.
+
+    La fila del curso queda bloqueada hasta el commit, así que dos solicitudes
+    concurrentes nunca pueden tomar el mismo último cupo.
+    """
+    resultado = db.session.execute(
+        db.update(Curso)
+        .where(Curso.id == curso_id, or_(Curso.cupo.is_(None), Curso.ocupados < Curso.cupo))
+        .values(ocupados=Curso.ocupados + 1)
+        .execution_options(synchronize_session=False))
+    return resultado.rowcount == 1
+
+def ocupar_cupos(curso_id, cantidad):
+    """Toma hasta ``cantidad`` cupos a la vez; devuelve cuántos tomó (0 si el curso está lleno).
+
+    El UPDATE solo se aplica si ``ocupados`` no cambió desde la lectura; si
+    otra solicitud tomó cupos en el medio, se vuelve a calcular.
+    """
+    while True:
+        cupo, ocupados = db.session.execute(
+            db.select(Curso.cupo, Curso.ocupados).where(Curso.id == curso_id).with_for_update()).one()
+        tomados = cantidad if cupo is None else max(0, min(cantidad, cupo - ocupados))
+        if tomados == 0:
+            return 0
+        resultado = db.session.execute(
+            db.update(Curso)
+            .where(Curso.id == curso_id, Curso.ocupados == ocupados)
+            .values(ocupados=Curso.ocupados + tomados)
+            .execution_options(synchronize_session=False))
+        if resultado.rowcount == 1:
+            return tomados
+
+def liberar_cupo(curso_id):
+    db.session.execute(
+        db.update(Curso)
+        .where(Curso.id == curso_id, Curso.ocupados > 0)
+        .values(ocupados=Curso.ocupados - 1)
+        .execution_options(synchronize_session=False))
+
+def _crear_matricula(estudiante_id, curso, con_deuda):
+    matricula = Matricula(estudiante_id=estudiante_id, curso_id=curso.id)
+    db.session.add(matricula)
+    deuda = None
+    if con_deuda:
+        deuda = Deuda(estudiante_id=estudiante_id, concepto=f"Matrícula curso {curso.nombre}",
+                      monto_total=curso.precio, saldo_pendiente=curso.precio)
+        db.session.add(deuda)
+    db.session.flush()
+    registrar_evento('matricula.creada', datos_matricula(matricula))
+    if deuda is not None:
+        registrar_evento('deuda.creada', datos_deuda(deuda))
+    return matricula
+
+def matricular(estudiante, curso, con_deuda=False):
+    """Matricula si hay cupo; si no, agrega al final de la lista de espera.
+
+    Devuelve ``(matricula, None)`` o ``(None, posicion_en_espera)``. No hace commit.
+    """
+    if ocupar_cupo(curso.id):
+        return _crear_matricula(estudiante.id, curso, con_deuda), None
+
+    espera = ListaEspera.query.filter_by(curso_id=curso.id, estudiante_id=estudiante.id).first()
+    if espera is None:
+        espera = ListaEspera(curso_id=curso.id, estudiante_id=estudiante.id, con_deuda=con_deuda)
+        db.session.add(espera)
+        db.session.flush()
+    posicion = ListaEspera.query.filter(ListaEspera.curso_id == curso.id, ListaEspera.id <= espera.id).count()
+    return None, posicion
+
+def promover_lista_espera(curso):
+    """Pasa estudiantes de la lista de espera a matrícula mientras haya cupo (FIFO)."""
+    promovidos = []
+    while ocupar_cupo(curso.id):
+        primero = ListaEspera.query.filter_by(curso_id=curso.id).order_by(ListaEspera.id).first()
+        if primero is None:
+            liberar_cupo(curso.id)
+            break
+        # borrado condicional: si otro proceso ya la tomó, se intenta con la siguiente
+        tomada = db.session.execute(
+            db.delete(ListaEspera).where(ListaEspera.id == primero.id)
+            .execution_options(synchronize_session=False)).rowcount == 1
+        if not tomada:
+            liberar_cupo(curso.id)
+            continue
+        promovidos.append(_crear_matricula(primero.estudiante_id, curso, primero.con_deuda))
+    return promovidos
+
+def cancelar_matricula(matricula):
+    """Elimina la matrícula, libera su cupo y promueve a la lista de espera. No hace commit."""
+    curso = matricula.curso
+    registrar_evento('matricula.cancelada', datos_matricula(matricula))
+    db.session.delete(matricula)
+    db.session.flush()
+    liberar_cupo(curso.id)
+    return promover_lista_espera(curso)
+
+# --- Plantilla de factura ---
+CLAVES_INSTITUCION = ('institucion_nombre', 'institucion_nit', 'institucion_direccion', 'institucion_telefono')
+# (clave, plantilla) en una sola tupla: se reemplaza de una vez, sin estados intermedios entre hilos
+_plantilla_cache = (None, None)
+
+def plantilla_factura():
+    """Devuelve la plantilla de factura, reconstruyéndola solo si cambió la configuración."""
+    global _plantilla_cache
+    try:
+        valores = dict(db.session.query(Configuracion.clave, Configuracion.valor)
+                       .filter(Configuracion.clave.in_(CLAVES_INSTITUCION)).all())
+    except Exception:
+        db.session.rollback()
+        valores = {}
+    logo = os.environ.get('FACTURA_LOGO') or os.path.join(app.static_folder, 'logo.png')
+    if not os.path.exists(logo):
+        logo = None
+
+    clave = (tuple(valores.get(k) for k in CLAVES_INSTITUCION), logo)
+    clave_actual, plantilla = _plantilla_cache
+    if clave_actual != clave:
+        institucion = {k.replace('institucion_', ''): valores.get(k) for k in CLAVES_INSTITUCION}
+        plantilla = PlantillaFactura(institucion=institucion, logo=logo)
+        _plantilla_cache = (clave, plantilla)
+    return plantilla
+
 # --- Context Processor ---
 @app.context_processor
 def inject_now():
     return {'current_year': datetime.utcnow().year, 'current_user': current_user}
 
+# --- Perfilado bajo demanda (solo admin, con X-Perfilar: 1 o ?perfilar=1) ---
+perfilador = Perfilador(os.path.join(app.instance_path, 'perfiles'),
+                        maximo=int(os.environ.get('PERFILES_MAXIMO', 50)))
+
+@app.before_request
+def _iniciar_perfil():
+    if request.headers.get('X-Perfilar') != '1' and request.args.get('perfilar') != '1':
+        return
+    if getattr(current_user, 'role', None) != 'admin':
+        return
+    g.perfil = perfilador.iniciar()
+
+@app.after_request
+def _guardar_perfil(response):
+    sesion = g.pop('perfil', None)
+    if sesion is not None:
+        duracion = perfilador.detener(sesion)
+        nombre = perfilador.guardar(sesion, duracion, request.method, request.path, response.status_code)
+        response.headers['X-Perfil'] = nombre
+    return response
+
+@app.teardown_request
+def _cerrar_perfil(exc):
+    # el request terminó con una excepción antes de after_request
+    sesion = g.pop('perfil', None)
+    if sesion is not None:
+        duracion = perfilador.detener(sesion)
+        perfilador.guardar(sesion, duracion, request.method, request.path, 500)
+
 # ------------------- RUTAS -------------------
 
 @app.route('/')
@@ -171,6 +887,7 @@ def index():
 
 # --- Login ---
 @app.route('/login', methods=['GET','POST'])
+@limitar(capacidad=10, por_minuto=5)
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -179,6 +896,7 @@ def login():
         user = Usuario.query.filter_by(username=username).first()
         if user and check_password_hash(user.password, password):
             login_user(user)
+            session.pop('sede_estudiante', None)
             flash("Bienvenido/a", "success")
 
             # Redirección por rol
@@ -202,6 +920,7 @@ def logout():
 
 # --- Enrollment ---
 @app.route('/enrollment', methods=['GET','POST'])
+@limitar(capacidad=10, por_minuto=4)
 def enrollment():
     # protegemos read con try/except en caso de migraciones incompletas
     try:
@@ -234,7 +953,7 @@ def enrollment():
         estudiante = Estudiante.query.filter_by(documento=documento).first()
         if not estudiante:
             try:
-                estudiante = Estudiante(nombre=nombre, documento=documento, telefono=telefono)
+                estudiante = Estudiante(nombre=nombre, documento=documento, telefono=telefono, sede_id=curso.sede_id)
                 db.session.add(estudiante)
                 db.session.commit()
             except IntegrityError:
@@ -242,17 +961,24 @@ def enrollment():
                 flash('El documento ya existe en el sistema','danger')
                 return redirect(url_for('enrollment'))
 
-        matricula = Matricula(estudiante_id=estudiante.id, curso_id=curso.id)
-        db.session.add(matricula)
+        if Matricula.query.filter_by(estudiante_id=estudiante.id, curso_id=curso.id).first():
+            flash('Ya estás matriculado en este curso', 'warning')
+            return redirect(url_for('enrollment'))
+
+        matricula, posicion = matricular(estudiante, curso)
         db.session.commit()
 
-        flash('Matrícula registrada correctamente','success')
+        if matricula is None:
+            flash(f'El curso {curso.nombre} no tiene cupos disponibles. Quedaste en lista de espera (posición {posicion}).', 'warning')
+        else:
+            flash('Matrícula registrada correctamente','success')
         return redirect(url_for('index'))
 
     return render_template('enrollment.html', cursos=cursos)
 
 # --- Payment / búsqueda de estudiante y deudas ---
 @app.route('/payment', methods=['GET','POST'])
+@limitar(capacidad=20, por_minuto=10)
 def payment():
     estudiante = None
     deudas = []
@@ -271,6 +997,7 @@ def payment():
     return render_template('payment.html', estudiante=estudiante, deudas=deudas)
 
 @app.route('/registrar_pago/<int:deuda_id>', methods=['POST'])
+@limitar(capacidad=10, por_minuto=6)
 def registrar_pago(deuda_id):
     deuda = Deuda.query.get_or_404(deuda_id)
     try:
@@ -290,47 +1017,46 @@ def registrar_pago(deuda_id):
 
     pago = Pago(estudiante_id=deuda.estudiante_id, deuda_id=deuda.id, valor=valor, metodo=metodo)
     db.session.add(pago)
-    deuda.saldo_pendiente = max(0.0, deuda.saldo_pendiente - valor)
+    descontar_pago(deuda, valor)
+    db.session.flush()
+    registrar_evento('pago.creado', datos_pago(pago))
     db.session.commit()
 
     flash("Pago registrado correctamente", "success")
 
-    # Factura PDF
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.setFont("Helvetica-Bold", 14)
-    c.drawCentredString(300, 760, "Factura de Pago - Proyecto Educativo")
-    c.setFont("Helvetica", 11)
-    c.drawString(50, 720, f"Factura ID: {pago.id}")
-    c.drawString(50, 700, f"Fecha: {pago.fecha.strftime('%Y-%m-%d %H:%M:%S')}")
-    est = deuda.estudiante
-    c.drawString(50, 680, f"Nombre: {est.nombre}")
-    c.drawString(50, 660, f"Documento: {est.documento}")
-    c.drawString(50, 640, f"Concepto deuda: {deuda.concepto}")
-    c.drawString(50, 620, f"Método de pago: {pago.metodo}")
-    c.drawString(50, 600, f"Valor pagado: ${pago.valor:,.2f}")
-    c.drawString(50, 580, f"Saldo pendiente deuda: ${deuda.saldo_pendiente:,.2f}")
-    c.showPage()
-    c.save()
-    buffer.seek(0)
+    # Factura PDF (plantilla precompilada, solo se dibujan los campos del pago)
+    pdf = plantilla_factura().render(pago, deuda, deuda.estudiante)
+    buffer = BytesIO(pdf)
 
     return send_file(buffer, as_attachment=True, download_name=f'factura_{pago.id}.pdf', mimetype='application/pdf')
 
 # --- Consulta ---
 @app.route('/consulta', methods=['GET','POST'])
+@limitar(capacidad=20, por_minuto=10)
 @login_required
+@solo_lectura
 def consulta():
     estudiante = None
+    pago_reciente = None
+    archivados = []
+    incluir_archivo = request.values.get('archivo') == '1'
     if request.method == 'POST':
         documento = request.form.get('documento')
         estudiante = Estudiante.query.filter_by(documento=documento).first()
-    return render_template('consulta.html', estudiante=estudiante)
+        if estudiante:
+            pago_reciente = ultimo_pago(estudiante.id, incluir_archivo)
+            if incluir_archivo:
+                archivados = (PagoArchivo.query.filter_by(estudiante_id=estudiante.id)
+                              .order_by(PagoArchivo.fecha.desc()).all())
+    return render_template('consulta.html', estudiante=estudiante, ultimo_pago=pago_reciente,
+                           archivados=archivados, incluir_archivo=incluir_archivo)
 
 
 # --- Admin ---
 @app.route('/admin')
 @login_required
 @admin_required
+@solo_lectura
 def admin():
     estudiantes = Estudiante.query.order_by(Estudiante.nombre).all()
     matriculas = Matricula.query.order_by(Matricula.fecha.desc()).all()
@@ -338,12 +1064,37 @@ def admin():
     deudas = Deuda.query.order_by(Deuda.id.desc()).all()
     cursos = Curso.query.order_by(Curso.nombre).all()
 
+    # el histórico archivado solo se consulta cuando se pide explícitamente
+    incluir_archivo = request.args.get('archivo') == '1'
+    if incluir_archivo:
+        pagos += PagoArchivo.query.order_by(PagoArchivo.fecha.desc()).all()
+        deudas += DeudaArchivo.query.order_by(DeudaArchivo.id.desc()).all()
+        pagos.sort(key=lambda p: p.fecha or datetime.min, reverse=True)
+        deudas.sort(key=lambda d: d.id, reverse=True)
+
+    en_espera = dict(db.session.query(ListaEspera.curso_id, db.func.count(ListaEspera.id))
+                     .group_by(ListaEspera.curso_id).all())
+    # resumen del plan de cuotas por deuda en una sola consulta agrupada
+    planes = {deuda_id: SimpleNamespace(cuotas=cuotas, abiertas=abiertas or 0, proxima=proxima, recargos=recargos)
+              for deuda_id, cuotas, abiertas, proxima, recargos in
+              db.session.query(Cuota.deuda_id, db.func.count(Cuota.id),
+                               db.func.sum(case((Cuota.saldo > 0, 1), else_=0)),
+                               db.func.min(case((Cuota.saldo > 0, Cuota.vencimiento))),
+                               db.func.sum(Cuota.recargo))
+              .group_by(Cuota.deuda_id)}
+    sedes = Sede.query.order_by(Sede.nombre).all() if current_user.sede_id is None else []
+
     return render_template("admin.html",
                            estudiantes=estudiantes,
                            matriculas=matriculas,
                            pagos=pagos,
                            deudas=deudas,
-                           cursos=cursos)
+                           cursos=cursos,
+                           en_espera=en_espera,
+                           planes=planes,
+                           hoy=datetime.utcnow().date(),
+                           sedes=sedes,
+                           incluir_archivo=incluir_archivo)
 
 
 @app.route('/admin/estudiante/<int:id>/editar', methods=['GET', 'POST'])
@@ -414,6 +1165,12 @@ def crear_deuda():
         flash("Datos inválidos para crear deuda", "danger")
         return redirect(url_for('admin'))
 
+    try:
+        plan = leer_plan_cuotas(request.form)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('admin'))
+
     estudiante = Estudiante.query.get(estudiante_id)
     if not estudiante:
         flash("Estudiante no encontrado", "danger")
@@ -421,10 +1178,771 @@ def crear_deuda():
 
     deuda = Deuda(estudiante_id=estudiante_id, concepto=concepto, monto_total=monto, saldo_pendiente=monto)
     db.session.add(deuda)
+    db.session.flush()
+    if plan:
+        crear_cuotas(deuda, *plan)
+    registrar_evento('deuda.creada', datos_deuda(deuda))
     db.session.commit()
     flash("Deuda registrada correctamente", "success")
     return redirect(url_for('admin'))
 
+def leer_plan_cuotas(datos):
+    """``(numero, primer_vencimiento)`` de un formulario o JSON, o None sin plan (una sola cuota).
+
+    Lanza ValueError con el mensaje para el usuario si el plan es inválido.
+    """
+    try:
+        numero = int(datos.get('cuotas') or 1)
+    except (TypeError, ValueError):
+        raise ValueError("Número de cuotas inválido")
+    if numero == 1:
+        return None
+    try:
+        primer_vencimiento = datetime.strptime(str(datos.get('primer_vencimiento') or ''), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("Indique la fecha de vencimiento de la primera cuota")
+    if not 1 < numero <= 60:
+        raise ValueError("El número de cuotas debe estar entre 1 y 60")
+    return numero, primer_vencimiento
+
+@app.route('/admin/deuda/<int:deuda_id>/cuotas', methods=['POST'])
+@login_required
+@admin_required
+def crear_plan_cuotas(deuda_id):
+    """Divide el saldo pendiente de una deuda existente en cuotas mensuales."""
+    deuda = Deuda.query.get_or_404(deuda_id)
+    if deuda.saldo_pendiente <= 0 or Cuota.query.filter_by(deuda_id=deuda.id).first():
+        flash("La deuda ya está saldada o ya tiene un plan de cuotas", "warning")
+        return redirect(url_for('admin'))
+    try:
+        plan = leer_plan_cuotas(request.form)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('admin'))
+    if plan is None:
+        flash("Un plan necesita al menos 2 cuotas", "warning")
+        return redirect(url_for('admin'))
+    crear_cuotas(deuda, *plan)
+    db.session.commit()
+    flash(f"Deuda dividida en {plan[0]} cuotas", "success")
+    return redirect(url_for('admin'))
+
+@app.cli.command('recargos_mora')
+@click.option('--fecha', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help="Fecha de corte (por defecto, hoy)")
+@click.option('--lote', default=5000, show_default=True, help="Cuotas por transacción")
+@click.option('--pausa', default=0.0, show_default=True, help="Segundos de espera entre lotes")
+def recargos_mora_comando(fecha, lote, pausa):
+    """Aplica el recargo por mora a las cuotas vencidas (proceso nocturno).
+
+    Porcentaje y días de gracia: ``recargo_mora_porcentaje`` y ``recargo_mora_dias``
+    en la configuración. Se puede repetir sin cobrar dos veces.
+    """
+    hoy = fecha.date() if fecha else datetime.utcnow().date()
+    porcentaje = float(Configuracion.get('recargo_mora_porcentaje', '2'))
+    dias = int(Configuracion.get('recargo_mora_dias', '30'))
+    if porcentaje <= 0 or dias < 1:
+        raise click.ClickException("Recargo por mora desactivado (porcentaje <= 0 o días < 1)")
+    cuotas, deudas, eventos = Cuota.__table__, Deuda.__table__, EventoSalida.__table__
+    inicio = time.monotonic()
+    total_cuotas, total_recargo = 0, 0.0
+    for base, motor in motores_por_sede():
+        desde = None
+        while True:
+            with motor.begin() as conexion:
+                desde, n, por_deuda, por_sede = aplicar_recargos(conexion, cuotas, deudas, hoy, porcentaje, dias,
+                                                                 lote=lote, desde=desde)
+                if not n:
+                    break
+                sumar_kpis_en(conexion, {(sede_id, datetime.utcnow().date()): {'saldo': recargo}
+                                         for sede_id, recargo in por_sede.items()})
+                actualizadas = conexion.execute(db.select(deudas).where(deudas.c.id.in_(list(por_deuda)))).all()
+                conexion.execute(eventos.insert(), [
+                    {'sede_id': d.sede_id, 'tipo': 'deuda.actualizada',
+                     'payload': json.dumps(datos_deuda(d), default=str), 'fecha': datetime.utcnow()}
+                    for d in actualizadas])
+            total_cuotas += n
+            total_recargo += sum(por_sede.values())
+            click.echo(f"[{base}] {total_cuotas:,} cuotas con recargo · {time.monotonic() - inicio:.1f}s")
+            if pausa:
+                time.sleep(pausa)
+    click.echo(f"✅ Recargo del {porcentaje:g}% (más de {dias} días de mora) aplicado a {total_cuotas:,} cuotas: "
+               f"${total_recargo:,.2f} en {time.monotonic() - inicio:.1f}s")
+
+# --- Acciones en lote sobre estudiantes seleccionados (admin) ---
+LOTE_MAXIMO = int(os.environ.get('ADMIN_LOTE_MAXIMO', 5000))
+
+@app.route('/admin/lote', methods=['POST'])
+@login_required
+@admin_required
+def acciones_en_lote():
+    """Aplica una acción a los estudiantes seleccionados en una sola transacción.
+
+    Recibe JSON ``{"accion": ..., "estudiantes": [ids], ...}`` y responde un
+    resumen JSON; si algo falla no se aplica nada.
+    """
+    datos = request.get_json(silent=True) or {}
+    accion = datos.get('accion')
+    try:
+        ids = sorted({int(i) for i in datos.get('estudiantes') or []})
+    except (TypeError, ValueError):
+        return {'error': "Selección de estudiantes inválida"}, 400
+    if not ids:
+        return {'error': "Seleccione al menos un estudiante"}, 400
+    if len(ids) > LOTE_MAXIMO:
+        return {'error': f"Se pueden seleccionar hasta {LOTE_MAXIMO} estudiantes por acción"}, 400
+
+    acciones = {
+        'activar': lambda: cambiar_estado_en_lote(ids, True),
+        'inactivar': lambda: cambiar_estado_en_lote(ids, False),
+        'asignar_deuda': lambda: asignar_deuda_en_lote(ids, datos),
+        'matricular': lambda: matricular_en_lote(ids, datos),
+    }
+    if accion not in acciones:
+        return {'error': "Acción desconocida"}, 400
+    try:
+        resumen = acciones[accion]()
+    except ValueError as e:
+        db.session.rollback()
+        return {'error': str(e)}, 400
+    db.session.commit()
+    return {'accion': accion, 'seleccionados': len(ids), **resumen}
+
+def _estudiantes_en_lote(ids, solo_activos=False, sede_id=None):
+    """``[(id, sede_id)]`` de los estudiantes de ``ids`` visibles para el usuario (el filtro de sede es automático)."""
+    consulta = db.select(Estudiante.id, Estudiante.sede_id).where(Estudiante.id.in_(ids))
+    if solo_activos:
+        consulta = consulta.where(Estudiante.activo.is_(True))
+    if sede_id is not None:
+        consulta = consulta.where(Estudiante.sede_id == sede_id)
+    return db.session.execute(consulta.order_by(Estudiante.id)).all()
+
+def cambiar_estado_en_lote(ids, activo):
+    resultado = db.session.execute(
+        db.update(Estudiante)
+        .where(Estudiante.id.in_(ids), Estudiante.activo.is_not(activo))
+        .values(activo=activo)
+        .execution_options(synchronize_session=False))
+    return {'actualizados': resultado.rowcount, 'sin_cambio': len(ids) - resultado.rowcount}
+
+def _crear_deudas_en_lote(estudiantes, concepto, monto, plan=None):
+    """Inserta una deuda por estudiante ``(id, sede_id)`` con un solo INSERT, y sus cuotas y eventos."""
+    deudas = db.session.scalars(
+        db.insert(Deuda).returning(Deuda, sort_by_parameter_order=True),
+        [{'estudiante_id': estudiante_id, 'sede_id': sede_id, 'concepto': concepto,
+          'monto_total': monto, 'saldo_pendiente': monto} for estudiante_id, sede_id in estudiantes]).all()
+    if plan:
+        cuotas = plan_de_cuotas(monto, *plan)
+        db.session.execute(db.insert(Cuota),
+                           [{'deuda_id': deuda.id, 'sede_id': deuda.sede_id, 'numero': n, 'vencimiento': vencimiento,
+                             'monto': valor, 'saldo': valor, 'recargo': 0.0}
+                            for deuda in deudas for n, vencimiento, valor in cuotas])
+    registrar_eventos('deuda.creada', [datos_deuda(deuda) for deuda in deudas])
+    # los INSERT directos no pasan por _acumular_kpis
+    for sede_id, grupo in groupby(sorted(deuda.sede_id for deuda in deudas)):
+        contar_kpis(db.session, sede_id, saldo=monto * len(list(grupo)))
+    return deudas
+
+def asignar_deuda_en_lote(ids, datos):
+    concepto = (datos.get('concepto') or '').strip()
+    try:
+        monto = float(datos.get('monto') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("Monto inválido")
+    if monto <= 0 or not concepto:
+        raise ValueError("Datos inválidos para crear deuda")
+    plan = leer_plan_cuotas(datos)
+    estudiantes = _estudiantes_en_lote(ids)
+    deudas = _crear_deudas_en_lote(estudiantes, concepto[:100], monto, plan)
+    return {'deudas': len(deudas), 'total': monto * len(deudas), 'omitidos': len(ids) - len(deudas)}
+
+def matricular_en_lote(ids, datos):
+    """Matricula a los seleccionados en un curso mientras haya cupo; el resto queda en lista de espera.
+
+    Igual que ``matricular``: cada matrícula crea la deuda del curso. Solo se
+    consideran estudiantes activos de la sede del curso.
+    """
+    try:
+        curso = Curso.query.get(int(datos.get('curso_id')))
+    except (TypeError, ValueError):
+        curso = None
+    if curso is None:
+        raise ValueError("Curso no encontrado")
+
+    estudiantes = _estudiantes_en_lote(ids, solo_activos=True, sede_id=curso.sede_id)
+    ya_matriculados = set(db.session.scalars(
+        db.select(Matricula.estudiante_id)
+        .where(Matricula.curso_id == curso.id, Matricula.estudiante_id.in_([e.id for e in estudiantes]))))
+    candidatos = [e for e in estudiantes if e.id not in ya_matriculados]
+    esperando = set(db.session.scalars(
+        db.select(ListaEspera.estudiante_id)
+        .where(ListaEspera.curso_id == curso.id, ListaEspera.estudiante_id.in_([e.id for e in candidatos]))))
+    tomados = ocupar_cupos(curso.id, len(candidatos)) if candidatos else 0
+    nuevos, sin_cupo = candidatos[:tomados], candidatos[tomados:]
+
+    if nuevos:
+        matriculas = db.session.scalars(
+            db.insert(Matricula).returning(Matricula, sort_by_parameter_order=True),
+            [{'estudiante_id': e.id, 'curso_id': curso.id, 'sede_id': curso.sede_id} for e in nuevos]).all()
+        registrar_eventos('matricula.creada', [datos_matricula(m) for m in matriculas])
+        contar_kpis(db.session, curso.sede_id, matriculas=len(matriculas))
+        _crear_deudas_en_lote([(e.id, curso.sede_id) for e in nuevos], f"Matrícula curso {curso.nombre}", curso.precio)
+        # quien esperaba y ahora tomó cupo sale de la lista (si no, se promovería otra vez)
+        salen = [e.id for e in nuevos if e.id in esperando]
+        if salen:
+            db.session.execute(db.delete(ListaEspera)
+                               .where(ListaEspera.curso_id == curso.id, ListaEspera.estudiante_id.in_(salen))
+                               .execution_options(synchronize_session=False))
+
+    filas = [{'sede_id': curso.sede_id, 'curso_id': curso.id, 'estudiante_id': e.id, 'con_deuda': True}
+             for e in sin_cupo if e.id not in esperando]
+    if filas:
+        db.session.execute(db.insert(ListaEspera), filas)
+    return {'matriculados': len(nuevos), 'en_espera': len(filas), 'ya_en_espera': len(sin_cupo) - len(filas),
+            'ya_matriculados': len(ya_matriculados), 'omitidos': len(ids) - len(estudiantes), 'curso': curso.nombre}
+
+# --- Feed de eventos y despachador del outbox ---
+CLAVE_POSICION_EVENTOS = 'eventos_posicion'
+
+def numerar_eventos(lote=5000):
+    """Da posición a los eventos ya confirmados que aún no tienen; devuelve cuántos numeró.
+
+    El id se toma al insertar, no al confirmar: una transacción larga puede
+    confirmar un id menor después de que un lector ya pasó por encima. La
+    posición solo se asigna a filas visibles (confirmadas) y con el contador de
+    ``configuracion`` bloqueado, así que nunca aparece una posición menor a otra
+    ya entregada. Con bases separadas por sede cada base numera sus eventos.
+    Si no hay eventos sin posición solo se hace una lectura (sin bloqueo ni commit).
+    """
+    config = Configuracion.__table__
+    eventos = EventoSalida.__table__
+    # el contador vive en la base de los eventos (la de la sede actual)
+    conexion = db.session.connection(bind_arguments={'mapper': EventoSalida.__mapper__})
+    if conexion.execute(db.select(eventos.c.id).where(eventos.c.posicion.is_(None)).limit(1)).first() is None:
+        return 0
+    # bloquea la fila del contador hasta el commit (en SQLite toma el lock de escritura)
+    bloqueada = conexion.execute(db.update(config).where(config.c.clave == CLAVE_POSICION_EVENTOS)
+                                 .values(valor=config.c.valor)).rowcount
+    if bloqueada:
+        ultima = int(conexion.execute(db.select(config.c.valor)
+                                      .where(config.c.clave == CLAVE_POSICION_EVENTOS)).scalar_one())
+    else:
+        ultima = conexion.execute(db.select(db.func.coalesce(db.func.max(eventos.c.posicion), 0))).scalar_one()
+        conexion.execute(config.insert(), {'clave': CLAVE_POSICION_EVENTOS, 'valor': str(ultima)})
+    ids = conexion.execute(db.select(eventos.c.id).where(eventos.c.posicion.is_(None))
+                           .order_by(eventos.c.id).limit(lote)).scalars().all()
+    if ids:
+        conexion.execute(db.update(eventos).where(eventos.c.id == bindparam('b_id'))
+                         .values(posicion=bindparam('b_posicion')),
+                         [{'b_id': i, 'b_posicion': ultima + n} for n, i in enumerate(ids, 1)])
+        conexion.execute(db.update(config).where(config.c.clave == CLAVE_POSICION_EVENTOS)
+                         .values(valor=str(ultima + len(ids))))
+    db.session.commit()
+    return len(ids)
+
+@app.route('/api/events')
+def api_eventos():
+    """Eventos con posición mayor a ``since`` (cursor), en orden; ``next`` es el próximo cursor.
+
+    Con bases separadas, ``sede`` elige la base a leer (cada una tiene sus posiciones).
+    """
+    token = os.environ.get('EVENTS_API_TOKEN')
+    autorizado = (token and request.headers.get('Authorization') == f"Bearer {token}") or \
+        (current_user.is_authenticated and current_user.role == 'admin')
+    if not autorizado:
+        abort(401)
+    try:
+        desde = int(request.args.get('since', 0))
+        limite = min(int(request.args.get('limit', 500)), 5000)
+        sede = int(request.args['sede']) if request.args.get('sede') else None
+    except ValueError:
+        abort(400)
+    if limite <= 0 or desde < 0:
+        abort(400)
+    if sede is not None:
+        if getattr(current_user, 'sede_id', None) not in (None, sede):
+            abort(403)
+        g.sede_id = sede
+    numerar_eventos(limite)
+    eventos = (EventoSalida.query.filter(EventoSalida.posicion > desde)
+               .order_by(EventoSalida.posicion).limit(limite).all())
+    return {'events': [e.como_dict() for e in eventos],
+            'next': eventos[-1].posicion if eventos else desde}
+
+
+def despachar_eventos(destino, lote=500):
+    """Entrega un lote de eventos pendientes de cada base y lo marca despachado. Devuelve cuántos envió."""
+    enviados = 0
+    for sede_id in sedes_por_base():
+        with en_sede(sede_id):
+            eventos = (EventoSalida.query.filter(EventoSalida.despachado.is_(None))
+                       .order_by(EventoSalida.id).limit(lote).all())
+            if not eventos:
+                continue
+            destino.enviar([e.como_dict() for e in eventos])
+            (EventoSalida.query.filter(EventoSalida.id.in_([e.id for e in eventos]))
+             .update({EventoSalida.despachado: datetime.utcnow()}, synchronize_session=False))
+            db.session.commit()
+            soltar_filas_por_sede(db.session)
+            enviados += len(eventos)
+    return enviados
+
+
+@app.cli.command('despachar_eventos')
+@click.option('--destino', default=lambda: os.environ.get('OUTBOX_DESTINO', 'eventos.jsonl'),
+              show_default='OUTBOX_DESTINO o eventos.jsonl', help="URL http(s) o ruta de archivo JSONL")
+@click.option('--lote', default=500, show_default=True)
+@click.option('--intervalo', default=2.0, show_default=True, help="Segundos de espera cuando no hay eventos")
+@click.option('--una-vez', is_flag=True, help="Despacha lo pendiente y termina")
+def despachar_eventos_comando(destino, lote, intervalo, una_vez):
+    """Entrega los eventos del outbox (al menos una vez, en orden de id dentro de cada base)."""
+    destino = crear_destino(destino)
+    while True:
+        try:
+            enviados = despachar_eventos(destino, lote)
+        except ErrorDestino as e:
+            db.session.rollback()
+            if una_vez:
+                raise click.ClickException(f"{destino}: {e}")
+            click.echo(f"⚠️ {destino}: {e}; se reintenta en {intervalo}s", err=True)
+            enviados = 0
+        if enviados:
+            click.echo(f"{enviados} eventos entregados a {destino}")
+        elif una_vez:
+            break
+        else:
+            time.sleep(intervalo)
+
+
+# --- Perfiles guardados ---
+@app.route('/admin/perfiles')
+@login_required
+@admin_required
+def perfiles():
+    return render_template('perfiles.html', perfiles=perfilador.listar())
+
+
+@app.route('/admin/perfiles/<nombre>.<formato>')
+@login_required
+@admin_required
+def descargar_perfil(nombre, formato):
+    ruta = perfilador.ruta(nombre, '.' + formato)
+    if not ruta:
+        abort(404)
+    return send_file(ruta, as_attachment=(formato == 'prof'),
+                     mimetype='text/plain' if formato == 'txt' else 'application/octet-stream')
+
+
+# --- Conciliación de extractos bancarios ---
+def importar_extracto(archivo, lote=500):
+    """Concilia un extracto CSV contra las deudas abiertas.
+
+    Las deudas se cargan en un índice en memoria con una sola consulta; los
+    pagos conciliados se insertan y los saldos se descuentan por lotes.
+    Devuelve un dict con el resumen de la importación.
+    """
+    filas = (db.session.query(Deuda.id, Deuda.estudiante_id, Deuda.saldo_pendiente, Estudiante.documento, Deuda.sede_id)
+             .join(Estudiante, Deuda.estudiante_id == Estudiante.id)
+             .filter(Deuda.saldo_pendiente > 0)
+             .yield_per(5000))
+    sedes = {}  # deuda_id -> sede_id, para los pagos insertados sin pasar por el ORM
+
+    def sin_sede():
+        for deuda_id, estudiante_id, saldo, documento, sede_id in filas:
+            sedes[deuda_id] = sede_id
+            yield deuda_id, estudiante_id, saldo, documento
+
+    indice = IndiceDeudas(sin_sede())
+    resumen = {'lineas': 0, 'conciliadas': 0, 'revision': 0, 'duplicadas': 0, 'valor': 0.0}
+
+    pagos_tabla = Pago.__table__
+    deudas_tabla = Deuda.__table__
+    pendientes_tabla = ConciliacionPendiente.__table__
+    sede_revision = _sede_actual() or SEDE_POR_DEFECTO  # líneas sin estudiante: la sede de quien importa
+    descontar = (deudas_tabla.update()
+                 .where(deudas_tabla.c.id == bindparam('b_id'))
+                 .values(saldo_pendiente=case(
+                     (deudas_tabla.c.saldo_pendiente - bindparam('b_valor') < 0, 0.0),
+                     else_=deudas_tabla.c.saldo_pendiente - bindparam('b_valor'))))
+
+    def procesar(lineas):
+        # huellas ya registradas (reimportación del mismo extracto)
+        huellas = [l.huella for l in lineas]
+        vistas = {h for (h,) in db.session.query(Pago.referencia).filter(Pago.referencia.in_(huellas))}
+        vistas.update(h for (h,) in db.session.query(PagoArchivo.referencia)
+                      .filter(PagoArchivo.referencia.in_(huellas)))
+        vistas.update(h for (h,) in db.session.query(ConciliacionPendiente.huella)
+                      .filter(ConciliacionPendiente.huella.in_(huellas)))
+
+        ahora = datetime.utcnow()
+        pagos, revision, por_deuda = [], [], {}
+        for linea in lineas:
+            if linea.huella in vistas:
+                resumen['duplicadas'] += 1
+                continue
+            vistas.add(linea.huella)
+            deuda, motivo = indice.buscar(linea)
+            if deuda is None:
+                revision.append({'sede_id': sede_revision, 'huella': linea.huella, 'fecha_carga': ahora,
+                                 'fecha_movimiento': linea.fecha[:30], 'referencia': linea.referencia[:100],
+                                 'documento': linea.documento[:50], 'valor': linea.valor,
+                                 'descripcion': linea.descripcion[:255], 'motivo': motivo,
+                                 'estado': 'pendiente'})
+                continue
+            saldo_antes = deuda[2]
+            indice.aplicar(deuda, linea.valor)
+            # pagos y saldos van por SQL directo: los indicadores se cuentan aquí
+            contar_kpis(db.session, sedes[deuda[0]], pagos=1, recaudado=linea.valor, saldo=deuda[2] - saldo_antes)
+            pagos.append({'sede_id': sedes[deuda[0]], 'estudiante_id': deuda[1], 'deuda_id': deuda[0], 'valor': linea.valor,
+                          'metodo': 'Transferencia', 'fecha': ahora, 'referencia': linea.huella})
+            por_deuda[deuda[0]] = por_deuda.get(deuda[0], 0.0) + linea.valor
+            resumen['valor'] += linea.valor
+
+        # misma base que el ORM: la de la sede del administrador, si tiene base propia
+        conexion = db.session.connection(bind_arguments={'mapper': Pago.__mapper__})
+        if pagos:
+            conexion.execute(pagos_tabla.insert(), pagos)
+            conexion.execute(descontar, [{'b_id': k, 'b_valor': v} for k, v in por_deuda.items()])
+            for deuda_id, cuotas in groupby(cuotas_abiertas(list(por_deuda)), key=lambda c: c.deuda_id):
+                descontar_de_cuotas(list(cuotas), por_deuda[deuda_id])
+            # eventos del outbox con los ids asignados, en la misma transacción
+            insertados = (conexion.execute(pagos_tabla.select()
+                                           .where(pagos_tabla.c.referencia.in_([p['referencia'] for p in pagos]))
+                                           .order_by(pagos_tabla.c.id))
+                          .mappings().all())
+            conexion.execute(EventoSalida.__table__.insert(), [
+                {'sede_id': fila['sede_id'], 'tipo': 'pago.creado',
+                 'payload': json.dumps(datos_pago(SimpleNamespace(**fila)), default=str), 'fecha': ahora}
+                for fila in insertados])
+        if revision:
+            conexion.execute(pendientes_tabla.insert(), revision)
+        db.session.commit()
+        resumen['conciliadas'] += len(pagos)
+        resumen['revision'] += len(revision)
+
+    bloque = []
+    for linea in leer_extracto(archivo):
+        resumen['lineas'] += 1
+        bloque.append(linea)
+        if len(bloque) >= lote:
+            procesar(bloque)
+            bloque = []
+    if bloque:
+        procesar(bloque)
+    return resumen
+
+
+@app.route('/admin/conciliacion', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def conciliacion():
+    if request.method == 'POST':
+        archivo = request.files.get('extracto')
+        if not archivo or not archivo.filename:
+            flash("Seleccione un archivo CSV del banco", "warning")
+            return redirect(url_for('conciliacion'))
+        try:
+            resumen = importar_extracto(TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline=''))
+        except (ErrorExtracto, UnicodeDecodeError) as e:
+            db.session.rollback()
+            flash(f"Extracto inválido: {e}", "danger")
+            return redirect(url_for('conciliacion'))
+        flash(f"✅ {resumen['lineas']} líneas: {resumen['conciliadas']} conciliadas "
+              f"(${resumen['valor']:,.2f}), {resumen['revision']} para revisión, "
+              f"{resumen['duplicadas']} ya importadas", "success")
+        return redirect(url_for('conciliacion'))
+
+    pendientes = (ConciliacionPendiente.query.filter_by(estado='pendiente')
+                  .order_by(ConciliacionPendiente.id).limit(200).all())
+    documentos = {p.documento for p in pendientes if p.documento}
+    candidatas = {}
+    if documentos:
+        for deuda, documento in (db.session.query(Deuda, Estudiante.documento)
+                                 .join(Estudiante, Deuda.estudiante_id == Estudiante.id)
+                                 .filter(Estudiante.documento.in_(documentos), Deuda.saldo_pendiente > 0)):
+            candidatas.setdefault(documento, []).append(deuda)
+    return render_template('conciliacion.html', pendientes=pendientes, candidatas=candidatas)
+
+
+@app.route('/admin/conciliacion/<int:id>/aplicar', methods=['POST'])
+@login_required
+@admin_required
+def aplicar_conciliacion(id):
+    pendiente = ConciliacionPendiente.query.get_or_404(id)
+    try:
+        deuda_id = int(request.form.get('deuda_id', ''))
+    except ValueError:
+        flash("Seleccione una deuda", "warning")
+        return redirect(url_for('conciliacion'))
+    deuda = Deuda.query.get_or_404(deuda_id)
+
+    if pendiente.estado != 'pendiente' or not pendiente.valor or pendiente.valor <= 0:
+        flash("El movimiento no se puede aplicar", "warning")
+        return redirect(url_for('conciliacion'))
+    if pendiente.valor > deuda.saldo_pendiente + 0.0001:
+        flash("El valor no puede ser mayor que el saldo pendiente", "warning")
+        return redirect(url_for('conciliacion'))
+
+    metodo = 'En línea' if pendiente.huella.startswith('PASARELA:') else 'Transferencia'
+    pago = Pago(estudiante_id=deuda.estudiante_id, deuda_id=deuda.id, valor=pendiente.valor,
+                metodo=metodo, referencia=pendiente.huella)
+    db.session.add(pago)
+    descontar_pago(deuda, pendiente.valor)
+    pendiente.estado = 'aplicado'
+    db.session.flush()
+    registrar_evento('pago.creado', datos_pago(pago))
+    db.session.commit()
+    flash("Pago registrado correctamente", "success")
+    return redirect(url_for('conciliacion'))
+
+
+@app.route('/admin/conciliacion/<int:id>/descartar', methods=['POST'])
+@login_required
+@admin_required
+def descartar_conciliacion(id):
+    pendiente = ConciliacionPendiente.query.get_or_404(id)
+    pendiente.estado = 'descartado'
+    db.session.commit()
+    flash("Movimiento descartado", "info")
+    return redirect(url_for('conciliacion'))
+
+
+@app.cli.command('conciliar')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--lote', default=500, show_default=True, help="Líneas por transacción")
+def conciliar_comando(archivo, lote):
+    """Concilia un extracto bancario CSV contra las deudas abiertas."""
+    inicio = datetime.utcnow()
+    with open(archivo, encoding='utf-8-sig', newline='') as f:
+        resumen = importar_extracto(f, lote=lote)
+    segundos = (datetime.utcnow() - inicio).total_seconds()
+    click.echo(f"{resumen['lineas']} líneas en {segundos:.1f}s: {resumen['conciliadas']} conciliadas "
+               f"(${resumen['valor']:,.2f}), {resumen['revision']} para revisión, "
+               f"{resumen['duplicadas']} duplicadas")
+
+# --- Archivo de deudas saldadas y pagos antiguos ---
+@app.cli.command('archivar')
+@click.option('--dias', type=int, default=None,
+              help="Horizonte en días (por defecto ARCHIVO_HORIZONTE_DIAS o 730)")
+@click.option('--lote', default=1000, show_default=True, help="Filas por transacción")
+@click.option('--pausa', default=0.0, show_default=True, help="Segundos de espera entre lotes")
+def archivar_comando(dias, lote, pausa):
+    """Mueve deudas saldadas y pagos más antiguos que el horizonte a las tablas de archivo."""
+    if dias is None:
+        dias = int(os.environ.get('ARCHIVO_HORIZONTE_DIAS', 730))
+    corte = datetime.utcnow() - timedelta(days=dias)
+    tablas = {
+        'deuda': Deuda.__table__, 'pago': Pago.__table__,
+        'deuda_archivo': DeudaArchivo.__table__, 'pago_archivo': PagoArchivo.__table__,
+        'cuota': Cuota.__table__, 'cuota_archivo': CuotaArchivo.__table__,
+        'intencion_pago': IntencionPago.__table__, 'intencion_pago_archivo': IntencionPagoArchivo.__table__,
+    }
+    totales = {'deudas': 0, 'pagos': 0}
+    for base, motor in motores_por_sede():
+        sufijo = '' if motor is db.engine else '_' + base.replace(' ', '_')
+        # cursores guardados por una ejecución interrumpida
+        cursores = {fase: int(Configuracion.get(f'archivo_cursor_{fase}{sufijo}', 0)) for fase in totales}
+        with Session(motor) as sesion:
+            for fase, ultimo_id, movidas in archivar(sesion, tablas, corte, lote=lote, pausa=pausa,
+                                                     cursores=cursores):
+                totales[fase] += movidas
+                Configuracion.set(f'archivo_cursor_{fase}{sufijo}', str(ultimo_id))
+                click.echo(f"[{base}] {fase}: {totales[fase]} archivadas (último id {ultimo_id})")
+        for fase in totales:
+            Configuracion.set(f'archivo_cursor_{fase}{sufijo}', '0')
+    click.echo(f"✅ Archivo completo antes de {corte:%Y-%m-%d}: {totales['deudas']} deudas, {totales['pagos']} pagos sueltos")
+
+# --- Migraciones de datos por lotes ---
+def _motores_migracion(migracion):
+    """Bases donde viven las filas de la tabla: la principal y, si es por sede, las bases separadas."""
+    por_sede = {m.local_table.name for m in db.Model.registry.mappers if issubclass(m.class_, PorSede)}
+    return motores_por_sede() if migracion.tabla.name in por_sede else [('principal', db.engine)]
+
+@app.cli.command('migrar_datos')
+@click.argument('nombre', required=False)
+@click.option('--lote', default=1000, show_default=True, help="Filas por transacción")
+@click.option('--pausa', default=0.0, show_default=True, help="Segundos de espera entre lotes")
+@click.option('--carga', default=1.0, show_default=True,
+              help="Fracción del tiempo trabajando (0.25 = espera 3 veces lo que tardó cada lote)")
+@click.option('--limite', type=float, default=None, help="Segundos máximos; lo pendiente sigue en la próxima ejecución")
+@click.option('--listar', is_flag=True, help="Solo mostrar el estado de cada migración")
+@click.option('--reiniciar', is_flag=True, help="Borrar el avance de NOMBRE y empezar de cero")
+def migrar_datos_comando(nombre, lote, pausa, carga, limite, listar, reiniciar):
+    """Ejecuta (o continúa) las migraciones de datos de migrations/datos, o solo NOMBRE."""
+    if not 0 < carga <= 1:
+        raise click.ClickException("--carga debe estar entre 0 (exclusivo) y 1")
+    if reiniciar and not nombre:
+        raise click.ClickException("--reiniciar requiere el NOMBRE de la migración")
+    try:
+        migraciones = cargar_migraciones_datos(os.path.join(app.root_path, 'migrations', 'datos'))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    if nombre:
+        migraciones = [m for m in migraciones if m.nombre == nombre]
+        if not migraciones:
+            raise click.ClickException(f"No existe la migración de datos {nombre!r}")
+    checkpoints = CheckpointMigracion.__table__
+
+    if listar:
+        for migracion in migraciones:
+            for base, motor in _motores_migracion(migracion):
+                with motor.connect() as conexion:
+                    checkpoint = leer_checkpoint(conexion, checkpoints, migracion.nombre)
+                estado = 'pendiente' if checkpoint is None else \
+                    f"{checkpoint['estado']}: {checkpoint['filas']:,} filas, último id {checkpoint['ultimo_id']}"
+                click.echo(f"{migracion.nombre} [{base}] — {estado}. {migracion.descripcion}")
+        return
+
+    inicio = time.monotonic()
+    for migracion in migraciones:
+        for base, motor in _motores_migracion(migracion):
+            if reiniciar:
+                with motor.begin() as conexion:
+                    conexion.execute(checkpoints.delete().where(checkpoints.c.nombre == migracion.nombre))
+
+            def progreso(checkpoint, hechas, pendientes, segundos):
+                if checkpoint['estado'] == ESTADO_COMPLETA:
+                    return
+                ritmo = hechas / segundos if segundos else 0
+                porcentaje = min(100, 100 * hechas / pendientes) if pendientes else 100
+                faltan = (pendientes - hechas) / ritmo if ritmo else 0
+                click.echo(f"  {hechas:,}/{pendientes:,} ({porcentaje:.0f}%) · {ritmo:,.0f} filas/s · "
+                           f"faltan ~{faltan:,.0f}s · último id {checkpoint['ultimo_id']}")
+
+            click.echo(f"{migracion.nombre} [{base}]")
+            restante = None if limite is None else max(0, limite - (time.monotonic() - inicio))
+            try:
+                checkpoint = ejecutar_migracion_datos(motor, checkpoints, migracion, lote=lote, pausa=pausa,
+                                                      carga=carga, limite=restante, progreso=progreso)
+            except KeyboardInterrupt:
+                raise click.ClickException("Interrumpida; el último lote confirmado quedó guardado, "
+                                           "vuelva a ejecutar el comando para continuar")
+            if checkpoint['estado'] != ESTADO_COMPLETA:
+                click.echo(f"⏸️  Detenida por --limite tras el id {checkpoint['ultimo_id']}; "
+                           f"vuelva a ejecutar el comando para continuar")
+                return
+            click.echo(f"✅ {migracion.nombre} [{base}] completa: {checkpoint['filas']:,} filas")
+
+# --- Sedes ---
+@app.route('/admin/sede', methods=['POST'])
+@login_required
+@admin_required
+def elegir_sede():
+    """El administrador general elige con qué sede trabajar (vacío = todas)."""
+    if current_user.sede_id is not None:
+        abort(403)
+    sede_id = request.form.get('sede_id', type=int)
+    if sede_id and db.session.get(Sede, sede_id):
+        session['sede_activa'] = sede_id
+    else:
+        session.pop('sede_activa', None)
+    return redirect(request.referrer or url_for('admin'))
+
+@app.cli.command('crear_sede')
+@click.argument('nombre')
+def crear_sede_comando(nombre):
+    """Crea una sede."""
+    sede = Sede(nombre=nombre)
+    db.session.add(sede)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise click.ClickException(f"Ya existe la sede {nombre!r}")
+    click.echo(f"✅ Sede {sede.id}: {sede.nombre}")
+
+@app.cli.command('asignar_sede')
+@click.argument('username')
+@click.argument('sede_id', type=int, required=False)
+def asignar_sede_comando(username, sede_id):
+    """Asigna la sede de un usuario (sin SEDE_ID: administrador de todas las sedes)."""
+    usuario = Usuario.query.filter_by(username=username).first()
+    if usuario is None:
+        raise click.ClickException(f"No existe el usuario {username!r}")
+    if sede_id is not None and db.session.get(Sede, sede_id) is None:
+        raise click.ClickException(f"No existe la sede {sede_id}")
+    usuario.sede_id = sede_id
+    db.session.commit()
+    click.echo(f"✅ {username} → {'todas las sedes' if sede_id is None else f'sede {sede_id}'}")
+
+@app.cli.command('preparar_sede')
+@click.argument('sede_id', type=int)
+def preparar_sede_comando(sede_id):
+    """Crea las tablas en la base separada de una sede (SEDE_DATABASE_URLS)."""
+    bind = SEDES_SEPARADAS.get(sede_id)
+    if bind is None:
+        raise click.ClickException(f"La sede {sede_id} no tiene base propia en SEDE_DATABASE_URLS")
+    sede = db.session.get(Sede, sede_id)
+    if sede is None:
+        raise click.ClickException(f"No existe la sede {sede_id}")
+    motor = db.engines[bind]
+    # tablas que pasaron a ser por sede (lista de espera, outbox...): en una base preparada
+    # antes quedaron sin sede_id y vacías, porque sus filas iban a la principal
+    inspector = inspect(motor)
+    for tabla in reversed(db.metadata.sorted_tables):
+        if 'sede_id' not in tabla.c or not inspector.has_table(tabla.name):
+            continue
+        if 'sede_id' in {c['name'] for c in inspector.get_columns(tabla.name)}:
+            continue
+        with motor.begin() as conexion:
+            if conexion.execute(db.select(db.func.count()).select_from(tabla)).scalar():
+                raise click.ClickException(f"La tabla {tabla.name} de la sede {sede_id} tiene filas y no tiene sede_id")
+            tabla.drop(conexion)
+        click.echo(f"{tabla.name}: recreada con sede_id")
+    # todas las tablas, para que las llaves foráneas (sede, estudiante, curso...) resuelvan localmente
+    db.metadata.create_all(motor)
+    with motor.begin() as conexion:
+        if not conexion.execute(Sede.__table__.select().where(Sede.__table__.c.id == sede_id)).first():
+            conexion.execute(Sede.__table__.insert(), {'id': sede.id, 'nombre': sede.nombre})
+    click.echo(f"✅ Base de la sede {sede.nombre} lista ({motor.url.render_as_string()})")
+
+# --- Respaldos (ver respaldo.py) ---
+def _carpeta_respaldos():
+    return os.environ.get('BACKUP_DIR') or os.path.join(app.instance_path, 'respaldos')
+
+@app.cli.command('respaldar')
+@click.option('--carpeta', default=_carpeta_respaldos, show_default='BACKUP_DIR o instance/respaldos')
+@click.option('--diarios', default=7, show_default=True, help="Días con respaldo a conservar")
+@click.option('--semanales', default=4, show_default=True, help="Semanas con respaldo a conservar")
+@click.option('--mensuales', default=6, show_default=True, help="Meses con respaldo a conservar")
+def respaldar_comando(carpeta, diarios, semanales, mensuales):
+    """Crea un respaldo comprimido y con checksum de cada base, y rota los anteriores.
+
+    Las bases separadas por sede van en subcarpetas (``sede_2``...) con su propia rotación.
+    """
+    for base, motor in motores_por_sede():
+        destino = carpeta if motor is db.engine else os.path.join(carpeta, base.replace(' ', '_'))
+        try:
+            manifiesto = respaldar(motor.url.render_as_string(hide_password=False), destino)
+        except ErrorRespaldo as e:
+            raise click.ClickException(f"[{base}] {e}")
+        click.echo(f"✅ [{base}] {manifiesto['archivo']} ({manifiesto['bytes'] / 1024:,.0f} KiB, "
+                   f"sha256 {manifiesto['sha256'][:12]}…): "
+                   f"{manifiesto['filas'].get('pago', 0)} pagos, {manifiesto['filas'].get('deuda', 0)} deudas")
+        for archivo in rotar(destino, diarios, semanales, mensuales):
+            click.echo(f"🗑️  [{base}] {archivo} eliminado por rotación")
+
+@app.cli.command('restaurar')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--destino', default=None, help="URL de la base a restaurar (por defecto la de la aplicación)")
+@click.option('--sede', type=int, default=None, help="Restaurar la base separada de esta sede")
+@click.option('--si', is_flag=True, help="No pedir confirmación")
+def restaurar_comando(archivo, destino, sede, si):
+    """Restaura un respaldo y verifica filas por tabla y totales de pagos y deudas."""
+    if sede is not None and sede not in SEDES_SEPARADAS:
+        raise click.ClickException(f"La sede {sede} no tiene base propia en SEDE_DATABASE_URLS")
+    motor = db.engines[SEDES_SEPARADAS[sede]] if sede is not None else db.engine
+    url = destino or motor.url.render_as_string(hide_password=False)
+    if not si:
+        click.confirm(f"Se reemplazará el contenido de {make_url(url).render_as_string()}. ¿Continuar?", abort=True)
+    motor.dispose()
+    try:
+        diferencias = restaurar(archivo, url)
+    except ErrorRespaldo as e:
+        raise click.ClickException(str(e))
+    if diferencias:
+        raise click.ClickException("La verificación no coincide con el manifiesto:\n" + "\n".join(diferencias))
+    click.echo("✅ Restaurado y verificado: filas y totales coinciden con el respaldo")
+
 # --- Crear nuevo curso ---
 @app.route('/admin/crear_curso', methods=['POST'])
 @login_required
@@ -452,12 +1970,59 @@ def crear_curso():
         flash("❌ Ya existe un curso con ese nombre", "danger")
         return redirect(url_for('admin'))
 
-    nuevo = Curso(nombre=nombre, descripcion=descripcion, precio=precio)
+    cupo_raw = request.form.get('cupo', '').strip()
+    try:
+        cupo = int(cupo_raw) if cupo_raw else None
+    except ValueError:
+        flash("⚠️ Cupo inválido", "warning")
+        return redirect(url_for('admin'))
+    if cupo is not None and cupo < 0:
+        flash("⚠️ El cupo no puede ser negativo", "warning")
+        return redirect(url_for('admin'))
+
+    nuevo = Curso(nombre=nombre, descripcion=descripcion, precio=precio, cupo=cupo)
     db.session.add(nuevo)
     db.session.commit()
     flash("✅ Curso agregado correctamente", "success")
     return redirect(url_for('admin'))
 
+@app.route('/admin/curso/<int:curso_id>/cupo', methods=['POST'])
+@login_required
+@admin_required
+def cambiar_cupo(curso_id):
+    curso = Curso.query.get_or_404(curso_id)
+    cupo_raw = request.form.get('cupo', '').strip()
+    try:
+        cupo = int(cupo_raw) if cupo_raw else None
+    except ValueError:
+        flash("⚠️ Cupo inválido", "warning")
+        return redirect(url_for('admin'))
+    if cupo is not None and cupo < 0:
+        flash("⚠️ El cupo no puede ser negativo", "warning")
+        return redirect(url_for('admin'))
+
+    # bajar el cupo no cancela matrículas: solo impide nuevas hasta que se liberen
+    curso.cupo = cupo
+    db.session.flush()
+    promovidos = promover_lista_espera(curso)
+    db.session.commit()
+    flash(f"✅ Cupo de {curso.nombre} actualizado. Promovidos desde lista de espera: {len(promovidos)}", "success")
+    return redirect(url_for('admin'))
+
+@app.route('/admin/matricula/<int:matricula_id>/cancelar', methods=['POST'])
+@login_required
+@admin_required
+def cancelar_matricula_admin(matricula_id):
+    matricula = Matricula.query.get_or_404(matricula_id)
+    nombre, curso = matricula.estudiante.nombre, matricula.curso.nombre
+    promovidos = cancelar_matricula(matricula)
+    db.session.commit()
+    mensaje = f"✅ Matrícula de {nombre} en {curso} cancelada."
+    if promovidos:
+        mensaje += " Promovidos desde lista de espera: " + ", ".join(m.estudiante.nombre for m in promovidos)
+    flash(mensaje, "success")
+    return redirect(url_for('admin'))
+
 @app.route('/admin/configuracion', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -468,6 +2033,18 @@ def admin_configuracion():
             # guardamos como string (como usabas)
             try:
                 Configuracion.set("precio_semestre", str(precio))
+                for clave in CLAVES_INSTITUCION:
+                    valor = request.form.get(clave)
+                    if valor is not None:
+                        Configuracion.set(clave, valor.strip())
+                porcentaje = request.form.get('recargo_mora_porcentaje')
+                dias = request.form.get('recargo_mora_dias')
+                if porcentaje is not None and dias is not None:
+                    porcentaje, dias = float(porcentaje), int(dias)
+                    if porcentaje < 0 or dias < 1:
+                        raise ValueError("recargo por mora fuera de rango")
+                    Configuracion.set('recargo_mora_porcentaje', f"{porcentaje:g}")
+                    Configuracion.set('recargo_mora_dias', str(dias))
                 flash("✅ Precio de semestre actualizado con éxito", "success")
                 return redirect(url_for('admin_configuracion'))
             except Exception:
@@ -475,7 +2052,11 @@ def admin_configuracion():
                 return redirect(url_for('admin_configuracion'))
 
     precio_semestre = Configuracion.get("precio_semestre", "0")
-    return render_template("admin_configuracion.html", precio_semestre=precio_semestre)
+    institucion = {clave: Configuracion.get(clave, "") for clave in CLAVES_INSTITUCION}
+    mora = {'porcentaje': Configuracion.get('recargo_mora_porcentaje', '2'),
+            'dias': Configuracion.get('recargo_mora_dias', '30')}
+    return render_template("admin_configuracion.html", precio_semestre=precio_semestre, institucion=institucion,
+                           mora=mora)
 
 # --- Nueva matrícula ---
 @app.route('/matriculas/nueva', methods=['GET', 'POST'])
@@ -505,21 +2086,14 @@ def nueva_matricula():
             flash(f"⚠️ {estudiante.nombre} ya está matriculado en el curso {curso.nombre}", "warning")
             return redirect(url_for('nueva_matricula'))
 
-        # Crear matrícula
-        matricula = Matricula(estudiante_id=estudiante.id, curso_id=curso.id)
-        db.session.add(matricula)
-
-        # Crear deuda asociada al curso
-        deuda = Deuda(
-            estudiante_id=estudiante.id,
-            concepto=f"Matrícula curso {curso.nombre}",
-            monto_total=curso.precio,
-            saldo_pendiente=curso.precio
-        )
-        db.session.add(deuda)
+        # Crear matrícula y deuda asociada al curso (o lista de espera si no hay cupo)
+        matricula, posicion = matricular(estudiante, curso, con_deuda=True)
         db.session.commit()
 
-        flash(f"✅ Matrícula creada para {estudiante.nombre} en {curso.nombre}. Deuda: ${curso.precio:,.2f}", "success")
+        if matricula is None:
+            flash(f"⚠️ {curso.nombre} no tiene cupos: {estudiante.nombre} quedó en lista de espera (posición {posicion})", "warning")
+        else:
+            flash(f"✅ Matrícula creada para {estudiante.nombre} en {curso.nombre}. Deuda: ${curso.precio:,.2f}", "success")
         return redirect(url_for('admin'))
 
     return render_template('nueva_matricula.html', estudiantes=estudiantes, cursos=cursos)
@@ -553,13 +2127,219 @@ def cambiar_password():
 def pago_efectivo():
     return redirect(url_for('payment'))
 
+_cliente_pasarela = None
+_cliente_pasarela_lock = threading.Lock()
+
+def cliente_pasarela():
+    """Cliente único por proceso (comparte el pool de conexiones HTTP).
+
+    None si falta la llave privada o el secreto de eventos: sin secreto los
+    webhooks no se pueden verificar y no se activa la integración.
+    """
+    global _cliente_pasarela
+    if _cliente_pasarela is not None:
+        return _cliente_pasarela
+    if not os.environ.get('PASARELA_LLAVE_PRIVADA') or not os.environ.get('PASARELA_SECRETO_EVENTOS'):
+        return None
+    with _cliente_pasarela_lock:  # con workers de hilos, que dos requests no creen dos clientes
+        if _cliente_pasarela is None:
+            _cliente_pasarela = ClientePasarela(
+                url_base=os.environ.get('PASARELA_URL', 'https://sandbox.wompi.co/v1'),
+                llave_privada=os.environ['PASARELA_LLAVE_PRIVADA'],
+                secreto_eventos=os.environ['PASARELA_SECRETO_EVENTOS'],
+                url_checkout=os.environ.get('PASARELA_CHECKOUT_URL', 'https://checkout.wompi.co/l/'),
+                timeout=(3.05, float(os.environ.get('PASARELA_TIMEOUT', 10))),
+            )
+    return _cliente_pasarela
+
 @app.route('/pago_online', methods=['GET', 'POST'])
+@limitar(capacidad=10, por_minuto=6)
 def pago_online():
     if request.method == 'POST':
-        flash("Integración con pasarela (Wompi) pendiente / configurada en variables de entorno", "info")
-        return redirect(url_for('payment'))
+        cliente = cliente_pasarela()
+        if cliente is None:
+            flash("Integración con pasarela (Wompi) pendiente / configurada en variables de entorno", "info")
+            return redirect(url_for('payment'))
+
+        try:
+            valor = float(request.form.get('valor', '0'))
+        except ValueError:
+            flash("Valor inválido", "danger")
+            return redirect(url_for('pago_online'))
+        if valor <= 0:
+            flash("Valor debe ser mayor que 0", "warning")
+            return redirect(url_for('pago_online'))
+
+        deuda = None
+        deuda_id = request.form.get('deuda_id')
+        if deuda_id and deuda_id.isdigit():
+            deuda = Deuda.query.get(int(deuda_id))
+        else:
+            estudiante = Estudiante.query.filter_by(documento=request.form.get('documento', '').strip()).first()
+            if estudiante:
+                # la deuda abierta más antigua que admita el valor
+                deuda = (Deuda.query.filter_by(estudiante_id=estudiante.id)
+                         .filter(Deuda.saldo_pendiente >= valor - 0.0001)
+                         .order_by(Deuda.id).first())
+        if not deuda or deuda.saldo_pendiente <= 0:
+            flash("No se encontró una deuda pendiente para ese pago", "danger")
+            return redirect(url_for('pago_online'))
+        if valor > deuda.saldo_pendiente + 0.0001:
+            flash("El valor no puede ser mayor que el saldo pendiente", "warning")
+            return redirect(url_for('pago_online'))
+
+        intencion = IntencionPago(referencia=f"DEU-{deuda.id}-{uuid.uuid4().hex[:12]}", deuda_id=deuda.id, valor=valor)
+        try:
+            intencion.enlace_id, url_checkout = cliente.crear_intencion(
+                intencion.referencia, int(round(valor * 100)), deuda.concepto,
+                url_retorno=url_for('confirmacion_pago', _external=True))
+        except ErrorPasarela:
+            app.logger.exception("Error creando el pago en la pasarela")
+            flash("No fue posible conectar con la pasarela de pagos, intente más tarde", "danger")
+            return redirect(url_for('pago_online'))
+        db.session.add(intencion)
+        db.session.commit()
+        return redirect(url_checkout)
     return render_template('pago_online.html')
 
+@app.route('/pasarela/webhook', methods=['POST'])
+def pasarela_webhook():
+    """Valida la firma, guarda el evento y responde de inmediato; lo aplica el worker."""
+    cliente = cliente_pasarela()
+    if cliente is None:
+        abort(404)
+    try:
+        evento = cliente.verificar_evento(request.get_data())
+    except FirmaInvalida:
+        abort(401)
+    transaccion_id, estado, _, _, _ = datos_transaccion(evento)
+    if not transaccion_id:
+        return {'ok': True, 'ignorado': True}
+    try:
+        db.session.add(EventoPasarela(clave=f"{transaccion_id}:{estado}"[:100],
+                                      payload=request.get_data(as_text=True)))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # reenvío de un evento ya recibido
+    return {'ok': True}
+
+def aplicar_eventos_pasarela(lote=100):
+    """Aplica un lote de eventos pendientes a Deuda/Pago. Devuelve cuántos procesó."""
+    consulta = EventoPasarela.query.filter_by(estado='pendiente').order_by(EventoPasarela.id).limit(lote)
+    if db.engine.dialect.name == 'postgresql':
+        consulta = consulta.with_for_update(skip_locked=True)  # varios workers en paralelo
+    eventos = consulta.all()
+    if not eventos:
+        return 0
+
+    transacciones = {}
+    for ev in eventos:
+        transacciones[ev.id] = datos_transaccion(json.loads(ev.payload))
+    referencias = {t[2] for t in transacciones.values() if t[2]}
+    enlaces = {t[3] for t in transacciones.values() if t[3]}
+
+    def aplicar(ev, intencion):
+        # cada evento en su savepoint: uno que falla queda en error y no frena al resto del lote
+        kpis_antes = {clave: dict(deltas) for clave, deltas in db.session.info.get('kpis', {}).items()}
+        try:
+            with db.session.begin_nested():
+                _aplicar_evento_pasarela(ev, intencion, *transacciones[ev.id])
+        except Exception as e:
+            app.logger.exception("No se pudo aplicar el evento de pasarela %s", ev.id)
+            db.session.info['kpis'] = kpis_antes
+            ev.estado, ev.error = 'error', f"{type(e).__name__}: {e}"[:255]
+
+    # la intención (y su deuda) vive en la base de su sede: se aplica con esa sede activa
+    sin_intencion = eventos
+    for sede_id in sedes_por_base():
+        with en_sede(sede_id):
+            intenciones = (IntencionPago.query.options(joinedload(IntencionPago.deuda))
+                           .filter(or_(IntencionPago.referencia.in_(referencias),
+                                       IntencionPago.enlace_id.in_(enlaces)))
+                           .all())
+            por_referencia = {i.referencia: i for i in intenciones}
+            por_enlace = {i.enlace_id: i for i in intenciones if i.enlace_id}
+            pendientes, sin_intencion = sin_intencion, []
+            for ev in pendientes:
+                intencion = por_referencia.get(transacciones[ev.id][2]) or por_enlace.get(transacciones[ev.id][3])
+                if intencion is None:
+                    sin_intencion.append(ev)
+                else:
+                    aplicar(ev, intencion)
+            soltar_filas_por_sede(db.session)
+    for ev in sin_intencion:
+        aplicar(ev, None)
+
+    ahora = datetime.utcnow()
+    for ev in eventos:
+        ev.procesado = ahora
+    db.session.commit()
+    return len(eventos)
+
+def _aplicar_evento_pasarela(ev, intencion, transaccion_id, estado, referencia, enlace_id, valor):
+    if intencion is None:
+        ev.estado, ev.error = 'error', 'Intención de pago no encontrada'
+        return
+    if estado != ESTADO_APROBADO:
+        if intencion.estado == 'creada' and estado in ('DECLINED', 'ERROR', 'VOIDED'):
+            intencion.estado = 'rechazada'
+        ev.estado = 'ignorado'
+        return
+    if intencion.estado == 'aprobada':
+        ev.estado = 'ignorado'
+        return
+
+    valor = valor if valor is not None else intencion.valor
+    huella = f"PASARELA:{transaccion_id}"[:100]
+    intencion.estado = 'aprobada'
+    deuda = intencion.deuda
+    motivo = None
+    if deuda is None:
+        motivo = 'Deuda no encontrada (archivada)'
+    elif valor > deuda.saldo_pendiente + 0.0001:
+        motivo = REVISION_EXCEDE
+    if motivo:
+        # el dinero ya se cobró: queda en la revisión de conciliación para aplicarlo o devolverlo
+        db.session.add(ConciliacionPendiente(
+            sede_id=intencion.sede_id, huella=huella, referencia=intencion.referencia, valor=valor, motivo=motivo,
+            fecha_movimiento=ev.recibido.strftime('%Y-%m-%d') if ev.recibido else None,
+            documento=deuda.estudiante.documento if deuda is not None else None,
+            descripcion=f"Pago en línea aprobado para la deuda {intencion.deuda_id}"))
+        ev.estado, ev.error = 'revision', motivo
+        return
+
+    pago = Pago(estudiante_id=deuda.estudiante_id, deuda_id=deuda.id, valor=valor,
+                metodo='En línea', referencia=huella)
+    db.session.add(pago)
+    descontar_pago(deuda, valor)
+    db.session.flush()
+    registrar_evento('pago.creado', datos_pago(pago))
+    ev.estado = 'aplicado'
+
+@app.cli.command('pasarela_worker')
+@click.option('--lote', default=100, show_default=True, help="Eventos por transacción")
+@click.option('--intervalo', default=2.0, show_default=True, help="Segundos de espera cuando no hay eventos")
+@click.option('--una-vez', is_flag=True, help="Procesa lo pendiente y termina")
+def pasarela_worker(lote, intervalo, una_vez):
+    """Aplica en segundo plano los webhooks de la pasarela guardados."""
+    while True:
+        try:
+            procesados = aplicar_eventos_pasarela(lote)
+        except Exception:
+            # p. ej. la base de datos no responde: se reintenta en el próximo ciclo
+            db.session.rollback()
+            app.logger.exception("Error aplicando eventos de la pasarela")
+            if una_vez:
+                raise
+            time.sleep(intervalo)
+            continue
+        if procesados:
+            click.echo(f"{procesados} eventos procesados")
+        elif una_vez:
+            break
+        else:
+            time.sleep(intervalo)
+
 @app.route('/confirmacion_pago')
 def confirmacion_pago():
     flash("✅ Gracias, tu pago está siendo procesado", "success")
@@ -570,23 +2350,255 @@ def confirmacion_pago():
 def admin_dashboard():
     if current_user.role != 'admin':
         abort(403)
-    return render_template('dashboard_admin.html')
+    kpis = leer_kpis().get(g.get('sede_id')) or sumar_kpis({}, {})
+    return render_template('dashboard_admin.html', kpis=kpis)
 
+@app.route('/admin/kpis/stream')
+@login_required
+@admin_required
+def kpis_stream():
+    """Indicadores en vivo (Server-Sent Events) de la sede activa o de todas.
+
+    Con gevent la conexión queda abierta hasta KPI_SSE_SECONDS y el navegador
+    se reconecta solo. Con hilos o sync cada panel abierto ocuparía un hilo (o
+    el worker entero hasta el timeout), así que se responde el último valor y
+    el navegador vuelve a pedir tras KPI_POLL_SECONDS.
+    """
+    clave = g.get('sede_id')
+    if not servidor_con_greenlets():
+        actual = difusor_kpis.consultar(clave)
+        cuerpo = f"retry: {int(KPI_CONSULTA_SEGUNDOS * 1000)}\n\n"
+        if actual is not None:
+            cuerpo += evento_sse(actual[1], evento='kpis', id=actual[0])
+        return Response(cuerpo, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+    def eventos():
+        difusor_kpis.conectar()
+        try:
+            yield "retry: 3000\n\n"
+            version, fin = 0, time.monotonic() + KPI_SSE_SEGUNDOS
+            while time.monotonic() < fin:
+                nuevo = difusor_kpis.esperar(clave, version, timeout=min(15, max(0, fin - time.monotonic())))
+                if nuevo is None:
+                    yield ": ping\n\n"  # mantiene viva la conexión a través de proxies
+                    continue
+                version, valores = nuevo
+                yield evento_sse(valores, evento='kpis', id=version)
+        finally:
+            difusor_kpis.desconectar()
+
+    return Response(eventos(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.cli.command('recalcular_kpis')
+def recalcular_kpis_comando():
+    """Recalcula los indicadores de hoy y el saldo abierto desde pagos, matrículas y deudas.
+
+    Solo hace falta si se modificaron datos por fuera de la aplicación.
+    """
+    kpis, deudas, pagos, matriculas = (KpiDiario.__table__, Deuda.__table__, Pago.__table__, Matricula.__table__)
+    hoy = datetime.utcnow().date()
+    desde = datetime.combine(hoy, datetime.min.time())
+    por_sede = lambda consulta: {fila[0]: fila[1:] for fila in conexion.execute(consulta)}
+    for _, motor in motores_por_sede():
+        with motor.begin() as conexion:
+            saldos = por_sede(db.select(deudas.c.sede_id, db.func.sum(deudas.c.saldo_pendiente))
+                              .group_by(deudas.c.sede_id))
+            de_hoy = por_sede(db.select(pagos.c.sede_id, db.func.count(), db.func.sum(pagos.c.valor))
+                              .where(pagos.c.fecha >= desde).group_by(pagos.c.sede_id))
+            nuevas = por_sede(db.select(matriculas.c.sede_id, db.func.count())
+                              .where(matriculas.c.fecha >= desde).group_by(matriculas.c.sede_id))
+            # el saldo abierto es la suma de las variaciones de todos los días
+            anteriores = por_sede(db.select(kpis.c.sede_id, db.func.sum(kpis.c.saldo))
+                                  .where(kpis.c.dia != hoy).group_by(kpis.c.sede_id))
+            conexion.execute(kpis.delete().where(kpis.c.dia == hoy))
+            filas = [{'sede_id': sede_id, 'dia': hoy,
+                      'pagos': de_hoy.get(sede_id, (0, 0))[0], 'recaudado': de_hoy.get(sede_id, (0, 0))[1] or 0.0,
+                      'matriculas': nuevas.get(sede_id, (0,))[0],
+                      'saldo': (saldos.get(sede_id, (0,))[0] or 0.0) - (anteriores.get(sede_id, (0,))[0] or 0.0)}
+                     for sede_id in sorted(set(saldos) | set(de_hoy) | set(nuevas) | set(anteriores))]
+            if filas:
+                conexion.execute(kpis.insert(), filas)
+        click.echo(f"✅ {motor.url.render_as_string()}: indicadores de {len(filas)} sede(s) recalculados")
+
+
+# --- Listas de curso del docente ---
+# lista de estudiantes por curso; se recalcula solo cuando cambian las matrículas del curso
+cache_listas = CacheVersionada(maximo=int(os.environ.get('CACHE_LISTAS_MAXIMO', 500)))
+
+def listas_de_cursos(cursos):
+    """Devuelve ``{curso_id: [estudiante, ...]}`` con estado de pago, en un número fijo de consultas.
+
+    1) versión de matrículas por curso, 2) estudiantes de los cursos cuya lista no
+    está en cache, 3) saldo abierto agregado por estudiante.
+    """
+    ids = [c.id for c in cursos]
+    if not ids:
+        return {}
+    sede_de = {c.id: c.sede_id for c in cursos}  # los ids de curso se repiten entre bases de sedes separadas
+    versiones = {curso_id: (total, str(ultima), ultimo_id) for curso_id, total, ultima, ultimo_id in
+                 db.session.query(Matricula.curso_id, db.func.count(Matricula.id),
+                                  db.func.max(Matricula.fecha), db.func.max(Matricula.id))
+                 .filter(Matricula.curso_id.in_(ids)).group_by(Matricula.curso_id)}
+
+    listas, faltantes = {}, []
+    for curso_id in ids:
+        version = versiones.get(curso_id, (0, None, None))
+        lista = cache_listas.obtener((sede_de[curso_id], curso_id), version)
+        if lista is None:
+            faltantes.append(curso_id)
+        else:
+            listas[curso_id] = lista
+
+    if faltantes:
+        nuevas = {curso_id: [] for curso_id in faltantes}
+        filas = (db.session.query(Matricula.curso_id, Matricula.fecha, Estudiante.id, Estudiante.nombre,
+                                  Estudiante.documento, Estudiante.telefono, Estudiante.activo)
+                 .join(Estudiante, Matricula.estudiante_id == Estudiante.id)
+                 .filter(Matricula.curso_id.in_(faltantes))
+                 .order_by(Estudiante.nombre))
+        for curso_id, fecha, est_id, nombre, documento, telefono, activo in filas:
+            nuevas[curso_id].append({'id': est_id, 'nombre': nombre, 'documento': documento,
+                                     'telefono': telefono, 'activo': activo, 'matriculado': fecha})
+        for curso_id, lista in nuevas.items():
+            cache_listas.guardar((sede_de[curso_id], curso_id), versiones.get(curso_id, (0, None, None)), lista)
+        listas.update(nuevas)
+
+    # el estado de pago cambia con cada pago: siempre fresco, en una sola consulta agregada
+    estudiantes = db.session.query(Matricula.estudiante_id).filter(Matricula.curso_id.in_(ids))
+    saldos = {est_id: (deudas, saldo) for est_id, deudas, saldo in
+              db.session.query(Deuda.estudiante_id, db.func.count(Deuda.id), db.func.sum(Deuda.saldo_pendiente))
+              .filter(Deuda.saldo_pendiente > 0, Deuda.estudiante_id.in_(estudiantes))
+              .group_by(Deuda.estudiante_id)}
+
+    return {curso_id: [dict(e, deudas_abiertas=saldos.get(e['id'], (0, 0.0))[0],
+                            saldo_pendiente=saldos.get(e['id'], (0, 0.0))[1] or 0.0) for e in lista]
+            for curso_id, lista in listas.items()}
 
 @app.route('/docente_dashboard')
 @login_required
+@solo_lectura
 def docente_dashboard():
     if current_user.role != 'docente':
         abort(403)
-    return render_template('dashboard_docente.html')
+    docente = current_user.docente
+    cursos = Curso.query.filter_by(docente_id=docente.id).order_by(Curso.nombre).all() if docente else []
+    return render_template('dashboard_docente.html', docente=docente, cursos=cursos,
+                           listas=listas_de_cursos(cursos))
+
+@app.route('/docente/curso/<int:curso_id>/lista.csv')
+@login_required
+@solo_lectura
+def exportar_lista_curso(curso_id):
+    curso = Curso.query.get_or_404(curso_id)
+    docente = current_user.docente if current_user.role == 'docente' else None
+    if current_user.role != 'admin' and (docente is None or curso.docente_id != docente.id):
+        abort(403)
 
+    salida = StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['Nombre', 'Documento', 'Teléfono', 'Activo', 'Fecha matrícula', 'Deudas abiertas', 'Saldo pendiente'])
+    for e in listas_de_cursos([curso])[curso.id]:
+        escritor.writerow([e['nombre'], e['documento'], e['telefono'] or '', 'Sí' if e['activo'] else 'No',
+                           e['matriculado'].strftime('%Y-%m-%d') if e['matriculado'] else '',
+                           e['deudas_abiertas'], f"{e['saldo_pendiente']:.2f}"])
+    nombre = secure_filename(f"lista_{curso.nombre}.csv") or f"lista_{curso.id}.csv"
+    return Response(salida.getvalue().encode('utf-8-sig'), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={nombre}'})
+
+
+# --- Panel del estudiante ---
+def _arreglo_json(dialecto, consulta, *orden):
+    """Subconsulta escalar con las filas de ``consulta`` como un arreglo JSON de arreglos, en ``orden``."""
+    sub = (consulta.add_columns(db.func.row_number().over(order_by=orden).label('n'))
+           .order_by(*orden).subquery())
+    valores = [c for c in sub.c if c.name != 'n']
+    if dialecto == 'postgresql':
+        return db.select(db.func.json_agg(postgresql.aggregate_order_by(
+            db.func.json_build_array(*valores), sub.c.n))).scalar_subquery()
+    # SQLite agrega en el orden en que la subconsulta entrega las filas
+    return db.select(db.func.json_group_array(db.func.json_array(*valores))).scalar_subquery()
+
+def filas_json(valor, campos):
+    """Filas de una columna de _arreglo_json como objetos con ``campos`` (``fecha`` como datetime)."""
+    filas = valor if isinstance(valor, list) else json.loads(valor or '[]')  # psycopg2 ya decodifica json
+    resultado = []
+    for fila in filas:
+        datos = dict(zip(campos, fila))
+        if datos.get('fecha'):
+            # SQLite guarda 'YYYY-MM-DD HH:MM:SS.ffffff' y PostgreSQL entrega 'YYYY-MM-DDTHH:MM:SS...'
+            datos['fecha'] = datetime.fromisoformat(datos['fecha'][:19])
+        resultado.append(SimpleNamespace(**datos))
+    return resultado
+
+def resumen_estudiante(estudiante_id, pagos_recientes=10):
+    """Fila única con los totales del estudiante, su último pago y las listas del panel.
+
+    Cada parte es una subconsulta escalar sobre un índice por ``estudiante_id``;
+    el último pago se resuelve con ``ORDER BY fecha DESC LIMIT 1``. Matrículas,
+    deudas abiertas y pagos recientes vienen como arreglos JSON (ver filas_json):
+    el panel se arma con esta sola consulta.
+    """
+    def escalar(columna, *filtros):
+        return db.select(columna).where(*filtros).scalar_subquery()
+
+    dialecto = db.session.get_bind(mapper=Estudiante.__mapper__).dialect.name
+    ultimo_id = (db.select(Pago.id).where(Pago.estudiante_id == estudiante_id)
+                 .order_by(Pago.fecha.desc(), Pago.id.desc()).limit(1).scalar_subquery())
+    abiertas = (Deuda.estudiante_id == estudiante_id, Deuda.saldo_pendiente > 0)
+    fila = (db.session.query(
+                Estudiante.nombre, Estudiante.activo,
+                escalar(db.func.count(Matricula.id), Matricula.estudiante_id == estudiante_id).label('matriculas'),
+                escalar(db.func.max(Matricula.id), Matricula.estudiante_id == estudiante_id).label('ultima_matricula'),
+                escalar(db.func.count(Deuda.id), *abiertas).label('deudas_abiertas'),
+                escalar(db.func.sum(Deuda.saldo_pendiente), *abiertas).label('saldo_pendiente'),
+                escalar(db.func.max(Deuda.id), Deuda.estudiante_id == estudiante_id).label('ultima_deuda'),
+                escalar(db.func.count(Pago.id), Pago.estudiante_id == estudiante_id).label('pagos'),
+                Pago.id.label('ultimo_pago_id'), Pago.valor.label('ultimo_pago_valor'),
+                Pago.fecha.label('ultimo_pago_fecha'),
+                _arreglo_json(dialecto, db.select(Matricula.fecha, Curso.nombre)
+                              .join(Curso, Matricula.curso_id == Curso.id)
+                              .where(Matricula.estudiante_id == estudiante_id),
+                              Matricula.fecha.desc(), Matricula.id.desc()).label('lista_matriculas'),
+                _arreglo_json(dialecto, db.select(Deuda.id, Deuda.concepto, Deuda.monto_total, Deuda.saldo_pendiente)
+                              .where(*abiertas), Deuda.id).label('lista_deudas'),
+                _arreglo_json(dialecto, db.select(Pago.fecha, Pago.valor, Pago.metodo)
+                              .where(Pago.estudiante_id == estudiante_id).limit(pagos_recientes),
+                              Pago.fecha.desc(), Pago.id.desc()).label('lista_pagos'))
+            .outerjoin(Pago, Pago.id == ultimo_id)
+            .filter(Estudiante.id == estudiante_id)
+            .one_or_none())
+    return fila
+
+def etag_resumen(fila):
+    """Cambia con cualquier matrícula, deuda o pago nuevo del estudiante (o un saldo distinto)."""
+    return hashlib.sha1(repr(tuple(fila)).encode()).hexdigest()
 
 @app.route('/estudiante_dashboard')
 @login_required
+@solo_lectura
 def estudiante_dashboard():
     if current_user.role != 'estudiante':
         abort(403)
-    return render_template('dashboard_estudiante.html')
+    estudiante = current_user.estudiante
+    if estudiante is None:
+        return render_template('dashboard_estudiante.html', estudiante=None)
+
+    resumen = resumen_estudiante(estudiante.id)
+    etag = etag_resumen(resumen)
+    # con mensajes flash pendientes hay que renderizar para mostrarlos
+    if request.if_none_match.contains(etag) and not session.get('_flashes'):
+        respuesta = Response(status=304)
+    else:
+        respuesta = make_response(render_template(
+            'dashboard_estudiante.html', estudiante=estudiante, resumen=resumen,
+            matriculas=filas_json(resumen.lista_matriculas, ('fecha', 'nombre')),
+            deudas=filas_json(resumen.lista_deudas, ('id', 'concepto', 'monto_total', 'saldo_pendiente')),
+            pagos=filas_json(resumen.lista_pagos, ('fecha', 'valor', 'metodo'))))
+    respuesta.set_etag(etag)
+    # privado: es información de un solo usuario, el navegador debe revalidar siempre
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
 
 
 # --- MAIN ---
@@ -0,0 +1,102 @@
+"""Archivo de deudas saldadas y pagos antiguos.
+
+Mueve filas de las tablas "calientes" (``deuda``, ``pago``, ``cuota``,
+``intencion_pago``) a sus tablas de archivo (``deuda_archivo``, ...) por lotes: cada lote es un ``INSERT ... SELECT`` seguido de un ``DELETE`` en
+la misma transacción, de modo que una interrupción deja el lote completo o
+sin aplicar. Como las filas movidas desaparecen del origen, volver a
+ejecutar el proceso continúa donde quedó; el cursor (último id revisado)
+solo evita volver a recorrer filas que no cumplen la condición.
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, exists, literal, or_, select
+
+
+def mover_filas(conexion, origen, destino, ids, archivado_en):
+    """Copia las filas ``ids`` de ``origen`` a ``destino`` y las borra del origen."""
+    columnas = [c.name for c in origen.c]
+    seleccion = (select(*[origen.c[n] for n in columnas], literal(archivado_en, destino.c.archivado_en.type))
+                 .where(origen.c.id.in_(ids)))
+    conexion.execute(destino.insert().from_select(columnas + ['archivado_en'], seleccion))
+    return conexion.execute(origen.delete().where(origen.c.id.in_(ids))).rowcount
+
+
+def deudas_archivables(deudas, pagos, corte, desde_id, lote, intenciones=None):
+    """Deudas saldadas, creadas antes de ``corte`` y sin pagos posteriores (keyset por id).
+
+    Una deuda sin fecha (anterior a la columna, aún sin completar) no se archiva,
+    ni una con una intención de pago en línea abierta y reciente: el pago aún puede llegar.
+    """
+    pago_reciente = exists().where(and_(
+        pagos.c.deuda_id == deudas.c.id,
+        or_(pagos.c.fecha >= corte, pagos.c.fecha.is_(None)),
+    ))
+    condiciones = [deudas.c.id > desde_id, deudas.c.saldo_pendiente <= 0.0001, deudas.c.fecha < corte,
+                   ~pago_reciente]
+    if intenciones is not None:
+        condiciones.append(~exists().where(and_(
+            intenciones.c.deuda_id == deudas.c.id, intenciones.c.estado == 'creada',
+            or_(intenciones.c.fecha >= corte, intenciones.c.fecha.is_(None)),
+        )))
+    return (select(deudas.c.id)
+            .where(*condiciones)
+            .order_by(deudas.c.id)
+            .limit(lote))
+
+
+def pagos_archivables(pagos, corte, desde_id, lote):
+    return (select(pagos.c.id)
+            .where(pagos.c.id > desde_id, pagos.c.fecha < corte)
+            .order_by(pagos.c.id)
+            .limit(lote))
+
+
+def archivar(sesion, tablas, corte, lote=1000, pausa=0.0, cursores=None, ahora=None):
+    """Archiva por lotes y genera ``(fase, ultimo_id, movidas)`` tras cada commit.
+
+    ``tablas`` es un dict con ``deuda``, ``pago``, ``deuda_archivo`` y
+    ``pago_archivo`` (y opcionalmente ``cuota``, ``intencion_pago`` y sus
+    tablas de archivo, que se mueven junto con su deuda); ``cursores`` permite retomar desde el último id revisado
+    de cada fase (``{'deudas': id, 'pagos': id}``). ``pausa`` son segundos de
+    espera entre lotes para no acaparar la base de datos.
+    """
+    deudas, pagos = tablas['deuda'], tablas['pago']
+    cursores = dict(cursores or {})
+    ahora = ahora or datetime.utcnow()
+
+    # 1) deudas saldadas con todos sus pagos
+    ultimo = cursores.get('deudas', 0)
+    while True:
+        ids = list(sesion.execute(deudas_archivables(deudas, pagos, corte, ultimo, lote,
+                                                     tablas.get('intencion_pago'))).scalars())
+        if not ids:
+            break
+        conexion = sesion.connection()
+        # las filas que apuntan a la deuda se mueven antes que ella (claves foráneas)
+        for nombre in ('pago', 'cuota', 'intencion_pago'):
+            if nombre not in tablas:
+                continue
+            tabla = tablas[nombre]
+            hijas = list(sesion.execute(select(tabla.c.id).where(tabla.c.deuda_id.in_(ids))).scalars())
+            if hijas:
+                mover_filas(conexion, tabla, tablas[f'{nombre}_archivo'], hijas, ahora)
+        movidas = mover_filas(conexion, deudas, tablas['deuda_archivo'], ids, ahora)
+        sesion.commit()
+        ultimo = ids[-1]
+        yield 'deudas', ultimo, movidas
+        if pausa:
+            time.sleep(pausa)
+
+    # 2) pagos antiguos de deudas que siguen abiertas (o sin deuda)
+    ultimo = cursores.get('pagos', 0)
+    while True:
+        ids = list(sesion.execute(pagos_archivables(pagos, corte, ultimo, lote)).scalars())
+        if not ids:
+            break
+        movidas = mover_filas(sesion.connection(), pagos, tablas['pago_archivo'], ids, ahora)
+        sesion.commit()
+        ultimo = ids[-1]
+        yield 'pagos', ultimo, movidas
+        if pausa:
+            time.sleep(pausa)
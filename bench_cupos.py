@@ -0,0 +1,108 @@
+"""Prueba de carga de cupos: cientos de matrículas concurrentes a un curso.
+
+Levanta la aplicación en un servidor con hilos sobre una base de datos de
+prueba, crea un curso con ``--cupo`` plazas y lanza ``--solicitudes`` POST
+concurrentes a ``/enrollment`` (cada uno con un documento distinto). Luego
+verifica que:
+
+- nunca hay más matrículas que cupo y ``curso.ocupados`` coincide con ellas;
+- el resto quedó en lista de espera, sin duplicados;
+- al cancelar matrículas se promueve a los primeros de la lista, en orden.
+
+Uso:
+    python bench_cupos.py [--solicitudes 300] [--cupo 40] [--hilos 64] [--cancelar 5]
+    python bench_cupos.py --database-url postgresql://.../prueba   # base desechable
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--solicitudes', type=int, default=300)
+    parser.add_argument('--cupo', type=int, default=40)
+    parser.add_argument('--hilos', type=int, default=64)
+    parser.add_argument('--cancelar', type=int, default=5)
+    parser.add_argument('--database-url', help="base de datos desechable (se borran sus tablas)")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        ruta = os.path.join(tempfile.mkdtemp(), 'cupos.db')
+        os.environ['DATABASE_URL'] = f"sqlite:///{ruta}"
+    os.environ['RATELIMIT_ENABLED'] = '0'
+
+    import requests
+    from werkzeug.serving import make_server
+
+    from app import app, db, Curso, ListaEspera, Matricula, Sede, cancelar_matricula
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Sede(id=1, nombre='Principal'))
+        curso = Curso(nombre='Curso de prueba', precio=100, cupo=args.cupo, sede_id=1)
+        db.session.add(curso)
+        db.session.commit()
+        curso_id = curso.id
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    servidor = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_port}/enrollment"
+
+    def matricular(i):
+        respuesta = requests.post(url, data={'nombre': f"Estudiante {i}", 'documento': f"C{i:06d}",
+                                             'curso_id': curso_id, 'telefono': ''},
+                                  allow_redirects=False, timeout=60)
+        return respuesta.status_code
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(args.hilos) as pool:
+        estados = list(pool.map(matricular, range(args.solicitudes)))
+    duracion = time.perf_counter() - inicio
+    servidor.shutdown()
+
+    fallidas = sum(1 for e in estados if e >= 400)
+    print(f"{args.solicitudes} solicitudes en {duracion:.2f}s "
+          f"({args.solicitudes / duracion:.0f}/s, {fallidas} con error)")
+
+    with app.app_context():
+        curso = db.session.get(Curso, curso_id)
+        matriculas = Matricula.query.filter_by(curso_id=curso_id).count()
+        espera = ListaEspera.query.filter_by(curso_id=curso_id).order_by(ListaEspera.id).all()
+        print(f"cupo={curso.cupo} ocupados={curso.ocupados} matrículas={matriculas} en espera={len(espera)}")
+        errores = []
+        if matriculas > curso.cupo:
+            errores.append("sobrecupo")
+        if curso.ocupados != matriculas:
+            errores.append("ocupados no coincide con las matrículas")
+        if matriculas + len(espera) != args.solicitudes - fallidas:
+            errores.append("hay solicitudes que no quedaron ni matriculadas ni en espera")
+
+        # cancelar y comprobar que entran los primeros de la lista, en orden
+        esperados = [e.estudiante_id for e in espera[:args.cancelar]]
+        promovidos = []
+        for matricula in Matricula.query.filter_by(curso_id=curso_id).order_by(Matricula.id).limit(args.cancelar).all():
+            promovidos += [m.estudiante_id for m in cancelar_matricula(matricula)]
+            db.session.commit()
+        if promovidos != esperados:
+            errores.append(f"promoción fuera de orden: {promovidos} != {esperados}")
+        db.session.expire_all()
+        if db.session.get(Curso, curso_id).ocupados != Matricula.query.filter_by(curso_id=curso_id).count():
+            errores.append("ocupados no coincide tras cancelar")
+        print(f"canceladas={args.cancelar} promovidas={len(promovidos)}")
+
+    if errores:
+        raise SystemExit("FALLÓ: " + "; ".join(errores))
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
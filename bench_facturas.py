@@ -0,0 +1,115 @@
+"""Microbenchmark de generación de facturas (facturas por segundo).
+
+Compara, con la misma configuración de ReportLab en todos los casos:
+
+- ``original``: el render de ``registrar_pago`` antes de la plantilla (layout mínimo);
+- ``antes``: el layout completo dibujado con ReportLab en un canvas nuevo por pago;
+- ``plantilla``: ``PlantillaFactura.render`` (página fija pre-renderizada + campos del pago).
+
+Uso:
+    python bench_facturas.py [-n 2000] [--logo static/logo.png]
+"""
+import argparse
+import time
+from datetime import datetime
+from io import BytesIO
+from types import SimpleNamespace
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from facturas import PlantillaFactura, _COLUMNAS_ITEMS, _INTERLINEA, _X_VALOR, _Y_DATOS, _Y_ITEMS, _moneda
+
+INSTITUCION = {
+    'nombre': 'Proyecto Educativo',
+    'nit': '900.123.456-7',
+    'direccion': 'Calle 10 # 20-30',
+    'telefono': '300 000 0000',
+}
+
+
+def datos_ejemplo(i):
+    estudiante = SimpleNamespace(nombre=f"Estudiante {i}", documento=f"10{i:08d}")
+    deuda = SimpleNamespace(concepto="Matrícula curso Python", monto_total=500000.0,
+                            saldo_pendiente=250000.0, estudiante=estudiante)
+    pago = SimpleNamespace(id=i, fecha=datetime(2025, 10, 1, 9, 30), metodo="Efectivo", valor=125000.0)
+    return pago, deuda, estudiante
+
+
+def factura_original(pago, deuda, est):
+    """Render original de ``registrar_pago`` (layout mínimo, como referencia)."""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(300, 760, "Factura de Pago - Proyecto Educativo")
+    c.setFont("Helvetica", 11)
+    c.drawString(50, 720, f"Factura ID: {pago.id}")
+    c.drawString(50, 700, f"Fecha: {pago.fecha.strftime('%Y-%m-%d %H:%M:%S')}")
+    c.drawString(50, 680, f"Nombre: {est.nombre}")
+    c.drawString(50, 660, f"Documento: {est.documento}")
+    c.drawString(50, 640, f"Concepto deuda: {deuda.concepto}")
+    c.drawString(50, 620, f"Método de pago: {pago.metodo}")
+    c.drawString(50, 600, f"Valor pagado: ${pago.valor:,.2f}")
+    c.drawString(50, 580, f"Saldo pendiente deuda: ${deuda.saldo_pendiente:,.2f}")
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def factura_antes(plantilla, pago, deuda, est):
+    """El mismo layout completo que la plantilla, dibujado entero con ReportLab en cada pago."""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    plantilla._dibujar_fija(c)
+    texto = c.beginText(_X_VALOR, _Y_DATOS)
+    texto.setFont("Helvetica", 11)
+    texto.setLeading(_INTERLINEA)
+    for linea in (str(pago.id), pago.fecha.strftime('%Y-%m-%d %H:%M:%S'), est.nombre, est.documento, pago.metodo):
+        texto.textLine(linea)
+    c.drawText(texto)
+    abonado = max(0.0, deuda.monto_total - deuda.saldo_pendiente - pago.valor)
+    c.setFont("Helvetica", 10)
+    for (_, x), valor in zip(_COLUMNAS_ITEMS, (deuda.concepto[:45], _moneda(deuda.monto_total),
+                                                 _moneda(abonado), _moneda(pago.valor))):
+        c.drawString(x, _Y_ITEMS - 24, valor)
+    c.setFont("Helvetica", 11)
+    c.drawString(_X_VALOR + 30, _Y_ITEMS - 100, _moneda(deuda.saldo_pendiente))
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def medir(nombre, n, funcion):
+    inicio = time.perf_counter()
+    funcion()
+    duracion = time.perf_counter() - inicio
+    print(f"{nombre:<38} {n / duracion:>10.1f} facturas/s  ({duracion * 1000 / n:.3f} ms/factura)")
+    return n / duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=2000, help="número de facturas")
+    parser.add_argument('--logo', help="imagen de logo para incluir en la factura")
+    args = parser.parse_args()
+
+    items = [datos_ejemplo(i) for i in range(1, args.n + 1)]
+    plantilla = PlantillaFactura(institucion=INSTITUCION, logo=args.logo)
+
+    # calentamiento (fuentes, caches internos de ReportLab)
+    factura_original(*items[0])
+    factura_antes(plantilla, *items[0])
+    plantilla.render(*items[0])
+
+    original = medir("original (layout mínimo, referencia)", args.n,
+                     lambda: [factura_original(*item) for item in items])
+    antes = medir("antes (layout completo por pago)", args.n,
+                  lambda: [factura_antes(plantilla, *item) for item in items])
+    despues = medir("plantilla (página fija + campos)", args.n,
+                    lambda: [plantilla.render(*item) for item in items])
+
+    print(f"\nplantilla vs layout completo: x{despues / antes:.1f}   vs original mínimo: x{despues / original:.1f}")
+
+
+if __name__ == '__main__':
+    main()
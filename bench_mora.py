@@ -0,0 +1,109 @@
+"""Benchmark del proceso nocturno de recargos por mora (``flask recargos_mora``).
+
+Crea ``--deudas`` deudas con ``--cuotas`` cuotas mensuales cada una (por
+defecto 100.000 × 5 = 500.000 cuotas) con vencimientos repartidos en el
+último año, ejecuta el proceso y verifica que:
+
+- el saldo de cada deuda sigue siendo la suma de los saldos de sus cuotas;
+- una segunda ejecución el mismo día no cobra nada (idempotencia).
+
+Uso:
+    python bench_mora.py [--deudas 100000] [--cuotas 5] [--lote 5000]
+    python bench_mora.py --database-url postgresql://.../prueba   # base desechable
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+
+def preparar_base(deudas, cuotas):
+    from app import app, db, Cuota, Deuda, Estudiante, Sede
+    from cuotas import plan_de_cuotas
+
+    hoy = date.today()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Sede(id=1, nombre='Principal'))
+        db.session.commit()
+        with db.engine.begin() as conexion:
+            conexion.execute(Estudiante.__table__.insert(),
+                             [{'id': i, 'nombre': f"Estudiante {i}", 'documento': f"M{i:07d}", 'activo': True,
+                               'sede_id': 1} for i in range(1, deudas + 1)])
+            monto = 120000.0
+            conexion.execute(Deuda.__table__.insert(),
+                             [{'id': i, 'estudiante_id': i, 'concepto': 'Semestre', 'monto_total': monto,
+                               'saldo_pendiente': monto, 'sede_id': 1} for i in range(1, deudas + 1)])
+            filas = []
+            for i in range(1, deudas + 1):
+                primer_vencimiento = hoy - timedelta(days=random.randrange(365))
+                filas += [{'deuda_id': i, 'numero': n, 'vencimiento': vencimiento, 'monto': valor, 'saldo': valor,
+                           'recargo': 0.0, 'sede_id': 1}
+                          for n, vencimiento, valor in plan_de_cuotas(monto, cuotas, primer_vencimiento)]
+                if len(filas) >= 50000:
+                    conexion.execute(Cuota.__table__.insert(), filas)
+                    filas = []
+            if filas:
+                conexion.execute(Cuota.__table__.insert(), filas)
+            db.session.commit()
+
+
+def totales():
+    from app import app, db, Cuota, Deuda
+
+    with app.app_context():
+        deudas = db.session.execute(db.select(db.func.sum(Deuda.saldo_pendiente))).scalar()
+        cuotas = db.session.execute(db.select(db.func.sum(Cuota.saldo))).scalar()
+        vencidas = db.session.execute(db.select(db.func.count()).where(Cuota.recargo > 0)).scalar()
+        # deudas cuyo saldo no coincide con sus cuotas (al centavo)
+        suma = db.select(Cuota.deuda_id, db.func.sum(Cuota.saldo).label('saldo')).group_by(Cuota.deuda_id).subquery()
+        descuadradas = db.session.execute(
+            db.select(db.func.count()).select_from(Deuda).join(suma, suma.c.deuda_id == Deuda.id)
+            .where(db.func.abs(Deuda.saldo_pendiente - suma.c.saldo) > 0.005)).scalar()
+        return deudas, cuotas, vencidas, descuadradas
+
+
+def ejecutar(lote):
+    from app import app
+
+    inicio = time.perf_counter()
+    resultado = app.test_cli_runner().invoke(args=['recargos_mora', '--lote', str(lote)])
+    if resultado.exit_code != 0:
+        raise SystemExit(resultado.output or repr(resultado.exception))
+    return time.perf_counter() - inicio, resultado.output.strip().splitlines()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--deudas', type=int, default=100000)
+    parser.add_argument('--cuotas', type=int, default=5)
+    parser.add_argument('--lote', type=int, default=5000)
+    parser.add_argument('--database-url', help="base de datos desechable (se borran sus tablas)")
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'mora.db')}"
+    random.seed(42)
+    inicio = time.perf_counter()
+    preparar_base(args.deudas, args.cuotas)
+    print(f"{args.deudas:,} deudas × {args.cuotas} cuotas preparadas en {time.perf_counter() - inicio:.1f}s")
+
+    segundos, resumen = ejecutar(args.lote)
+    print(f"primera ejecución: {segundos:.1f}s — {resumen}")
+    deudas, cuotas, vencidas, descuadradas = totales()
+    print(f"saldo deudas ${deudas:,.2f} · saldo cuotas ${cuotas:,.2f} · {vencidas:,} cuotas con recargo · "
+          f"{descuadradas} deudas descuadradas")
+
+    segundos, resumen = ejecutar(args.lote)
+    print(f"segunda ejecución (mismo día): {segundos:.1f}s — {resumen}")
+    repetido = totales()
+    ok = descuadradas == 0 and abs(deudas - cuotas) < 0.01 * args.deudas and repetido[:3] == (deudas, cuotas, vencidas)
+    print("✅ saldos cuadrados e idempotente" if ok else "❌ verificación fallida")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
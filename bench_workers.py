@@ -0,0 +1,203 @@
+"""Benchmark de modelos de worker de gunicorn (sync, gthread, gevent).
+
+Levanta gunicorn con ``gunicorn.conf.py`` una vez por modelo sobre la misma
+base de datos de prueba y una pasarela simulada con demora, y lanza
+``--clientes`` usuarios concurrentes durante ``--segundos`` con una mezcla
+de las rutas principales:
+
+- ``consulta``: búsqueda de estudiante por documento (lectura liviana);
+- ``admin``: panel de gestión (la página más pesada);
+- ``factura``: registrar un pago y descargar la factura PDF (escritura + CPU);
+- ``pasarela``: iniciar un pago en línea (espera a la pasarela externa).
+
+Informa solicitudes por segundo y latencias p50/p95/p99 por modelo y por ruta.
+
+Uso:
+    python bench_workers.py [--modelos sync,gthread,gevent] [--segundos 15] [--clientes 32]
+                            [--latencia-pasarela 0.3] [--workers N] [--hilos N]
+    python bench_workers.py --database-url postgresql://.../prueba   # base desechable
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+MEZCLA = (('consulta', 5), ('factura', 2), ('pasarela', 2), ('admin', 1))
+ESTUDIANTES = 500
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def preparar_base():
+    from werkzeug.security import generate_password_hash
+
+    from app import app, db, Curso, Deuda, Estudiante, Pago, Sede, Usuario
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Sede(id=1, nombre='Principal'))
+        db.session.add(Usuario(username='bench', password=generate_password_hash('bench'), role='admin'))
+        for i in range(10):
+            db.session.add(Curso(nombre=f"Curso {i}", precio=100000, sede_id=1))
+        for i in range(ESTUDIANTES):
+            estudiante = Estudiante(nombre=f"Estudiante {i}", documento=f"B{i:06d}", telefono='', sede_id=1)
+            db.session.add(estudiante)
+            db.session.flush()
+            # saldo grande: cada cliente paga muchas veces la misma deuda sin agotarla
+            deuda = Deuda(estudiante_id=estudiante.id, concepto='Matrícula', monto_total=1e9,
+                          saldo_pendiente=1e9, sede_id=1)
+            db.session.add(deuda)
+            db.session.flush()
+            db.session.add(Pago(estudiante_id=estudiante.id, deuda_id=deuda.id, valor=1000, metodo='Efectivo',
+                                sede_id=1))
+        db.session.commit()
+        return [d.id for d in Deuda.query.order_by(Deuda.id)]
+
+
+def levantar_pasarela(latencia):
+    from mock_pasarela import Pasarela, crear_manejador
+
+    pasarela = Pasarela('http://127.0.0.1:9/sin-webhook', 'secreto_bench', 'prv_bench', latencia)
+    manejador = crear_manejador(pasarela)
+    manejador.log_message = lambda *args: None
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor.server_port
+
+
+def levantar_gunicorn(modelo, entorno, args):
+    import requests
+
+    puerto = puerto_libre()
+    entorno = dict(entorno, GUNICORN_WORKER_CLASS=modelo, PORT=str(puerto))
+    if args.workers:
+        entorno['WEB_CONCURRENCY'] = str(args.workers)
+    if args.hilos:
+        entorno['GUNICORN_THREADS'] = str(args.hilos)
+    proceso = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)), env=entorno,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    url = f"http://127.0.0.1:{puerto}"
+    fin = time.monotonic() + 30
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise SystemExit(f"gunicorn ({modelo}) no arrancó:\n{proceso.stderr.read().decode()[-2000:]}")
+        try:
+            requests.get(url + '/', timeout=5)
+            return proceso, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    proceso.kill()
+    raise SystemExit(f"gunicorn ({modelo}) no respondió en 30s")
+
+
+def cliente(url, deuda_id, fin, resultados):
+    import requests
+
+    http = requests.Session()
+    http.post(url + '/login', data={'username': 'bench', 'password': 'bench'}, timeout=30)
+    rutas = [ruta for ruta, peso in MEZCLA for _ in range(peso)]
+    while time.monotonic() < fin:
+        ruta = random.choice(rutas)
+        inicio = time.perf_counter()
+        try:
+            if ruta == 'consulta':
+                r = http.post(url + '/consulta', data={'documento': f"B{random.randrange(ESTUDIANTES):06d}"}, timeout=60)
+            elif ruta == 'admin':
+                r = http.get(url + '/admin', timeout=60)
+            elif ruta == 'factura':
+                r = http.post(f"{url}/registrar_pago/{deuda_id}", data={'valor': '1', 'metodo': 'Efectivo'}, timeout=60)
+            else:
+                r = http.post(url + '/pago_online', data={'deuda_id': deuda_id, 'valor': '1'},
+                              allow_redirects=False, timeout=60)
+            ok = r.status_code < 400
+        except requests.RequestException:
+            ok = False
+        resultados.append((ruta, time.perf_counter() - inicio, ok))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modelos', default='sync,gthread,gevent')
+    parser.add_argument('--segundos', type=float, default=15)
+    parser.add_argument('--clientes', type=int, default=32)
+    parser.add_argument('--latencia-pasarela', type=float, default=0.3)
+    parser.add_argument('--workers', type=int, help="WEB_CONCURRENCY (por defecto, según gunicorn.conf.py)")
+    parser.add_argument('--hilos', type=int, help="GUNICORN_THREADS para gthread")
+    parser.add_argument('--database-url', help="base de datos desechable (se borran sus tablas)")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'workers.db')}"
+    os.environ['RATELIMIT_ENABLED'] = '0'
+    deudas = preparar_base()
+    puerto_pasarela = levantar_pasarela(args.latencia_pasarela)
+    entorno = dict(os.environ,
+                   PASARELA_URL=f"http://127.0.0.1:{puerto_pasarela}/v1",
+                   PASARELA_CHECKOUT_URL=f"http://127.0.0.1:{puerto_pasarela}/l/",
+                   PASARELA_LLAVE_PRIVADA='prv_bench', PASARELA_SECRETO_EVENTOS='secreto_bench',
+                   RATELIMIT_DB=os.path.join(tempfile.mkdtemp(), 'limites.db'))
+
+    print(f"{args.clientes} clientes, {args.segundos:g}s por modelo, pasarela con {args.latencia_pasarela:g}s "
+          f"de demora, {os.cpu_count()} CPU")
+    resumen = {}
+    for modelo in args.modelos.split(','):
+        proceso, url = levantar_gunicorn(modelo, entorno, args)
+        resultados = []
+        try:
+            fin = time.monotonic() + args.segundos
+            with ThreadPoolExecutor(args.clientes) as pool:
+                for i in range(args.clientes):
+                    # una deuda por cliente: se mide el servidor, no bloqueos sobre la misma fila
+                    pool.submit(cliente, url, deudas[i % len(deudas)], fin, resultados)
+        finally:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+        resumen[modelo] = resultados
+
+        por_ruta = defaultdict(list)
+        for ruta, duracion, ok in resultados:
+            por_ruta[ruta].append(duracion)
+        errores = sum(1 for _, _, ok in resultados if not ok)
+        todas = [d for _, d, _ in resultados]
+        print(f"\n== {modelo}: {len(resultados) / args.segundos:,.1f} req/s, {errores} errores, "
+              f"p50 {percentil(todas, 50) * 1000:,.0f} ms, p95 {percentil(todas, 95) * 1000:,.0f} ms, "
+              f"p99 {percentil(todas, 99) * 1000:,.0f} ms")
+        for ruta, _ in MEZCLA:
+            duraciones = por_ruta.get(ruta, [])
+            print(f"   {ruta:<9} {len(duraciones):>6} req  p50 {percentil(duraciones, 50) * 1000:>7,.0f} ms"
+                  f"  p95 {percentil(duraciones, 95) * 1000:>7,.0f} ms  p99 {percentil(duraciones, 99) * 1000:>7,.0f} ms")
+
+    if len(resumen) > 1:
+        print("\nmodelo    req/s    p95 ms   p99 ms")
+        for modelo, resultados in resumen.items():
+            todas = [d for _, d, _ in resultados]
+            print(f"{modelo:<8} {len(resultados) / args.segundos:>6,.1f} {percentil(todas, 95) * 1000:>9,.0f}"
+                  f" {percentil(todas, 99) * 1000:>8,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Cache en memoria por proceso, con versión por clave.
+
+Cada entrada guarda la versión con la que se calculó (p. ej. el último
+cambio de matrículas de un curso); si la versión actual es otra, la entrada
+se considera vencida. Es seguro entre hilos y limita el tamaño con LRU.
+"""
+import threading
+from collections import OrderedDict
+
+_FALTA = object()
+
+
+class CacheVersionada:
+    def __init__(self, maximo=500):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, version, default=None):
+        with self._lock:
+            entrada = self._datos.get(clave, _FALTA)
+            if entrada is _FALTA or entrada[0] != version:
+                return default
+            self._datos.move_to_end(clave)
+            return entrada[1]
+
+    def guardar(self, clave, version, valor):
+        with self._lock:
+            self._datos[clave] = (version, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave=None):
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+
+    def __len__(self):
+        return len(self._datos)
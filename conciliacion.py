@@ -0,0 +1,195 @@
+"""Conciliación de extractos bancarios contra deudas abiertas.
+
+El extracto (CSV) se lee en streaming, línea por línea, y cada movimiento se
+busca en un índice en memoria construido con una sola consulta de las deudas
+con saldo pendiente. El índice se actualiza a medida que se aplican pagos,
+de modo que dos transferencias a la misma deuda dentro del mismo archivo no
+superan el saldo.
+
+Reglas de coincidencia, en orden:
+  1. La referencia contiene el número de deuda (``DEU-123``, ``Deuda 123``).
+  2. Documento + valor igual al saldo de exactamente una deuda.
+  3. Documento con una sola deuda abierta y valor menor o igual al saldo.
+Todo lo demás queda en revisión con el motivo.
+
+Cada línea lleva una huella para no importarla dos veces si se vuelve a
+cargar el mismo extracto. Dos movimientos idénticos en el mismo archivo
+(misma fecha, valor y referencia) son transferencias distintas: la segunda
+lleva el número de aparición en la huella.
+"""
+import csv
+import hashlib
+import re
+from collections import Counter, namedtuple
+
+LineaExtracto = namedtuple('LineaExtracto', 'numero fecha referencia documento valor descripcion huella')
+
+# nombres de columna aceptados (en minúsculas, sin tildes)
+_COLUMNAS = {
+    'fecha': ('fecha', 'date', 'fecha movimiento'),
+    'referencia': ('referencia', 'ref', 'reference', 'referencia 1'),
+    'documento': ('documento', 'doc', 'cedula', 'nit', 'identificacion', 'referencia 2'),
+    'valor': ('valor', 'monto', 'amount', 'credito', 'importe'),
+    'descripcion': ('descripcion', 'detalle', 'concepto', 'description'),
+}
+
+_RE_DEUDA = re.compile(r'DEU(?:DA)?\W*(\d+)', re.IGNORECASE)
+
+REVISION_SIN_COINCIDENCIA = 'Sin deuda que coincida'
+REVISION_VARIAS = 'Varias deudas posibles'
+REVISION_EXCEDE = 'Valor mayor al saldo pendiente'
+REVISION_VALOR = 'Valor inválido'
+
+
+class ErrorExtracto(ValueError):
+    pass
+
+
+def _normalizar(nombre):
+    nombre = (nombre or '').strip().lower()
+    for con, sin in (('á', 'a'), ('é', 'e'), ('í', 'i'), ('ó', 'o'), ('ú', 'u')):
+        nombre = nombre.replace(con, sin)
+    return nombre
+
+
+def parsear_valor(texto):
+    """Convierte ``'1.234,56'``, ``'1,234.56'``, ``'150.000'`` o ``'$ 1234'`` a float.
+
+    >>> parsear_valor('$ 150.000'), parsear_valor('1.500.000'), parsear_valor('150.5')
+    (150000.0, 1500000.0, 150.5)
+    >>> parsear_valor('1.234,56'), parsear_valor('1,234.56'), parsear_valor('150,000')
+    (1234.56, 1234.56, 150000.0)
+    """
+    texto = (texto or '').strip().replace('$', '').replace(' ', '')
+    if not texto:
+        raise ValueError('valor vacío')
+    if ',' in texto and '.' in texto:
+        if texto.rfind(',') > texto.rfind('.'):
+            texto = texto.replace('.', '').replace(',', '.')
+        else:
+            texto = texto.replace(',', '')
+    elif ',' in texto:
+        entero, _, decimales = texto.rpartition(',')
+        texto = f"{entero.replace(',', '')}.{decimales}" if len(decimales) <= 2 else texto.replace(',', '')
+    elif '.' in texto:
+        # sin coma: varios puntos, o uno seguido de exactamente 3 dígitos, son miles
+        if texto.count('.') > 1 or len(texto.rpartition('.')[2]) == 3:
+            texto = texto.replace('.', '')
+    return float(texto)
+
+
+def centavos(valor):
+    return int(round(valor * 100))
+
+
+def leer_extracto(archivo):
+    """Genera ``LineaExtracto`` a partir de un archivo de texto CSV (``,`` o ``;``)."""
+    muestra = archivo.readline()
+    if not muestra:
+        return
+    delimitador = ';' if muestra.count(';') > muestra.count(',') else ','
+    encabezado = [_normalizar(c) for c in next(csv.reader([muestra], delimiter=delimitador))]
+
+    posiciones = {}
+    for campo, alias in _COLUMNAS.items():
+        for i, nombre in enumerate(encabezado):
+            if nombre in alias:
+                posiciones[campo] = i
+                break
+    if 'valor' not in posiciones or not ({'referencia', 'documento'} & posiciones.keys()):
+        raise ErrorExtracto("El extracto debe tener columna de valor y de referencia o documento")
+
+    def celda(fila, campo):
+        i = posiciones.get(campo)
+        return fila[i].strip() if i is not None and i < len(fila) else ''
+
+    apariciones = Counter()
+    for numero, fila in enumerate(csv.reader(archivo, delimiter=delimitador), start=2):
+        if not fila or not any(fila):
+            continue
+        crudo = delimitador.join(fila)
+        apariciones[crudo] += 1
+        # la primera aparición conserva la huella de siempre: reimportar extractos viejos sigue detectándose
+        if apariciones[crudo] > 1:
+            crudo += f"#{apariciones[crudo]}"
+        try:
+            valor = parsear_valor(celda(fila, 'valor'))
+        except ValueError:
+            valor = None
+        yield LineaExtracto(
+            numero=numero,
+            fecha=celda(fila, 'fecha'),
+            referencia=celda(fila, 'referencia'),
+            documento=celda(fila, 'documento'),
+            valor=valor,
+            descripcion=celda(fila, 'descripcion'),
+            huella='BANCO:' + hashlib.sha1(crudo.encode('utf-8')).hexdigest(),
+        )
+
+
+class IndiceDeudas:
+    """Índice hash de deudas abiertas por id, documento y (documento, valor).
+
+    ``filas`` son tuplas ``(deuda_id, estudiante_id, saldo_pendiente, documento)``.
+    Cada deuda se guarda como una lista mutable ``[id, estudiante_id, saldo, documento]``
+    compartida por los tres diccionarios.
+    """
+
+    def __init__(self, filas):
+        self.por_id = {}
+        self.por_documento = {}
+        self.por_documento_valor = {}
+        for deuda_id, estudiante_id, saldo, documento in filas:
+            deuda = [deuda_id, estudiante_id, saldo, documento]
+            self.por_id[deuda_id] = deuda
+            self.por_documento.setdefault(documento, []).append(deuda)
+            self.por_documento_valor.setdefault((documento, centavos(saldo)), []).append(deuda)
+
+    def __len__(self):
+        return len(self.por_id)
+
+    def buscar(self, linea):
+        """Devuelve ``(deuda, None)`` o ``(None, motivo)``."""
+        if linea.valor is None or linea.valor <= 0:
+            return None, REVISION_VALOR
+
+        for texto in (linea.referencia, linea.descripcion):
+            encontrado = _RE_DEUDA.search(texto or '')
+            if encontrado:
+                deuda = self.por_id.get(int(encontrado.group(1)))
+                if deuda is not None:
+                    return self._validar(deuda, linea.valor)
+
+        documento = linea.documento or linea.referencia
+        if not documento:
+            return None, REVISION_SIN_COINCIDENCIA
+
+        exactas = [d for d in self.por_documento_valor.get((documento, centavos(linea.valor)), ())
+                   if d[2] > 0.0001]
+        if len(exactas) == 1:
+            return exactas[0], None
+        if len(exactas) > 1:
+            return None, REVISION_VARIAS
+
+        abiertas = [d for d in self.por_documento.get(documento, ()) if d[2] > 0.0001]
+        if len(abiertas) == 1:
+            return self._validar(abiertas[0], linea.valor)
+        if len(abiertas) > 1:
+            return None, REVISION_VARIAS
+        return None, REVISION_SIN_COINCIDENCIA
+
+    @staticmethod
+    def _validar(deuda, valor):
+        if valor > deuda[2] + 0.0001:
+            return None, REVISION_EXCEDE
+        return deuda, None
+
+    def aplicar(self, deuda, valor):
+        """Descuenta ``valor`` del saldo en memoria y mantiene el índice por valor."""
+        clave = (deuda[3], centavos(deuda[2]))
+        grupo = self.por_documento_valor.get(clave)
+        if grupo and deuda in grupo:
+            grupo.remove(deuda)
+        deuda[2] = max(0.0, deuda[2] - valor)
+        if deuda[2] > 0.0001:
+            self.por_documento_valor.setdefault((deuda[3], centavos(deuda[2])), []).append(deuda)
@@ -0,0 +1,92 @@
+"""Planes de cuotas y recargos por mora.
+
+Una deuda puede dividirse en cuotas con fecha de vencimiento. Los pagos se
+reparten de la cuota más antigua a la más nueva, y el saldo de la deuda es
+siempre la suma de los saldos de sus cuotas.
+
+El proceso nocturno de mora recorre solo las cuotas abiertas vencidas (índice
+parcial por ``vencimiento``) en lotes, y aplica el recargo con sentencias
+``UPDATE`` sobre todo el lote, sin cargar filas en Python.
+"""
+import calendar
+from datetime import timedelta
+
+from sqlalchemy import Float, Numeric, cast, func, or_, select, tuple_
+
+
+def sumar_meses(fecha, meses):
+    """Misma fecha ``meses`` después; el 31 pasa al último día de los meses más cortos."""
+    mes = fecha.month - 1 + meses
+    anio, mes = fecha.year + mes // 12, mes % 12 + 1
+    return fecha.replace(year=anio, month=mes, day=min(fecha.day, calendar.monthrange(anio, mes)[1]))
+
+
+def plan_de_cuotas(monto, numero, primer_vencimiento):
+    """Divide ``monto`` en ``numero`` cuotas mensuales; devuelve ``[(numero, vencimiento, valor)]``.
+
+    El reparto es exacto al centavo: los centavos sobrantes van a las primeras cuotas.
+    """
+    centavos = int(round(monto * 100))
+    base, resto = divmod(centavos, numero)
+    return [(i + 1, sumar_meses(primer_vencimiento, i), (base + (1 if i < resto else 0)) / 100)
+            for i in range(numero)]
+
+
+def repartir(saldos, valor):
+    """Cuánto de ``valor`` se aplica a cada saldo, en orden (de la cuota más antigua a la más nueva)."""
+    restante = int(round(valor * 100))
+    aplicados = []
+    for saldo in saldos:
+        aplicado = min(restante, int(round(saldo * 100)))
+        aplicados.append(aplicado / 100)
+        restante -= aplicado
+    return aplicados
+
+
+def _recargo(cuotas, porcentaje):
+    # redondeo a centavos; en PostgreSQL round(x, 2) solo existe para numeric
+    return cast(func.round(cast(cuotas.c.saldo * (porcentaje / 100.0), Numeric), 2), Float)
+
+
+def aplicar_recargos(conexion, cuotas, deudas, hoy, porcentaje, dias, lote=5000, desde=None):
+    """Aplica el recargo a un lote de cuotas vencidas hace al menos ``dias`` (o con su último recargo así de viejo).
+
+    Recorre el índice ``(vencimiento, id)`` desde ``desde`` (el último par
+    procesado) y devuelve ``(hasta, cuotas, por_deuda, por_sede)``; ``hasta``
+    es None cuando no quedan cuotas. Una cuota recibe a lo sumo un recargo
+    cada ``dias`` días, así que repetir el proceso el mismo día no cobra dos veces.
+    """
+    limite = hoy - timedelta(days=dias)
+    consulta = (select(cuotas.c.id, cuotas.c.vencimiento)
+                .where(cuotas.c.saldo > 0, cuotas.c.vencimiento <= limite,
+                       or_(cuotas.c.ultimo_recargo.is_(None), cuotas.c.ultimo_recargo <= limite))
+                .order_by(cuotas.c.vencimiento, cuotas.c.id)
+                .limit(lote)
+                .with_for_update())
+    if desde is not None:
+        consulta = consulta.where(tuple_(cuotas.c.vencimiento, cuotas.c.id) > tuple_(*desde))
+    filas = conexion.execute(consulta).all()
+    if not filas:
+        return None, 0, {}, {}
+    ids = [fila.id for fila in filas]
+
+    recargo = _recargo(cuotas, porcentaje)
+    del_lote = cuotas.c.id.in_(ids)
+    por_deuda = dict(conexion.execute(select(cuotas.c.deuda_id, func.sum(recargo))
+                                      .where(del_lote).group_by(cuotas.c.deuda_id)).all())
+    por_sede = dict(conexion.execute(select(cuotas.c.sede_id, func.sum(recargo))
+                                     .where(del_lote).group_by(cuotas.c.sede_id)).all())
+
+    # el recargo pasa a ser parte de la deuda: sube el total y el saldo
+    otra = cuotas.alias('c')
+    suma = (select(func.sum(_recargo(otra, porcentaje)))
+            .where(otra.c.deuda_id == deudas.c.id, otra.c.id.in_(ids))
+            .scalar_subquery())
+    conexion.execute(deudas.update()
+                     .where(deudas.c.id.in_(select(cuotas.c.deuda_id).where(del_lote)))
+                     .values(monto_total=deudas.c.monto_total + suma,
+                             saldo_pendiente=deudas.c.saldo_pendiente + suma))
+    conexion.execute(cuotas.update().where(del_lote)
+                     .values(recargo=cuotas.c.recargo + recargo, saldo=cuotas.c.saldo + recargo,
+                             ultimo_recargo=hoy))
+    return (filas[-1].vencimiento, filas[-1].id), len(ids), por_deuda, por_sede
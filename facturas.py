@@ -0,0 +1,276 @@
+"""Generación de facturas PDF a partir de una plantilla precompilada.
+
+La parte fija de la factura (encabezado, datos de la institución, logo,
+etiquetas y recuadros) se dibuja con ReportLab una sola vez por plantilla
+y queda guardada como un PDF completo de una página. Cada factura es ese
+PDF más una *actualización incremental* (PDF 1.3, sección 3.4.5): un
+stream con los campos del pago, la página con ese stream agregado a su
+contenido y una tabla xref nueva. Por pago solo se escriben unos cientos
+de bytes, sin volver a pasar por ReportLab.
+
+El PDF de ReportLab se lee sin un parser completo, así que al construir la
+plantilla se valida su estructura y se relee una factura de ejemplo; si una
+versión de ReportLab la cambia, se lanza ``ErrorPlantilla`` (versión fijada
+en requirements.txt).
+"""
+import re
+from datetime import datetime
+from io import BytesIO
+from types import SimpleNamespace
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+INSTITUCION_DEFAULT = {
+    'nombre': 'Proyecto Educativo',
+    'nit': '',
+    'direccion': '',
+    'telefono': '',
+}
+
+# Coordenadas de la plantilla (puntos PDF, origen abajo a la izquierda)
+_X_ETIQUETA = 50
+_X_VALOR = 190
+_Y_DATOS = 640
+_INTERLINEA = 20
+_Y_ITEMS = 470
+
+_ETIQUETAS = (
+    'Factura ID:',
+    'Fecha:',
+    'Nombre:',
+    'Documento:',
+    'Método de pago:',
+)
+
+_COLUMNAS_ITEMS = (
+    ('Concepto', 50),
+    ('Monto total', 300),
+    ('Abonado', 390),
+    ('Este pago', 470),
+)
+
+
+# datos con los que se relee una factura al construir la plantilla
+_EJEMPLO = (
+    SimpleNamespace(id=1, fecha=datetime(2000, 1, 1), metodo='Efectivo', valor=1.0),
+    SimpleNamespace(concepto='Ejemplo', monto_total=2.0, saldo_pendiente=1.0),
+    SimpleNamespace(nombre='Ejemplo', documento='0'),
+)
+
+
+def _moneda(valor):
+    return f"${valor:,.2f}"
+
+
+def _cadena(texto):
+    """Cadena literal PDF para las fuentes estándar (codificación WinAnsi)."""
+    datos = str(texto).encode('cp1252', 'replace')
+    return b'(' + datos.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class ErrorPlantilla(ValueError):
+    """El PDF de ReportLab no tiene la estructura que la actualización incremental supone."""
+
+
+def _buscar(patron, datos, falta):
+    encontrado = re.search(patron, datos)
+    if encontrado is None:
+        raise ErrorPlantilla(f"PDF de plantilla sin {falta}")
+    return encontrado.group(1)
+
+
+def _leer_xref(pdf, inicio):
+    """``({num_objeto: posición}, trailer)`` de la tabla xref clásica que empieza en ``inicio``."""
+    if not pdf.startswith(b'xref', inicio):
+        # PDF 1.5+ con la xref en un stream comprimido: no se sabe extender
+        raise ErrorPlantilla("PDF de plantilla sin tabla xref clásica")
+    fin = pdf.find(b'trailer', inicio)
+    if fin < 0:
+        raise ErrorPlantilla("PDF de plantilla sin trailer")
+    # subsecciones "primero cantidad" seguidas de entradas "posición generación n|f"
+    tokens = pdf[inicio + 4:fin].split()
+    posiciones = {}
+    i = 0
+    try:
+        while i < len(tokens):
+            primero, cantidad = int(tokens[i]), int(tokens[i + 1])
+            i += 2
+            for numero in range(primero, primero + cantidad):
+                posicion, _, tipo = tokens[i:i + 3]
+                i += 3
+                if tipo == b'n':
+                    posiciones[numero] = int(posicion)
+    except (ValueError, IndexError):
+        raise ErrorPlantilla("Tabla xref ilegible en el PDF de plantilla") from None
+    return posiciones, pdf[fin:]
+
+
+def _objeto(pdf, numero, inicio):
+    """Cuerpo del objeto ``numero`` que según la xref está en ``inicio``."""
+    cabecera = b'%d 0 obj' % numero
+    fin = pdf.find(b'endobj', inicio)
+    if not pdf.startswith(cabecera, inicio) or fin < 0:
+        raise ErrorPlantilla(f"La xref no apunta al objeto {numero}")
+    return pdf[inicio + len(cabecera):fin].strip()
+
+
+def _separar_pdf(pdf):
+    """Datos del PDF de una página que hacen falta para agregarle contenido.
+
+    Devuelve ``(num_pagina, dict_pagina, fuente_normal, size, root, info, startxref)``;
+    lanza ``ErrorPlantilla`` si el PDF no es de una página con xref clásica sin cifrar.
+    """
+    startxref = int(_buscar(rb'startxref\s+(\d+)\s+%%EOF\s*$', pdf, 'startxref'))
+    posiciones, trailer = _leer_xref(pdf, startxref)
+    if b'/Encrypt' in trailer:
+        raise ErrorPlantilla("PDF de plantilla cifrado")
+    size = int(_buscar(rb'/Size (\d+)', trailer, '/Size en el trailer'))
+    root = _buscar(rb'/Root (\d+ \d+ R)', trailer, '/Root en el trailer')
+    info = _buscar(rb'/Info (\d+ \d+ R)', trailer, '/Info en el trailer')
+    paginas = [(numero, cuerpo) for numero, cuerpo in
+               ((numero, _objeto(pdf, numero, inicio)) for numero, inicio in sorted(posiciones.items()))
+               if re.search(rb'/Type /Page\b(?!s)', cuerpo)]
+    if len(paginas) != 1:
+        raise ErrorPlantilla(f"PDF de plantilla con {len(paginas)} páginas (se espera una)")
+    # el canvas de ReportLab siempre registra Helvetica (es su fuente inicial)
+    fuente = _buscar(rb'/BaseFont /Helvetica /Encoding /WinAnsiEncoding /Name (/F\d+)', pdf, 'fuente Helvetica')
+    return paginas[0][0], paginas[0][1], fuente, size, root, info, startxref
+
+
+class PlantillaFactura:
+    """Plantilla reutilizable de factura.
+
+    ``institucion`` es un dict con ``nombre``, ``nit``, ``direccion`` y
+    ``telefono``; ``logo`` es una ruta (o archivo) de imagen opcional que se
+    decodifica una sola vez al construir la plantilla.
+    """
+
+    def __init__(self, institucion=None, logo=None, pagesize=letter):
+        self.institucion = dict(INSTITUCION_DEFAULT)
+        self.institucion.update({k: v for k, v in (institucion or {}).items() if v})
+        self.pagesize = pagesize
+        self.ancho, self.alto = pagesize
+
+        self._logo = None
+        if logo:
+            try:
+                self._logo = ImageReader(logo)
+            except (OSError, IOError):
+                self._logo = None
+
+        # textos fijos ya resueltos para no formatearlos en cada factura
+        nombre = self.institucion['nombre']
+        self._titulo = f"Factura de Pago - {nombre}"
+        self._lineas_institucion = [
+            texto for texto in (
+                f"NIT: {self.institucion['nit']}" if self.institucion['nit'] else '',
+                self.institucion['direccion'],
+                f"Tel: {self.institucion['telefono']}" if self.institucion['telefono'] else '',
+            ) if texto
+        ]
+        self._preparar_pagina()
+
+    # --- parte fija ---
+    def _dibujar_fija(self, c):
+        alto = self.alto
+        if self._logo is not None:
+            c.drawImage(self._logo, 50, alto - 110, width=80, height=80,
+                        preserveAspectRatio=True, mask='auto')
+
+        c.setFont("Helvetica-Bold", 14)
+        c.drawCentredString(self.ancho / 2, alto - 32, self._titulo)
+
+        c.setFont("Helvetica", 9)
+        for i, linea in enumerate(self._lineas_institucion):
+            c.drawRightString(self.ancho - 50, alto - 60 - 12 * i, linea)
+
+        c.setLineWidth(0.5)
+        c.line(50, _Y_DATOS + 30, self.ancho - 50, _Y_DATOS + 30)
+
+        texto = c.beginText(_X_ETIQUETA, _Y_DATOS)
+        texto.setFont("Helvetica-Bold", 11)
+        texto.setLeading(_INTERLINEA)
+        for etiqueta in _ETIQUETAS:
+            texto.textLine(etiqueta)
+        c.drawText(texto)
+
+        # tabla de ítems
+        c.rect(45, _Y_ITEMS - 70, self.ancho - 90, 90, stroke=1, fill=0)
+        c.setFont("Helvetica-Bold", 10)
+        for titulo, x in _COLUMNAS_ITEMS:
+            c.drawString(x, _Y_ITEMS, titulo)
+        c.line(45, _Y_ITEMS - 6, self.ancho - 45, _Y_ITEMS - 6)
+
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(_X_ETIQUETA, _Y_ITEMS - 100, "Saldo pendiente deuda:")
+
+        c.setFont("Helvetica-Oblique", 8)
+        c.drawCentredString(self.ancho / 2, 40, "Documento generado electrónicamente")
+
+    def _preparar_pagina(self):
+        buffer = BytesIO()
+        c = canvas.Canvas(buffer, pagesize=self.pagesize)
+        self._dibujar_fija(c)
+        c.showPage()
+        c.save()
+        self._pdf_fijo = buffer.getvalue()
+        (self._num_pagina, pagina, self._fuente, self._size,
+         self._root, self._info, self._xref_fijo) = _separar_pdf(self._pdf_fijo)
+        # la página actualizada muestra el contenido fijo y después el del pago (objeto ``size``)
+        pagina, reemplazos = re.subn(rb'/Contents (\d+) 0 R', b'/Contents [ \\1 0 R %d 0 R ]' % self._size,
+                                     pagina, count=1)
+        if not reemplazos:
+            raise ErrorPlantilla("Página de plantilla sin un único stream en /Contents")
+        self._obj_pagina = b'%d 0 obj\n%s\nendobj\n' % (self._num_pagina, pagina)
+        self._verificar()
+
+    def _verificar(self):
+        """Relee una factura de ejemplo: la xref nueva debe llevar a la página y al stream agregados."""
+        pdf = self.render(*_EJEMPLO)
+        startxref = int(_buscar(rb'startxref\s+(\d+)\s+%%EOF\s*$', pdf, 'startxref'))
+        posiciones, trailer = _leer_xref(pdf, startxref)
+        if sorted(posiciones) != [self._num_pagina, self._size]:
+            raise ErrorPlantilla("La xref de la factura no cubre la página y el stream nuevos")
+        pagina = _objeto(pdf, self._num_pagina, posiciones[self._num_pagina])
+        _objeto(pdf, self._size, posiciones[self._size])
+        if b'%d 0 R ]' % self._size not in pagina:
+            raise ErrorPlantilla("La página de la factura no incluye el stream del pago")
+        if int(_buscar(rb'/Prev (\d+)', trailer, '/Prev en el trailer')) != self._xref_fijo:
+            raise ErrorPlantilla("El trailer de la factura no enlaza la xref de la plantilla")
+
+    # --- parte variable ---
+    def _contenido_variable(self, pago, deuda, estudiante):
+        """Operadores PDF de los campos del pago (mismas posiciones que las etiquetas fijas)."""
+        fuente = self._fuente
+        lineas = (str(pago.id), pago.fecha.strftime('%Y-%m-%d %H:%M:%S'), estudiante.nombre,
+                  estudiante.documento, pago.metodo)
+        partes = [b'q 0 g BT %s 11 Tf %d TL %d %d Td' % (fuente, _INTERLINEA, _X_VALOR, _Y_DATOS)]
+        for i, linea in enumerate(lineas):
+            partes.append((b'T* ' if i else b'') + _cadena(linea) + b' Tj')
+
+        abonado = max(0.0, deuda.monto_total - deuda.saldo_pendiente - pago.valor)
+        valores = (deuda.concepto[:45], _moneda(deuda.monto_total), _moneda(abonado), _moneda(pago.valor))
+        partes.append(b'%s 10 Tf' % fuente)
+        for (_, x), valor in zip(_COLUMNAS_ITEMS, valores):
+            partes.append(b'1 0 0 1 %d %d Tm %s Tj' % (x, _Y_ITEMS - 24, _cadena(valor)))
+
+        partes.append(b'%s 11 Tf 1 0 0 1 %d %d Tm %s Tj ET Q' % (
+            fuente, _X_VALOR + 30, _Y_ITEMS - 100, _cadena(_moneda(deuda.saldo_pendiente))))
+        return b'\n'.join(partes)
+
+    # --- API pública ---
+    def render(self, pago, deuda, estudiante):
+        """Devuelve los bytes del PDF de una factura."""
+        contenido = self._contenido_variable(pago, deuda, estudiante)
+        nuevo = self._size
+        stream = b'%d 0 obj\n<< /Length %d >>\nstream\n%s\nendstream\nendobj\n' % (nuevo, len(contenido), contenido)
+        pos_pagina = len(self._pdf_fijo)
+        pos_stream = pos_pagina + len(self._obj_pagina)
+        pos_xref = pos_stream + len(stream)
+        xref = b'xref\n0 1\n0000000000 65535 f \n%d 1\n%010d 00000 n \n%d 1\n%010d 00000 n \n' % (
+            self._num_pagina, pos_pagina, nuevo, pos_stream)
+        trailer = b'trailer\n<< /Size %d /Root %s /Info %s /Prev %d >>\nstartxref\n%d\n%%%%EOF\n' % (
+            nuevo + 1, self._root, self._info, self._xref_fijo, pos_xref)
+        return b''.join((self._pdf_fijo, self._obj_pagina, stream, xref, trailer))
@@ -0,0 +1,57 @@
+"""Configuración de gunicorn (se carga sola desde el directorio de la app).
+
+El modelo de workers se elige con GUNICORN_WORKER_CLASS:
+
+- ``gthread`` (por defecto): un proceso por CPU con varios hilos cada uno.
+  Una factura lenta o una llamada a la pasarela ocupa un hilo, no el worker.
+- ``gevent``: pocos procesos con muchas conexiones cooperativas; conviene
+  cuando casi todo el tiempo se espera E/S (pasarela, panel en vivo por SSE).
+  Requiere ``pip install -r requirements-gevent.txt`` (gevent y psycogreen).
+- ``sync``: un request a la vez por proceso (el comportamiento anterior).
+
+Solo con gevent el panel en vivo mantiene abierta su conexión SSE; con
+``gthread`` o ``sync`` la app responde y cierra, y el navegador consulta cada
+KPI_POLL_SECONDS (una conexión abierta ocuparía un hilo o el worker sync
+entero hasta ``timeout``).
+
+WEB_CONCURRENCY, GUNICORN_THREADS y GUNICORN_WORKER_CONNECTIONS sobrescriben
+los valores calculados a partir de la cantidad de CPUs.
+"""
+import multiprocessing
+import os
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    workers = cpus
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+elif worker_class == 'gthread':
+    workers = cpus
+    threads = int(os.environ.get('GUNICORN_THREADS', 2 * cpus + 2))
+else:
+    workers = 2 * cpus + 1
+workers = int(os.environ.get('WEB_CONCURRENCY', workers))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# reciclar workers de a poco acota cualquier fuga de memoria (PDFs, perfiles)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+
+
+def post_fork(server, worker):
+    if worker_class != 'gevent':
+        return
+    # psycopg2 es una extensión en C: sin esto cada consulta bloquearía a todos los greenlets del worker
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        server.log.warning("gevent sin psycogreen: las consultas a PostgreSQL bloquean el worker")
+    else:
+        patch_psycopg()
@@ -0,0 +1,133 @@
+"""Indicadores en vivo para el panel de administración (Server-Sent Events).
+
+Los contadores se mantienen en la base de datos (tabla ``kpi_diario``) en
+el mismo commit que cada pago, matrícula o deuda. Cada proceso tiene un
+único hilo difusor que los lee cada ``intervalo`` segundos —una consulta
+agrupada sobre una tabla de pocas filas— y despierta a todos los paneles
+abiertos si algo cambió. Cien paneles abiertos cuestan lo mismo que uno.
+Sin paneles abiertos el hilo no consulta nada.
+
+Una conexión abierta solo es barata con gevent. Con hilos o workers sync cada
+panel ocuparía un hilo (o el worker entero), así que ahí los paneles consultan
+cada tanto con ``Difusor.consultar`` y reciben el último valor leído.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+CAMPOS = ('pagos', 'recaudado', 'matriculas', 'saldo')
+
+
+def sumar(a, b):
+    return {campo: a.get(campo, 0) + b.get(campo, 0) for campo in CAMPOS}
+
+
+def evento_sse(datos, evento=None, id=None):
+    """Formatea un mensaje ``text/event-stream``."""
+    lineas = []
+    if evento:
+        lineas.append(f"event: {evento}")
+    if id is not None:
+        lineas.append(f"id: {id}")
+    lineas.append(f"data: {json.dumps(datos, separators=(',', ':'))}")
+    return "\n".join(lineas) + "\n\n"
+
+
+class Difusor:
+    """Lee ``leer()`` (dict clave -> valores) en un solo hilo y lo reparte a los oyentes."""
+
+    def __init__(self, leer, intervalo=2.0, vigencia=30.0):
+        self.leer = leer
+        self.intervalo = intervalo
+        self.vigencia = vigencia  # segundos que el hilo sigue leyendo tras la última consulta
+        self._datos = {}  # clave -> (version, valor)
+        self._version = 0
+        self._oyentes = 0
+        self._consultado = float('-inf')
+        self._leido = float('-inf')
+        self._consultas = 0  # consultas esperando una lectura fresca
+        self._cond = threading.Condition()
+        self._hilo = None
+        self._pid = None
+
+    def _iniciar(self):
+        # los workers de gunicorn se crean con fork: el hilo del padre no existe en el hijo
+        if self._hilo is None or not self._hilo.is_alive() or self._pid != os.getpid():
+            self._datos, self._pid = {}, os.getpid()
+            self._hilo = threading.Thread(target=self._ciclo, name='difusor-kpis', daemon=True)
+            self._hilo.start()
+
+    def conectar(self):
+        with self._cond:
+            self._oyentes += 1
+            self._iniciar()
+            self._cond.notify_all()
+
+    def desconectar(self):
+        with self._cond:
+            self._oyentes -= 1
+
+    def consultar(self, clave, timeout=5):
+        """Último ``(version, valor)`` de ``clave`` sin quedar conectado; None si no hay lectura a tiempo.
+
+        Si el hilo estaba detenido, espera su primera lectura para no devolver un valor viejo.
+        """
+        fin = time.monotonic() + timeout
+        with self._cond:
+            self._consultado = time.monotonic()
+            self._iniciar()
+            self._cond.notify_all()
+            self._consultas += 1
+            try:
+                while time.monotonic() - self._leido > 2 * self.intervalo:
+                    restante = fin - time.monotonic()
+                    if restante <= 0:
+                        return None
+                    self._cond.wait(restante)
+            finally:
+                self._consultas -= 1
+            return self._datos.get(clave)
+
+    def _activo(self):
+        return self._oyentes > 0 or time.monotonic() - self._consultado < self.vigencia
+
+    def esperar(self, clave, version=0, timeout=15):
+        """Devuelve ``(version, valor)`` más nuevo que ``version``, o None si pasa ``timeout``."""
+        fin = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                actual = self._datos.get(clave)
+                if actual is not None and actual[0] > version:
+                    return actual
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    return None
+                self._cond.wait(restante)
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                while not self._activo():
+                    self._cond.wait()
+            try:
+                datos = self.leer()
+            except Exception:
+                log.exception("No se pudieron leer los indicadores")
+                datos = {}
+            with self._cond:
+                if datos:
+                    self._leido = time.monotonic()
+                cambio = False
+                for clave, valor in datos.items():
+                    previo = self._datos.get(clave)
+                    if previo is None or previo[1] != valor:
+                        self._version += 1
+                        self._datos[clave] = (self._version, valor)
+                        cambio = True
+                if cambio or (datos and self._consultas):
+                    self._cond.notify_all()
+            time.sleep(self.intervalo)
@@ -0,0 +1,103 @@
+"""Límite de solicitudes por IP y por ruta (token bucket).
+
+El estado vive en un archivo SQLite local compartido por todos los workers
+de gunicorn de la máquina. Cada verificación es una sola sentencia
+``INSERT ... ON CONFLICT DO UPDATE ... RETURNING`` sobre la clave primaria:
+recarga la cubeta según el tiempo transcurrido, descuenta un token si lo hay
+y devuelve el resultado, todo atómico dentro de SQLite.
+
+Si el archivo no se puede usar (disco lleno, bloqueo prolongado) la
+solicitud se deja pasar: el limitador protege a los workers, no debe
+tumbarlos.
+"""
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+_CONSUMIR = """
+INSERT INTO cubeta (clave, tokens, actualizado, permitido)
+VALUES (:clave, :capacidad - 1, :ahora, 1)
+ON CONFLICT(clave) DO UPDATE SET
+    tokens = CASE WHEN min(:capacidad, tokens + (:ahora - actualizado) * :tasa) >= 1
+                  THEN min(:capacidad, tokens + (:ahora - actualizado) * :tasa) - 1
+                  ELSE min(:capacidad, tokens + (:ahora - actualizado) * :tasa) END,
+    permitido = min(:capacidad, tokens + (:ahora - actualizado) * :tasa) >= 1,
+    actualizado = :ahora
+RETURNING tokens, permitido
+"""
+
+
+class Limite:
+    """``capacidad`` solicitudes de golpe, recargando ``por_minuto`` tokens por minuto."""
+
+    def __init__(self, capacidad, por_minuto):
+        self.capacidad = float(capacidad)
+        self.tasa = por_minuto / 60.0
+
+    def __repr__(self):
+        return f"Limite({self.capacidad:g}, {self.tasa * 60:g}/min)"
+
+
+class Limitador:
+    def __init__(self, ruta, limpiar_cada=1000, inactividad=3600):
+        self.ruta = ruta
+        self.limpiar_cada = limpiar_cada
+        self.inactividad = inactividad
+        # conexiones libres, reutilizadas entre requests: sirve igual con hilos
+        # (gthread) que con greenlets (gevent), donde un threading.local abriría
+        # una conexión nueva por request
+        self._libres = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _abrir(self):
+        os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+        conexion = sqlite3.connect(self.ruta, timeout=0.5, isolation_level=None, check_same_thread=False)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=OFF")
+        conexion.execute("CREATE TABLE IF NOT EXISTS cubeta ("
+                         "clave TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                         "actualizado REAL NOT NULL, permitido INTEGER NOT NULL) WITHOUT ROWID")
+        return conexion
+
+    @contextmanager
+    def _conexion(self):
+        with self._lock:
+            if self._pid != os.getpid():  # los workers se crean con fork: no heredar conexiones
+                self._libres, self._pid = [], os.getpid()
+            conexion = self._libres.pop() if self._libres else None
+        if conexion is None:
+            conexion = self._abrir()
+        try:
+            yield conexion
+        except sqlite3.Error:
+            conexion.close()
+            raise
+        with self._lock:
+            self._libres.append(conexion)
+
+    def consumir(self, clave, limite, ahora=None):
+        """Devuelve ``(permitido, segundos_de_espera)``."""
+        ahora = time.time() if ahora is None else ahora
+        try:
+            with self._conexion() as conexion:
+                tokens, permitido = conexion.execute(_CONSUMIR, {
+                    'clave': clave, 'capacidad': limite.capacidad, 'tasa': limite.tasa, 'ahora': ahora,
+                }).fetchone()
+                if self.limpiar_cada and random.randrange(self.limpiar_cada) == 0:
+                    # las cubetas inactivas ya están llenas: borrarlas no cambia nada
+                    conexion.execute("DELETE FROM cubeta WHERE actualizado < ?", (ahora - self.inactividad,))
+        except sqlite3.Error as e:
+            log.warning("Limitador no disponible (%s); se permite la solicitud", e)
+            return True, 0
+        if permitido:
+            return True, 0
+        espera = math.ceil((1 - tokens) / limite.tasa) if limite.tasa else self.inactividad
+        return False, max(1, espera)
@@ -0,0 +1,141 @@
+"""Migraciones de datos por lotes, reanudables (complemento de Alembic).
+
+Las revisiones de Alembic cambian el esquema; reescribir millones de filas
+dentro de ellas (``UPDATE`` de toda la tabla, ``batch_alter_table`` en
+SQLite) bloquea la tabla durante todo el proceso. Para tablas grandes el
+patrón es:
+
+1. Alembic agrega la columna nueva como nullable (rápido).
+2. Una migración de datos en ``migrations/datos/`` la llena por lotes.
+3. Otra revisión de Alembic agrega el NOT NULL / índice, si hace falta.
+
+Cada lote es un rango de ids ``(desde, hasta]`` que se actualiza y se
+registra en la tabla de checkpoints en la misma transacción: si el proceso
+se interrumpe, al volver a ejecutarlo sigue desde el último lote confirmado.
+"""
+import importlib.util
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+ESTADO_EN_CURSO = 'en_curso'
+ESTADO_COMPLETA = 'completa'
+
+
+class MigracionDatos:
+    """Base de una migración de datos.
+
+    Las subclases definen ``nombre`` (único), ``tabla`` (con columna ``id``),
+    opcionalmente ``filtro()`` (qué filas faltan) y ``valores()`` (qué
+    asignarles). Para transformaciones más complejas se sobrescribe
+    ``aplicar(conexion, desde, hasta)``. Debe ser idempotente: un lote puede
+    repetirse si el proceso muere entre el UPDATE y el commit.
+    """
+    nombre = None
+    descripcion = ''
+    tabla = None
+
+    def filtro(self):
+        return None
+
+    def valores(self):
+        raise NotImplementedError
+
+    def condicion(self, desde, hasta=None):
+        condiciones = [self.tabla.c.id > desde]
+        if hasta is not None:
+            condiciones.append(self.tabla.c.id <= hasta)
+        filtro = self.filtro()
+        if filtro is not None:
+            condiciones.append(filtro)
+        return condiciones
+
+    def siguiente_tope(self, conexion, desde, lote):
+        """Id del último de los próximos ``lote`` registros pendientes (o None si no quedan)."""
+        ids = select(self.tabla.c.id).where(*self.condicion(desde)).order_by(self.tabla.c.id).limit(lote).subquery()
+        return conexion.execute(select(func.max(ids.c.id))).scalar()
+
+    def pendientes(self, conexion, desde):
+        return conexion.execute(select(func.count()).select_from(self.tabla).where(*self.condicion(desde))).scalar()
+
+    def aplicar(self, conexion, desde, hasta):
+        resultado = conexion.execute(self.tabla.update().where(*self.condicion(desde, hasta)).values(self.valores()))
+        return resultado.rowcount
+
+
+def cargar(carpeta):
+    """Instancia las migraciones de ``carpeta`` (archivos ``NNNN_*.py``) en orden de archivo."""
+    migraciones = []
+    if not os.path.isdir(carpeta):
+        return migraciones
+    for archivo in sorted(os.listdir(carpeta)):
+        if not archivo.endswith('.py') or not archivo[:1].isdigit():
+            continue
+        spec = importlib.util.spec_from_file_location(f"migracion_datos_{archivo[:-3]}", os.path.join(carpeta, archivo))
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+        migraciones.append(modulo.Migracion())
+    nombres = [m.nombre for m in migraciones]
+    repetidos = {n for n in nombres if nombres.count(n) > 1}
+    if repetidos:
+        raise ValueError(f"Migraciones de datos con nombre repetido: {', '.join(sorted(repetidos))}")
+    return migraciones
+
+
+def leer_checkpoint(conexion, checkpoints, nombre):
+    fila = conexion.execute(checkpoints.select().where(checkpoints.c.nombre == nombre)).mappings().first()
+    return dict(fila) if fila else None
+
+
+def ejecutar(motor, checkpoints, migracion, lote=1000, pausa=0.0, carga=1.0, limite=None, progreso=None):
+    """Ejecuta (o continúa) ``migracion`` por lotes; devuelve el checkpoint final.
+
+    - ``pausa``: segundos fijos de espera entre lotes.
+    - ``carga``: fracción del tiempo dedicada a trabajar (0.5 = espera tanto
+      como tardó el lote), para ceder la base de datos al tráfico normal.
+    - ``limite``: segundos máximos de esta ejecución; al cumplirse se detiene
+      tras el lote en curso y la siguiente ejecución continúa.
+    - ``progreso(checkpoint, hechas_en_esta_ejecucion, pendientes_al_inicio, segundos)``
+      se llama después de cada lote.
+    """
+    inicio = time.monotonic()
+    with motor.begin() as conexion:
+        checkpoint = leer_checkpoint(conexion, checkpoints, migracion.nombre)
+        if checkpoint is None:
+            checkpoint = {'nombre': migracion.nombre, 'ultimo_id': 0, 'filas': 0,
+                          'estado': ESTADO_EN_CURSO, 'iniciada': datetime.utcnow(),
+                          'actualizada': datetime.utcnow(), 'terminada': None}
+            conexion.execute(checkpoints.insert(), checkpoint)
+        if checkpoint['estado'] == ESTADO_COMPLETA:
+            return checkpoint
+        pendientes = migracion.pendientes(conexion, checkpoint['ultimo_id'])
+
+    hechas = 0
+    while True:
+        inicio_lote = time.monotonic()
+        with motor.begin() as conexion:
+            tope = migracion.siguiente_tope(conexion, checkpoint['ultimo_id'], lote)
+            ahora = datetime.utcnow()
+            if tope is None:
+                checkpoint.update(estado=ESTADO_COMPLETA, actualizada=ahora, terminada=ahora)
+            else:
+                filas = migracion.aplicar(conexion, checkpoint['ultimo_id'], tope)
+                hechas += filas
+                checkpoint.update(ultimo_id=tope, filas=checkpoint['filas'] + filas, actualizada=ahora)
+            conexion.execute(checkpoints.update()
+                             .where(checkpoints.c.nombre == migracion.nombre)
+                             .values({k: v for k, v in checkpoint.items() if k not in ('id', 'nombre')}))
+        if progreso:
+            progreso(checkpoint, hechas, pendientes, time.monotonic() - inicio)
+        if checkpoint['estado'] == ESTADO_COMPLETA:
+            return checkpoint
+        if limite is not None and time.monotonic() - inicio >= limite:
+            return checkpoint
+
+        espera = pausa
+        if 0 < carga < 1:
+            espera += (time.monotonic() - inicio_lote) * (1 - carga) / carga
+        if espera:
+            time.sleep(espera)
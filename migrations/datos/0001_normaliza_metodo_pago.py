@@ -0,0 +1,30 @@
+"""Normaliza pago.metodo a los valores que usa la aplicación.
+
+Los pagos registrados a mano guardaban el método tal como venía del
+formulario ('efectivo', ' TRANSFERENCIA', ...), lo que parte los reportes
+por método en varias filas.
+"""
+import sqlalchemy as sa
+
+from migraciones_datos import MigracionDatos
+
+METODOS = ('Efectivo', 'Transferencia', 'Tarjeta', 'En línea')
+
+pago = sa.table('pago', sa.column('id', sa.Integer), sa.column('metodo', sa.String))
+
+
+class Migracion(MigracionDatos):
+    nombre = '0001_normaliza_metodo_pago'
+    descripcion = "Unifica mayúsculas y espacios de pago.metodo"
+    tabla = pago
+
+    def _normalizado(self):
+        limpio = sa.func.lower(sa.func.trim(pago.c.metodo))
+        return sa.case({metodo.lower(): metodo for metodo in METODOS}, value=limpio, else_=pago.c.metodo)
+
+    def filtro(self):
+        # solo las filas que cambian: la migración es idempotente y las ya correctas no se reescriben
+        return pago.c.metodo != self._normalizado()
+
+    def valores(self):
+        return {'metodo': self._normalizado()}
@@ -0,0 +1,31 @@
+"""Completa deuda.fecha en las deudas creadas antes de existir la columna.
+
+Se toma la fecha del primer pago de la deuda (también entre los pagos ya
+archivados) como aproximación; las que no tienen pagos quedan con la fecha de la migración, así que el archivo las
+considera recién creadas y espera el horizonte completo.
+"""
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from migraciones_datos import MigracionDatos
+
+deuda = sa.table('deuda', sa.column('id', sa.Integer), sa.column('fecha', sa.DateTime))
+pago = sa.table('pago', sa.column('deuda_id', sa.Integer), sa.column('fecha', sa.DateTime))
+pago_archivo = sa.table('pago_archivo', sa.column('deuda_id', sa.Integer), sa.column('fecha', sa.DateTime))
+
+
+class Migracion(MigracionDatos):
+    nombre = '0002_fecha_de_deudas'
+    descripcion = "Completa deuda.fecha con el primer pago (o la fecha de hoy)"
+    tabla = deuda
+
+    def filtro(self):
+        return deuda.c.fecha.is_(None)
+
+    def valores(self):
+        primeros = [sa.select(sa.func.min(t.c.fecha)).where(t.c.deuda_id == deuda.c.id).scalar_subquery()
+                    for t in (pago, pago_archivo)]
+        # min(a, b) escalar no es portable (least en PostgreSQL): se elige con un CASE
+        primer_pago = sa.case((primeros[1] < primeros[0], primeros[1]), else_=sa.func.coalesce(primeros[0], primeros[1]))
+        return {'fecha': sa.func.coalesce(primer_pago, datetime.utcnow())}
@@ -0,0 +1,63 @@
+"""Agrega sedes y sede_id en las tablas por sede
+
+Revision ID: a8a8002bdc56
+Revises: 2088cdc11a8a
+Create Date: 2026-10-19 13:21:07.664215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8a8002bdc56'
+down_revision = '2088cdc11a8a'
+branch_labels = None
+depends_on = None
+
+# tabla -> (nombre del índice compuesto, columnas)
+TABLAS_POR_SEDE = {
+    'estudiante': ('ix_estudiante_sede_nombre', ['sede_id', 'nombre']),
+    'curso': ('ix_curso_sede_nombre', ['sede_id', 'nombre']),
+    'matricula': ('ix_matricula_sede_fecha', ['sede_id', 'fecha']),
+    'deuda': ('ix_deuda_sede_id', ['sede_id', 'id']),
+    'pago': ('ix_pago_sede_fecha', ['sede_id', 'fecha']),
+    'deuda_archivo': ('ix_deuda_archivo_sede_id', ['sede_id', 'id']),
+    'pago_archivo': ('ix_pago_archivo_sede_fecha', ['sede_id', 'fecha']),
+}
+
+
+def upgrade():
+    op.create_table('sede',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('nombre')
+    )
+    # todo lo existente pertenece a la sede 1
+    op.execute("INSERT INTO sede (id, nombre) VALUES (1, 'Principal')")
+
+    for tabla, (indice, columnas) in TABLAS_POR_SEDE.items():
+        # con server_default las filas existentes quedan en la sede 1 sin reescribir la tabla
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('sede_id', sa.Integer(), server_default='1', nullable=False))
+            batch_op.create_index(indice, columnas, unique=False)
+            batch_op.create_foreign_key(f'fk_{tabla}_sede', 'sede', ['sede_id'], ['id'])
+
+    with op.batch_alter_table('usuario', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sede_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_usuario_sede', 'sede', ['sede_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('usuario', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_usuario_sede', type_='foreignkey')
+        batch_op.drop_column('sede_id')
+
+    for tabla, (indice, columnas) in reversed(list(TABLAS_POR_SEDE.items())):
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{tabla}_sede', type_='foreignkey')
+            batch_op.drop_index(indice)
+            batch_op.drop_column('sede_id')
+
+    op.drop_table('sede')
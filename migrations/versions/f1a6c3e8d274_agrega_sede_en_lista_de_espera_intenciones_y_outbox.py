@@ -0,0 +1,72 @@
+"""Agrega sede_id en lista de espera, conciliación, intenciones de pago y outbox
+
+Revision ID: f1a6c3e8d274
+Revises: e5c82a4f7b13
+Create Date: 2026-10-19 21:04:33.518960
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a6c3e8d274'
+down_revision = 'e5c82a4f7b13'
+branch_labels = None
+depends_on = None
+
+# tabla -> sede de cada fila existente (la de su padre; 1 si ya no está)
+TABLAS_POR_SEDE = {
+    'lista_espera': "SELECT curso.sede_id FROM curso WHERE curso.id = lista_espera.curso_id",
+    'conciliacion_pendiente': "SELECT min(estudiante.sede_id) FROM estudiante "
+                              "WHERE estudiante.documento = conciliacion_pendiente.documento",
+    'intencion_pago': "SELECT deuda.sede_id FROM deuda WHERE deuda.id = intencion_pago.deuda_id",
+    'intencion_pago_archivo': "SELECT deuda_archivo.sede_id FROM deuda_archivo "
+                              "WHERE deuda_archivo.id = intencion_pago_archivo.deuda_id",
+    'evento_salida': None,  # la sede va en el payload
+}
+
+
+def upgrade():
+    for tabla, origen in TABLAS_POR_SEDE.items():
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('sede_id', sa.Integer(), nullable=True))
+        if origen:
+            op.execute(f"UPDATE {tabla} SET sede_id = coalesce(({origen}), 1)")
+        else:
+            _sede_de_eventos()
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.alter_column('sede_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_foreign_key(f'fk_{tabla}_sede', 'sede', ['sede_id'], ['id'])
+
+
+def _sede_de_eventos(lote=1000):
+    conexion = op.get_bind()
+    eventos = sa.table('evento_salida', sa.column('id', sa.Integer), sa.column('payload', sa.Text),
+                       sa.column('sede_id', sa.Integer))
+    sedes = {fila.id for fila in conexion.execute(sa.text("SELECT id FROM sede"))}
+    ultimo = 0
+    while True:
+        filas = conexion.execute(sa.select(eventos.c.id, eventos.c.payload)
+                                 .where(eventos.c.id > ultimo).order_by(eventos.c.id).limit(lote)).all()
+        if not filas:
+            break
+        por_sede = {}
+        for fila in filas:
+            try:
+                sede_id = json.loads(fila.payload).get('sede_id')
+            except (ValueError, AttributeError):
+                sede_id = None
+            por_sede.setdefault(sede_id if sede_id in sedes else 1, []).append(fila.id)
+        for sede_id, ids in por_sede.items():
+            conexion.execute(eventos.update().where(eventos.c.id.in_(ids)).values(sede_id=sede_id))
+        ultimo = filas[-1].id
+
+
+def downgrade():
+    for tabla in reversed(list(TABLAS_POR_SEDE)):
+        with op.batch_alter_table(tabla, schema=None) as batch_op:
+            batch_op.drop_constraint(f'fk_{tabla}_sede', type_='foreignkey')
+            batch_op.drop_column('sede_id')
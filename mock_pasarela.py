@@ -0,0 +1,125 @@
+"""Pasarela de pagos simulada para pruebas locales.
+
+Implementa lo mínimo que usa ``pasarela.py``: creación de links de pago, una
+página de checkout con botones Aprobar/Rechazar y el envío del webhook
+firmado a la aplicación.
+
+Uso:
+    python mock_pasarela.py --puerto 8089 --webhook http://127.0.0.1:5000/pasarela/webhook
+
+y la aplicación con:
+    PASARELA_URL=http://127.0.0.1:8089/v1
+    PASARELA_CHECKOUT_URL=http://127.0.0.1:8089/l/
+    PASARELA_LLAVE_PRIVADA=prv_test_local
+    PASARELA_SECRETO_EVENTOS=secreto_local
+"""
+import argparse
+import json
+import time
+import uuid
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from pasarela import firmar_evento
+
+PROPIEDADES = ['transaction.id', 'transaction.status', 'transaction.amount_in_cents']
+
+
+class Pasarela:
+    def __init__(self, webhook, secreto, llave, latencia=0.0):
+        self.webhook = webhook
+        self.secreto = secreto
+        self.llave = llave
+        self.latencia = latencia  # segundos de espera simulada al crear un link
+        self.enlaces = {}
+
+    def evento(self, enlace, estado):
+        evento = {
+            'event': 'transaction.updated',
+            'data': {'transaction': {
+                'id': f"tx-{uuid.uuid4().hex[:10]}",
+                'status': estado,
+                'amount_in_cents': enlace['amount_in_cents'],
+                'reference': enlace['sku'],
+                'payment_link_id': enlace['id'],
+            }},
+            'timestamp': int(time.time()),
+            'signature': {'properties': PROPIEDADES},
+        }
+        evento['signature']['checksum'] = firmar_evento(evento, self.secreto)
+        return evento
+
+
+def crear_manejador(pasarela):
+    class Manejador(BaseHTTPRequestHandler):
+        def _json(self, estado, datos):
+            cuerpo = json.dumps(datos).encode()
+            self.send_response(estado)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_POST(self):
+            largo = int(self.headers.get('Content-Length') or 0)
+            cuerpo = self.rfile.read(largo)
+            if self.path.rstrip('/').endswith('/payment_links'):
+                if self.headers.get('Authorization') != f"Bearer {pasarela.llave}":
+                    return self._json(401, {'error': 'llave inválida'})
+                datos = json.loads(cuerpo)
+                if pasarela.latencia:
+                    time.sleep(pasarela.latencia)
+                enlace = dict(datos, id=uuid.uuid4().hex[:12])
+                pasarela.enlaces[enlace['id']] = enlace
+                return self._json(201, {'data': {'id': enlace['id']}})
+
+            partes = self.path.strip('/').split('/')
+            if len(partes) == 3 and partes[0] == 'l' and partes[1] in pasarela.enlaces:
+                enlace = pasarela.enlaces[partes[1]]
+                estado = 'APPROVED' if partes[2] == 'aprobar' else 'DECLINED'
+                requests.post(pasarela.webhook, json=pasarela.evento(enlace, estado), timeout=5)
+                self.send_response(303)
+                self.send_header('Location', enlace.get('redirect_url') or '/')
+                self.end_headers()
+                return
+            self._json(404, {'error': 'no encontrado'})
+
+        def do_GET(self):
+            partes = self.path.strip('/').split('/')
+            if len(partes) == 2 and partes[0] == 'l' and partes[1] in pasarela.enlaces:
+                enlace = pasarela.enlaces[partes[1]]
+                html = (f"<h2>Checkout simulado</h2><p>{escape(enlace.get('description', ''))}</p>"
+                        f"<p>Valor: {enlace['amount_in_cents'] / 100:,.2f} {escape(enlace.get('currency', ''))}</p>"
+                        f"<form method='post' action='/l/{enlace['id']}/aprobar'><button>Aprobar</button></form>"
+                        f"<form method='post' action='/l/{enlace['id']}/rechazar'><button>Rechazar</button></form>")
+                cuerpo = html.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+                return
+            self._json(404, {'error': 'no encontrado'})
+
+    return Manejador
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--puerto', type=int, default=8089)
+    parser.add_argument('--webhook', default='http://127.0.0.1:5000/pasarela/webhook')
+    parser.add_argument('--secreto', default='secreto_local')
+    parser.add_argument('--llave', default='prv_test_local')
+    parser.add_argument('--latencia', type=float, default=0.0, help="segundos de demora al crear un link de pago")
+    args = parser.parse_args()
+
+    pasarela = Pasarela(args.webhook, args.secreto, args.llave, args.latencia)
+    servidor = ThreadingHTTPServer(('127.0.0.1', args.puerto), crear_manejador(pasarela))
+    print(f"Pasarela simulada en http://127.0.0.1:{args.puerto} (webhook -> {args.webhook})")
+    servidor.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Destinos del despachador de eventos (outbox transaccional).
+
+Los eventos se escriben en la tabla ``evento_salida`` dentro de la misma
+transacción que el cambio de negocio; el despachador los lee por lotes en
+orden de id, los entrega a un destino y solo después los marca como
+despachados. Si algo falla entre la entrega y la marca, el lote se vuelve a
+enviar: la entrega es *al menos una vez* y los consumidores deben ignorar
+ids repetidos.
+"""
+import json
+import os
+
+import requests
+
+
+class ErrorDestino(Exception):
+    pass
+
+
+class DestinoHTTP:
+    """POST de ``{"eventos": [...]}`` a una URL; cualquier 2xx confirma el lote."""
+
+    def __init__(self, url, timeout=10, sesion=None):
+        self.url = url
+        self.timeout = timeout
+        self.sesion = sesion or requests.Session()
+
+    def enviar(self, eventos):
+        try:
+            respuesta = self.sesion.post(self.url, json={'eventos': eventos}, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ErrorDestino(str(e)) from e
+        if not 200 <= respuesta.status_code < 300:
+            raise ErrorDestino(f"{self.url} respondió {respuesta.status_code}")
+
+    def __str__(self):
+        return self.url
+
+
+class DestinoJSONL:
+    """Agrega un evento por línea a un archivo JSONL (con fsync por lote)."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def enviar(self, eventos):
+        with open(self.ruta, 'a', encoding='utf-8') as f:
+            for evento in eventos:
+                f.write(json.dumps(evento, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __str__(self):
+        return self.ruta
+
+
+def crear_destino(valor):
+    if valor.startswith(('http://', 'https://')):
+        return DestinoHTTP(valor)
+    return DestinoJSONL(valor)
@@ -0,0 +1,125 @@
+"""Cliente de la pasarela de pagos en línea (API estilo Wompi).
+
+Todas las llamadas salen por una única ``requests.Session`` por proceso, con
+pool de conexiones, timeouts y reintentos con backoff. Crear un link de pago
+no es idempotente (la pasarela no rechaza una ``referencia`` repetida), así que
+el POST solo se reintenta si no se pudo conectar: tras un timeout de lectura o
+un 5xx el link pudo haberse creado y se informa el error en vez de duplicarlo.
+
+Los eventos (webhooks) llegan firmados: ``signature.checksum`` es el SHA256
+de los valores de ``signature.properties`` + ``timestamp`` + el secreto de
+eventos.
+"""
+import hashlib
+import hmac
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+ESTADO_APROBADO = 'APPROVED'
+
+
+class ErrorPasarela(Exception):
+    pass
+
+
+class FirmaInvalida(ErrorPasarela):
+    pass
+
+
+def crear_sesion_http(pool=10, reintentos=3, backoff=0.3):
+    sesion = requests.Session()
+    reintento = Retry(
+        total=reintentos,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # errores de conexión se reintentan en cualquier método; lectura y status, solo en idempotentes
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=reintento)
+    sesion.mount('http://', adaptador)
+    sesion.mount('https://', adaptador)
+    return sesion
+
+
+def _valor(datos, ruta):
+    for parte in ruta.split('.'):
+        datos = (datos or {}).get(parte)
+    return '' if datos is None else str(datos)
+
+
+def firmar_evento(evento, secreto):
+    """Checksum esperado de un evento según sus ``signature.properties``."""
+    propiedades = evento.get('signature', {}).get('properties', [])
+    cadena = ''.join(_valor(evento.get('data', {}), p) for p in propiedades)
+    cadena += str(evento.get('timestamp', '')) + secreto
+    return hashlib.sha256(cadena.encode('utf-8')).hexdigest()
+
+
+class ClientePasarela:
+    def __init__(self, url_base, llave_privada, secreto_eventos, url_checkout,
+                 timeout=(3.05, 10), sesion=None):
+        self.url_base = url_base.rstrip('/')
+        self.llave_privada = llave_privada
+        self.secreto_eventos = secreto_eventos
+        self.url_checkout = url_checkout.rstrip('/') + '/'
+        self.timeout = timeout
+        self.sesion = sesion or crear_sesion_http()
+
+    def crear_intencion(self, referencia, monto_centavos, descripcion, url_retorno=None, moneda='COP'):
+        """Crea un link de pago de un solo uso y devuelve ``(id, url_checkout)``."""
+        cuerpo = {
+            'name': descripcion[:64],
+            'description': descripcion,
+            'single_use': True,
+            'collect_shipping': False,
+            'currency': moneda,
+            'amount_in_cents': monto_centavos,
+            'sku': referencia,
+        }
+        if url_retorno:
+            cuerpo['redirect_url'] = url_retorno
+        try:
+            respuesta = self.sesion.post(
+                f"{self.url_base}/payment_links",
+                json=cuerpo,
+                headers={'Authorization': f"Bearer {self.llave_privada}"},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise ErrorPasarela(f"No se pudo contactar la pasarela: {e}") from e
+        if respuesta.status_code >= 400:
+            raise ErrorPasarela(f"La pasarela respondió {respuesta.status_code}: {respuesta.text[:200]}")
+        enlace_id = respuesta.json()['data']['id']
+        return enlace_id, self.url_checkout + enlace_id
+
+    def verificar_evento(self, cuerpo):
+        """Valida la firma de un webhook y devuelve el evento como dict."""
+        # sin secreto cualquiera podría calcular la firma: no se acepta ningún evento
+        if not self.secreto_eventos:
+            raise FirmaInvalida("Secreto de eventos no configurado")
+        try:
+            evento = json.loads(cuerpo)
+        except ValueError as e:
+            raise FirmaInvalida("Cuerpo JSON inválido") from e
+        recibido = str(evento.get('signature', {}).get('checksum', ''))
+        esperado = firmar_evento(evento, self.secreto_eventos)
+        if not recibido or not hmac.compare_digest(recibido.lower(), esperado):
+            raise FirmaInvalida("Firma del evento inválida")
+        return evento
+
+
+def datos_transaccion(evento):
+    """Extrae ``(transaccion_id, estado, referencia, enlace_id, monto)`` de un evento."""
+    tx = evento.get('data', {}).get('transaction', {}) or {}
+    monto = tx.get('amount_in_cents')
+    return (
+        str(tx.get('id') or ''),
+        tx.get('status') or '',
+        tx.get('reference') or '',
+        tx.get('payment_link_id') or '',
+        (monto / 100.0) if monto is not None else None,
+    )
@@ -0,0 +1,127 @@
+"""Perfilado bajo demanda de un request.
+
+Solo se activa cuando un administrador lo pide explícitamente (cabecera
+``X-Perfilar: 1`` o ``?perfilar=1``); el resto de requests no paga ningún
+costo. Cada perfil se guarda en disco como ``.prof`` (formato ``pstats``,
+abrible con snakeviz o ``python -m pstats``) y un ``.txt`` con el resumen de
+funciones y las sentencias SQL ejecutadas con su duración.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_RE_NOMBRE = re.compile(r'^[\w.-]+$')
+
+
+class SesionPerfil:
+    def __init__(self):
+        self.perfil = cProfile.Profile()
+        self.hilo = threading.get_ident()
+        self.sql = []
+        self.inicio = time.perf_counter()
+        self._pendientes = {}
+
+    # eventos de SQLAlchemy: solo se registran las consultas de este hilo
+    def antes_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.hilo:
+            self._pendientes[id(cursor)] = time.perf_counter()
+
+    def despues_sql(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.hilo:
+            inicio = self._pendientes.pop(id(cursor), None)
+            duracion = time.perf_counter() - inicio if inicio else 0.0
+            self.sql.append((duracion, statement, repr(parameters)[:300]))
+
+
+class Perfilador:
+    """Un solo request perfilado a la vez por proceso (cProfile no admite más)."""
+
+    def __init__(self, carpeta, maximo=50):
+        self.carpeta = carpeta
+        self.maximo = maximo
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            sesion = SesionPerfil()
+            event.listen(Engine, 'before_cursor_execute', sesion.antes_sql)
+            event.listen(Engine, 'after_cursor_execute', sesion.despues_sql)
+            sesion.perfil.enable()
+            return sesion
+        except Exception:
+            self._lock.release()
+            raise
+
+    def detener(self, sesion):
+        try:
+            sesion.perfil.disable()
+            event.remove(Engine, 'before_cursor_execute', sesion.antes_sql)
+            event.remove(Engine, 'after_cursor_execute', sesion.despues_sql)
+        finally:
+            self._lock.release()
+        return time.perf_counter() - sesion.inicio
+
+    def guardar(self, sesion, duracion, metodo, ruta, estado):
+        os.makedirs(self.carpeta, exist_ok=True)
+        slug = re.sub(r'[^\w]+', '_', ruta).strip('_') or 'raiz'
+        nombre = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{metodo}_{slug}"[:120]
+
+        sesion.perfil.dump_stats(os.path.join(self.carpeta, nombre + '.prof'))
+
+        salida = io.StringIO()
+        salida.write(f"{metodo} {ruta} -> {estado} en {duracion * 1000:.1f} ms\n")
+        sql_total = sum(d for d, _, _ in sesion.sql)
+        salida.write(f"SQL: {len(sesion.sql)} sentencias, {sql_total * 1000:.1f} ms\n\n")
+        pstats.Stats(sesion.perfil, stream=salida).sort_stats('cumulative').print_stats(40)
+        salida.write("\n--- Sentencias SQL (en orden de ejecución) ---\n")
+        for i, (d, statement, parametros) in enumerate(sesion.sql, start=1):
+            salida.write(f"\n[{i}] {d * 1000:.2f} ms\n{statement}\n-- {parametros}\n")
+        with open(os.path.join(self.carpeta, nombre + '.txt'), 'w', encoding='utf-8') as f:
+            f.write(salida.getvalue())
+
+        self._rotar()
+        return nombre
+
+    def _rotar(self):
+        perfiles = self.listar()
+        for viejo in perfiles[self.maximo:]:
+            for extension in ('.prof', '.txt'):
+                try:
+                    os.remove(os.path.join(self.carpeta, viejo['nombre'] + extension))
+                except OSError:
+                    pass
+
+    def listar(self):
+        if not os.path.isdir(self.carpeta):
+            return []
+        perfiles = []
+        for archivo in os.listdir(self.carpeta):
+            if not archivo.endswith('.txt'):
+                continue
+            ruta = os.path.join(self.carpeta, archivo)
+            with open(ruta, encoding='utf-8') as f:
+                resumen = f.readline().strip()
+            perfiles.append({
+                'nombre': archivo[:-4],
+                'resumen': resumen,
+                'fecha': datetime.utcfromtimestamp(os.path.getmtime(ruta)),
+            })
+        perfiles.sort(key=lambda p: p['nombre'], reverse=True)
+        return perfiles
+
+    def ruta(self, nombre, extension):
+        """Ruta segura de un perfil guardado, o ``None`` si no existe."""
+        if not _RE_NOMBRE.match(nombre) or extension not in ('.prof', '.txt'):
+            return None
+        ruta = os.path.join(self.carpeta, nombre + extension)
+        return ruta if os.path.isfile(ruta) else None
@@ -0,0 +1,58 @@
+"""Estado de la réplica de lectura.
+
+La verificación de salud/retraso se hace como mucho una vez cada
+``intervalo`` segundos por proceso; entre verificaciones se usa el último
+resultado, así el enrutamiento no agrega consultas a cada request.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+
+def medir_retraso(conexion):
+    """Segundos de retraso de la réplica (0 si no aplica, p. ej. SQLite)."""
+    if conexion.dialect.name == 'postgresql':
+        # al día con lo recibido: 0 aunque el primario lleve rato sin escribir
+        # (now() - último replay crecería sin que falte nada por aplicar)
+        retraso = conexion.execute(text(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+            " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )).scalar()
+        # NULL: no es un standby en recuperación (p. ej. otra instancia local)
+        return float(retraso or 0.0)
+    conexion.execute(text("SELECT 1"))
+    return 0.0
+
+
+class EstadoReplica:
+    def __init__(self, retraso_maximo=5.0, intervalo=2.0):
+        self.retraso_maximo = retraso_maximo
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._disponible = False
+        self._verificado = 0.0
+        self.retraso = None
+
+    def disponible(self, motor):
+        ahora = time.monotonic()
+        if ahora - self._verificado < self.intervalo:
+            return self._disponible
+        with self._lock:
+            if ahora - self._verificado < self.intervalo:
+                return self._disponible
+            try:
+                with motor.connect() as conexion:
+                    self.retraso = medir_retraso(conexion)
+                self._disponible = self.retraso <= self.retraso_maximo
+                if not self._disponible:
+                    logger.warning("Réplica con %.1fs de retraso, se usa la primaria", self.retraso)
+            except Exception:
+                logger.exception("Réplica no disponible, se usa la primaria")
+                self.retraso = None
+                self._disponible = False
+            self._verificado = time.monotonic()
+            return self._disponible
@@ -0,0 +1,327 @@
+"""Respaldos consistentes de la base de datos y su restauración verificada.
+
+- SQLite: API de backup en línea de SQLite, copiando por bloques de páginas
+  para no bloquear a los escritores; la copia se comprime con gzip.
+- Postgres: ``pg_dump --format=custom`` (ya comprimido) leído por stream, con
+  el mismo snapshot exportado en el que se calculan las estadísticas.
+
+Cada respaldo deja junto al archivo un manifiesto ``.json`` con su SHA256, el
+número de filas por tabla y los totales de pagos y deudas en el momento del
+snapshot. Restaurar verifica el checksum antes de tocar nada y, al terminar,
+compara esas estadísticas con las de la base restaurada.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+
+BLOQUE = 1024 * 1024
+
+# columnas sumadas en el manifiesto (solo las de tablas que existan)
+TOTALES = (
+    ('pago', 'valor'),
+    ('deuda', 'monto_total'),
+    ('deuda', 'saldo_pendiente'),
+    ('pago_archivo', 'valor'),
+    ('deuda_archivo', 'monto_total'),
+)
+
+
+class ErrorRespaldo(Exception):
+    pass
+
+
+class _Hasheador:
+    """Archivo de escritura que calcula el SHA256 de lo que pasa por él."""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.sha256 = hashlib.sha256()
+
+    def write(self, datos):
+        self.sha256.update(datos)
+        return self.archivo.write(datos)
+
+    def flush(self):
+        self.archivo.flush()
+
+
+def sha256_archivo(ruta):
+    sha256 = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(BLOQUE), b''):
+            sha256.update(bloque)
+    return sha256.hexdigest()
+
+
+def estadisticas(conexion):
+    """Filas por tabla y totales monetarios, leídos en la transacción de ``conexion``."""
+    tablas = sorted(inspect(conexion).get_table_names())
+    citar = conexion.dialect.identifier_preparer.quote
+    filas = {t: conexion.execute(text(f"SELECT count(*) FROM {citar(t)}")).scalar() for t in tablas}
+    totales = {}
+    for tabla, columna in TOTALES:
+        if tabla in filas:
+            valor = conexion.execute(text(f"SELECT coalesce(sum({citar(columna)}), 0) FROM {citar(tabla)}")).scalar()
+            totales[f"{tabla}.{columna}"] = round(float(valor), 2)
+    return {'filas': filas, 'totales': totales}
+
+
+def comparar(esperadas, obtenidas):
+    """Lista de diferencias entre dos resultados de ``estadisticas`` (vacía si coinciden)."""
+    diferencias = []
+    for clave in ('filas', 'totales'):
+        a, b = esperadas.get(clave, {}), obtenidas.get(clave, {})
+        for nombre in sorted(set(a) | set(b)):
+            if a.get(nombre) != b.get(nombre):
+                diferencias.append(f"{clave} {nombre}: esperado {a.get(nombre)}, obtenido {b.get(nombre)}")
+    return diferencias
+
+
+def _url_pg(url):
+    # pg_dump/pg_restore/psql entienden postgresql://, no postgresql+psycopg2://
+    return make_url(url).set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+def _motor(url):
+    return 'sqlite' if make_url(url).get_backend_name() == 'sqlite' else 'postgres'
+
+
+# --- Respaldo ---
+def respaldar(url, carpeta, paginas=256, pausa=0.005, ahora=None):
+    """Crea un respaldo de ``url`` en ``carpeta`` y devuelve su manifiesto."""
+    ahora = ahora or datetime.now()
+    os.makedirs(carpeta, exist_ok=True)
+    motor = _motor(url)
+    base = f"respaldo-{ahora:%Y%m%dT%H%M%S}"
+    if motor == 'sqlite':
+        archivo, sha256, stats = _respaldar_sqlite(make_url(url).database, carpeta, base, paginas, pausa)
+    else:
+        archivo, sha256, stats = _respaldar_postgres(url, carpeta, base)
+
+    manifiesto = {
+        'archivo': archivo,
+        'motor': motor,
+        'creado': ahora.isoformat(timespec='seconds'),
+        'bytes': os.path.getsize(os.path.join(carpeta, archivo)),
+        'sha256': sha256,
+        **stats,
+    }
+    with open(os.path.join(carpeta, base + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    return manifiesto
+
+
+class _Reinicio(Exception):
+    pass
+
+
+def _copiar_sqlite(ruta_db, copia, paginas, pausa, reinicios=3):
+    """Copia con la API de backup.
+
+    Por bloques, los escritores avanzan entre paso y paso, pero cada escritura
+    de otra conexión reinicia la copia. Con escrituras continuas eso no
+    termina nunca. Por eso, tras ``reinicios`` reinicios se copia en un solo
+    paso. En modo WAL ese paso no bloquea a los escritores; en modo rollback
+    los detiene mientras dura la copia.
+    """
+    origen = sqlite3.connect(ruta_db)
+    try:
+        estado = {'restante': None, 'reinicios': 0}
+
+        def progreso(_status, restante, _total):
+            if estado['restante'] is not None and restante > estado['restante']:
+                estado['reinicios'] += 1
+                if estado['reinicios'] >= reinicios:
+                    raise _Reinicio()
+            estado['restante'] = restante
+
+        destino = sqlite3.connect(copia)
+        try:
+            origen.backup(destino, pages=paginas, progress=progreso, sleep=pausa)
+        except _Reinicio:
+            origen.backup(destino, pages=-1)
+        finally:
+            destino.close()
+    finally:
+        origen.close()
+
+
+def _respaldar_sqlite(ruta_db, carpeta, base, paginas, pausa):
+    if not ruta_db or not os.path.exists(ruta_db):
+        raise ErrorRespaldo(f"No existe la base SQLite {ruta_db!r}")
+    archivo = base + '.sqlite.gz'
+    with tempfile.TemporaryDirectory(dir=carpeta) as tmp:
+        copia = os.path.join(tmp, 'copia.db')
+        _copiar_sqlite(ruta_db, copia, paginas, pausa)
+
+        stats = _estadisticas_url(f"sqlite:///{copia}")
+
+        parcial = os.path.join(carpeta, archivo + '.parcial')
+        with open(copia, 'rb') as entrada, open(parcial, 'wb') as salida:
+            hasheador = _Hasheador(salida)
+            with gzip.GzipFile(filename='', mode='wb', fileobj=hasheador, mtime=0) as comprimido:
+                shutil.copyfileobj(entrada, comprimido, BLOQUE)
+            salida.flush()
+            os.fsync(salida.fileno())
+        os.replace(parcial, os.path.join(carpeta, archivo))
+    return archivo, hasheador.sha256.hexdigest(), stats
+
+
+def _respaldar_postgres(url, carpeta, base):
+    archivo = base + '.pgdump'
+    parcial = os.path.join(carpeta, archivo + '.parcial')
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conexion:
+            # mismo snapshot para pg_dump y para las estadísticas del manifiesto
+            conexion.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"))
+            snapshot = conexion.execute(text("SELECT pg_export_snapshot()")).scalar()
+            stats = estadisticas(conexion)
+            comando = ['pg_dump', '--format=custom', '--no-owner', f'--snapshot={snapshot}',
+                       f'--dbname={_url_pg(url)}']
+            try:
+                proceso = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except FileNotFoundError as e:
+                raise ErrorRespaldo("pg_dump no está instalado") from e
+            with open(parcial, 'wb') as salida:
+                hasheador = _Hasheador(salida)
+                for bloque in iter(lambda: proceso.stdout.read(BLOQUE), b''):
+                    hasheador.write(bloque)
+                salida.flush()
+                os.fsync(salida.fileno())
+            errores = proceso.stderr.read().decode(errors='replace')
+            if proceso.wait() != 0:
+                os.remove(parcial)
+                raise ErrorRespaldo(f"pg_dump falló: {errores.strip()}")
+            conexion.rollback()
+    finally:
+        engine.dispose()
+    os.replace(parcial, os.path.join(carpeta, archivo))
+    return archivo, hasheador.sha256.hexdigest(), stats
+
+
+def _estadisticas_url(url):
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conexion:
+            return estadisticas(conexion)
+    finally:
+        engine.dispose()
+
+
+# --- Rotación ---
+def listar(carpeta):
+    """Manifiestos de los respaldos de ``carpeta``, del más nuevo al más viejo."""
+    if not os.path.isdir(carpeta):
+        return []
+    manifiestos = []
+    for nombre in os.listdir(carpeta):
+        if nombre.startswith('respaldo-') and nombre.endswith('.json'):
+            with open(os.path.join(carpeta, nombre), encoding='utf-8') as f:
+                manifiestos.append(json.load(f))
+    manifiestos.sort(key=lambda m: m['creado'], reverse=True)
+    return manifiestos
+
+
+def rotar(carpeta, diarios=7, semanales=4, mensuales=6):
+    """Conserva el último respaldo de cada uno de los últimos N días, semanas y meses.
+
+    Devuelve los nombres de archivo borrados.
+    """
+    manifiestos = listar(carpeta)
+    conservar = set()
+    for cantidad, periodo in ((diarios, lambda f: f.date()),
+                              (semanales, lambda f: f.isocalendar()[:2]),
+                              (mensuales, lambda f: (f.year, f.month))):
+        vistos = set()
+        for m in manifiestos:  # del más nuevo al más viejo: el primero de cada periodo es el último
+            clave = periodo(datetime.fromisoformat(m['creado']))
+            if clave not in vistos and len(vistos) < cantidad:
+                vistos.add(clave)
+                conservar.add(m['archivo'])
+
+    borrados = []
+    for m in manifiestos:
+        if m['archivo'] in conservar:
+            continue
+        base = m['archivo'].split('.', 1)[0]
+        for nombre in (m['archivo'], base + '.json'):
+            try:
+                os.remove(os.path.join(carpeta, nombre))
+            except OSError:
+                pass
+        borrados.append(m['archivo'])
+    return borrados
+
+
+# --- Restauración ---
+def leer_manifiesto(ruta_respaldo):
+    base = os.path.basename(ruta_respaldo).split('.', 1)[0]
+    ruta = os.path.join(os.path.dirname(ruta_respaldo), base + '.json')
+    if not os.path.exists(ruta):
+        raise ErrorRespaldo(f"Falta el manifiesto {ruta}")
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verificar_checksum(ruta_respaldo, manifiesto):
+    if sha256_archivo(ruta_respaldo) != manifiesto['sha256']:
+        raise ErrorRespaldo(f"Checksum inválido en {ruta_respaldo}: el archivo está dañado o fue modificado")
+
+
+def restaurar(ruta_respaldo, url):
+    """Restaura el respaldo sobre ``url`` y devuelve la lista de diferencias (vacía = OK)."""
+    manifiesto = leer_manifiesto(ruta_respaldo)
+    verificar_checksum(ruta_respaldo, manifiesto)
+    motor = _motor(url)
+    if motor != manifiesto['motor']:
+        raise ErrorRespaldo(f"El respaldo es de {manifiesto['motor']} y el destino es {motor}")
+
+    if motor == 'sqlite':
+        _restaurar_sqlite(ruta_respaldo, make_url(url).database)
+    else:
+        _restaurar_postgres(ruta_respaldo, url)
+    return comparar(manifiesto, _estadisticas_url(url))
+
+
+def _restaurar_sqlite(ruta_respaldo, ruta_db):
+    carpeta = os.path.dirname(os.path.abspath(ruta_db))
+    os.makedirs(carpeta, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=carpeta) as tmp:
+        copia = os.path.join(tmp, 'restaurar.db')
+        with gzip.open(ruta_respaldo, 'rb') as entrada, open(copia, 'wb') as salida:
+            shutil.copyfileobj(entrada, salida, BLOQUE)
+
+        origen = sqlite3.connect(copia)
+        try:
+            resultado = origen.execute("PRAGMA integrity_check").fetchone()[0]
+            if resultado != 'ok':
+                raise ErrorRespaldo(f"El respaldo no pasa integrity_check: {resultado}")
+            # la API de backup reemplaza el contenido respetando los bloqueos de la base destino
+            destino = sqlite3.connect(ruta_db)
+            try:
+                origen.backup(destino)
+            finally:
+                destino.close()
+        finally:
+            origen.close()
+
+
+def _restaurar_postgres(ruta_respaldo, url):
+    comando = ['pg_restore', '--clean', '--if-exists', '--no-owner', '--single-transaction',
+               f'--dbname={_url_pg(url)}', ruta_respaldo]
+    try:
+        resultado = subprocess.run(comando, capture_output=True)
+    except FileNotFoundError as e:
+        raise ErrorRespaldo("pg_restore no está instalado") from e
+    if resultado.returncode != 0:
+        raise ErrorRespaldo(f"pg_restore falló: {resultado.stderr.decode(errors='replace').strip()}")